@@ -1,10 +1,10 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, send_file
 from flask_cors import CORS
 import os
 import sys
 from datetime import datetime
 import logging
-import json
+import time
 
 # Add the services directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'services'))
@@ -22,6 +22,27 @@ logger.info("Starting Flask application initialization...")
 try:
     from fire_service import get_fires_data
     from satellite_service import get_modis_data, get_viirs_data
+    import snapshot_store
+    import published_snapshots
+    from fire_query import QueryError, query_fires
+    import geometry_lod
+    from geometry_lod import level_from_args, lod_geometry
+    from async_upstream import fetch_feeds, fetch_feeds_sync
+    import vector_tiles
+    import history_store
+    import fire_changes
+    import hotspot_grid
+    import fire_activity
+    import hotspot_merge
+    import prediction_store
+    import warm_cache
+    import circuit_breaker
+    import arcgis_pager
+    from json_stream import collection_response
+    from utils.profiling import (
+        current_trace, detach_trace, finish_trace, is_enabled as profiling_enabled, recent_slow_traces, stage,
+        start_trace
+    )
     logger.info("Successfully imported all services")
 except ImportError as e:
     logger.error(f"Error importing services: {e}")
@@ -36,6 +57,29 @@ logger.info("Flask app initialized")
 CORS(app)
 logger.info("CORS enabled")
 
+@app.before_request
+def start_request_trace():
+    """Start a profiling trace for this request when profiling is enabled"""
+    if profiling_enabled():
+        start_trace(f"{request.method} {request.path}")
+
+@app.after_request
+def defer_streamed_trace(response):
+    """Keep a streamed response's trace open until its body has been sent (see timed_iter)"""
+    if response.is_streamed and current_trace() is not None:
+        trace = detach_trace()
+        response.call_on_close(lambda: log_trace(finish_trace(trace)))
+    return response
+
+@app.teardown_request
+def finish_request_trace(exc=None):
+    """Finish this request's profiling trace and log slow ones"""
+    log_trace(finish_trace())
+
+def log_trace(trace):
+    if trace and trace['files']:
+        logger.info(f"Profiled {trace['name']} in {trace['wallMs']} ms -> {trace['files'][0]}")
+
 # Simple test route
 @app.route('/test')
 def test():
@@ -49,19 +93,309 @@ def test():
 
 
 # Cache for fire data to avoid too many API calls
+# ('fetched_at' is when the data left ArcGIS; 'source' is 'upstream' or 'warm')
 fire_data_cache = {
     'data': None,
     'timestamp': None,
+    'fetched_at': None,
+    'source': None,
     'cache_duration': 300  # 5 minutes in seconds
 }
 
 # Cache for satellite data
 satellite_data_cache = {
-    'modis': {'data': None, 'timestamp': None},
-    'viirs': {'data': None, 'timestamp': None},
+    'modis': {'data': None, 'timestamp': None, 'fetched_at': None, 'source': None},
+    'viirs': {'data': None, 'timestamp': None, 'fetched_at': None, 'source': None},
     'cache_duration': 300  # 5 minutes in seconds
 }
 
+def live_cache(name):
+    return fire_data_cache if name == 'fires' else satellite_data_cache[name]
+
+def store_live_data(name, data):
+    """Cache freshly fetched data in this process and persist it for the next boot"""
+    now = datetime.now().timestamp()
+    live_cache(name).update(data=data, timestamp=now, fetched_at=now, source='upstream')
+    warm_cache.save(name, data, now)
+    if name == 'fires':
+        geometry_lod.prepare(data)
+    if name in ('modis', 'viirs'):
+        prepare_hotspot_grid()
+
+def prepare_hotspot_grid():
+    """Build the live-mode hotspot grid for the cached feeds in the background, once both are in"""
+    modis, viirs = satellite_data_cache['modis']['data'], satellite_data_cache['viirs']['data']
+    if modis is not None and viirs is not None:
+        hotspot_grid.prepare(modis, viirs)
+
+def rehydrate_live_caches():
+    """Load the last good copies persisted by store_live_data, before the first request"""
+    for name in ('fires', 'modis', 'viirs'):
+        stored = warm_cache.load(name)
+        if not stored:
+            continue
+        # Valid from its original fetch time, so the normal expiry applies (see load_live_data)
+        live_cache(name).update(data=stored['payload'], timestamp=stored['fetchedAt'],
+                                fetched_at=stored['fetchedAt'], source='warm')
+        logger.info(f"Rehydrated {name} from {warm_cache.WARM_DIR} "
+                    f"({stored['ageSeconds'] / 60:.0f} min old{', expired' if stored['expired'] else ''})")
+    geometry_lod.prepare(fire_data_cache['data'])
+    prepare_hotspot_grid()
+
+def live_cache_status():
+    """Age and origin of each live-mode cache entry"""
+    now = datetime.now().timestamp()
+    status = {}
+    for name in ('fires', 'modis', 'viirs'):
+        cache = live_cache(name)
+        status[name] = {
+            'source': cache['source'],
+            'fetchedAt': datetime.fromtimestamp(cache['fetched_at']).isoformat(),
+            'ageSeconds': round(now - cache['fetched_at'], 1),
+            'valid': is_cache_valid(cache['timestamp'])
+        } if cache['data'] is not None else None
+    return status
+
+# Serving mode:
+#   live     - each process keeps its own caches above and fetches on a miss (default, dev)
+#   shared   - one refresher publishes snapshots to disk and every worker serves them
+#              (production, see gunicorn.conf.py)
+#   snapshot - like shared, but the snapshots are the generator's published files,
+#              hot-reloaded on change; ArcGIS is never called by the API
+SERVING_MODE = os.environ.get('FLAMEFLUX_SERVING_MODE', 'live')
+SNAPSHOT_MODES = ('shared', 'snapshot')
+
+# Dataset name -> (fetcher, key of the item list indexed for per-item reads)
+if SERVING_MODE == 'snapshot':
+    SNAPSHOT_SOURCES = {
+        name: (lambda name=name: published_snapshots.load_published(name), items_key)
+        for name, items_key in (('fires', 'fires'), ('modis', None), ('viirs', None))
+    }
+else:
+    SNAPSHOT_SOURCES = {
+        'fires': (get_fires_data, 'fires'),
+        'modis': (get_modis_data, None),
+        'viirs': (get_viirs_data, None),
+    }
+
+@snapshot_store.on_publish
+def publish_hotspot_grid(name, payload, meta):
+    """Write the hotspot grid for a new MODIS or VIIRS version (see hotspot_grid)"""
+    if name not in ('modis', 'viirs'):
+        return
+    other_name = 'viirs' if name == 'modis' else 'modis'
+    other = snapshot_store.open_snapshot(other_name)
+    if other is None:
+        return  # written by the other feed's first publish
+    feeds = {name: payload, other_name: other.data()}
+    versions = {name: meta['version'], other_name: other.version}
+    hotspot_grid.save_pyramids(
+        hotspot_grid.pyramid_path(snapshot_store.SNAPSHOT_DIR, versions['modis'], versions['viirs']),
+        hotspot_grid.build_pyramids(feeds['modis'], feeds['viirs'])
+    )
+
+def load_grid_pyramids():
+    """Hotspot grid pyramids for the current MODIS and VIIRS data"""
+    if SERVING_MODE in SNAPSHOT_MODES:
+        modis, viirs = get_snapshot('modis'), get_snapshot('viirs')
+        pyramids = hotspot_grid.load_pyramids(
+            hotspot_grid.pyramid_path(snapshot_store.SNAPSHOT_DIR, modis.version, viirs.version)
+        )
+        if pyramids is not None:
+            return pyramids
+        return hotspot_grid.pyramids_for(modis.data(), viirs.data())
+    return hotspot_grid.pyramids_for(load_live_data('modis'), load_live_data('viirs'))
+
+if SERVING_MODE == 'shared':
+    snapshot_store.start_refresher(SNAPSHOT_SOURCES, fetch_many=fetch_feeds_sync)
+    logger.info(f"Shared snapshot mode, snapshots in {snapshot_store.SNAPSHOT_DIR}")
+elif SERVING_MODE == 'snapshot':
+    published_snapshots.start_watcher({name: items_key for name, (_, items_key) in SNAPSHOT_SOURCES.items()})
+    logger.info(f"Published snapshot mode, watching {published_snapshots.PUBLISHED_DIR}")
+else:
+    rehydrate_live_caches()
+
+# Live-mode budget for one upstream call made on behalf of a request: with an
+# older copy to fall back on a request waits at most REQUEST_DEADLINE seconds,
+# with nothing cached yet it waits up to COLD_DEADLINE
+REQUEST_DEADLINE = float(os.environ.get('FLAMEFLUX_REQUEST_DEADLINE', 8))
+COLD_DEADLINE = float(os.environ.get('FLAMEFLUX_COLD_DEADLINE', 35))
+
+# One breaker per upstream feed; live-mode fetches go through upstream_feeds
+breakers = {name: circuit_breaker.CircuitBreaker(name) for name in ('fires', 'modis', 'viirs')}
+upstream_feeds = {
+    name: circuit_breaker.GuardedFetch(breakers[name], fetcher,
+                                       on_success=lambda data, name=name: store_live_data(name, data))
+    for name, (fetcher, _) in SNAPSHOT_SOURCES.items()
+}
+
+def load_live_data(name):
+    """Live-mode data for a feed: the cache, a fresh fetch within the deadline, or the last good copy marked stale"""
+    cache = live_cache(name)
+    if cache['data'] is not None and is_cache_valid(cache['timestamp']):
+        return cache['data']
+
+    # An expired copy from before this boot, younger than the warm cache's MAX_AGE: serve it
+    # right away, marked stale, and refresh in the background instead of waiting on ArcGIS
+    if cache['source'] == 'warm' and datetime.now().timestamp() - cache['fetched_at'] <= warm_cache.MAX_AGE:
+        try:
+            upstream_feeds[name].start()
+            reason = 'warm start, refreshing'
+        except circuit_breaker.UpstreamUnavailable as e:
+            reason = e.reason
+        return mark_stale(name, cache, reason)
+
+    deadline = REQUEST_DEADLINE if cache['data'] is not None else COLD_DEADLINE
+    try:
+        with stage(f'upstream {name}'):
+            return upstream_feeds[name](deadline)
+    except circuit_breaker.UpstreamUnavailable as e:
+        if cache['data'] is None:
+            raise
+        logger.warning(f"Serving stale {name} data: {e.reason}")
+        return mark_stale(name, cache, e.reason)
+
+def mark_stale(name, cache, reason):
+    """Record that this request is served an old copy of a feed (see stale_marked) and return it"""
+    g.setdefault('stale_feeds', {})[name] = {
+        'fetchedAt': datetime.fromtimestamp(cache['fetched_at']).isoformat(),
+        'ageSeconds': round(datetime.now().timestamp() - cache['fetched_at'], 1),
+        'reason': reason
+    }
+    return cache['data']
+
+def stale_marked(name, data):
+    """A dataset body, flagged stale when this request fell back to an old copy of it"""
+    stale = g.get('stale_feeds', {}).get(name)
+    if not stale:
+        return data
+    return {**data, 'stale': True, 'fetchedAt': stale['fetchedAt'], 'ageSeconds': stale['ageSeconds'],
+            'staleReason': stale['reason']}
+
+FEED_LABELS = {'fires': 'Fire', 'modis': 'MODIS', 'viirs': 'VIIRS'}
+
+@app.errorhandler(circuit_breaker.UpstreamUnavailable)
+def upstream_unavailable_response(error):
+    """503 for a feed that is down with nothing cached to fall back on, whichever route needed it
+
+    Routes that catch Exception re-raise UpstreamUnavailable so it ends up here.
+    """
+    name, label = error.name, FEED_LABELS.get(error.name, error.name)
+    logger.error(f"{label} data unavailable: {error}")
+    response = jsonify({
+        'error': f'{label} data unavailable',
+        'message': str(error),
+        'breaker': breakers[name].status(),
+        'timestamp': datetime.now().isoformat()
+    })
+    response.status_code = 503
+    retry_in = breakers[name].status()['retryInSeconds']
+    response.headers['Retry-After'] = str(int(retry_in or REQUEST_DEADLINE) + 1)
+    return response
+
+@app.after_request
+def mark_stale_response(response):
+    """Tell clients (and caches) when a response was built from stale upstream data"""
+    stale = g.get('stale_feeds')
+    if stale:
+        response.headers['Warning'] = '110 - "Response is Stale"'
+        response.headers['X-Stale-Feeds'] = ','.join(sorted(stale))
+    return response
+
+def get_snapshot(name):
+    """Current shared snapshot for a dataset, publishing it first on a cold start"""
+    fetcher, items_key = SNAPSHOT_SOURCES[name]
+    return snapshot_store.get_or_publish(name, fetcher, items_key=items_key)
+
+def snapshot_response(name):
+    """Serve a shared snapshot straight from its file (sendfile under gunicorn)"""
+    snapshot = get_snapshot(name)
+    response = send_file(snapshot.path, mimetype='application/json', etag=snapshot.etag, max_age=0)
+    response.headers['X-Snapshot-Version'] = str(snapshot.version)
+    return response
+
+def load_fire_data():
+    """Current fire data dict, from the shared snapshot or the in-process cache"""
+    if SERVING_MODE in SNAPSHOT_MODES:
+        fire_data = get_snapshot('fires').data()
+        geometry_lod.prepare(fire_data)  # this worker's LOD levels for a new version, in the background
+        return fire_data
+
+    return load_live_data('fires')
+
+def load_satellite_data(name):
+    """Current MODIS or VIIRS data dict, from the shared snapshot or the in-process cache"""
+    if SERVING_MODE in SNAPSHOT_MODES:
+        return get_snapshot(name).data()
+
+    return load_live_data(name)
+
+# Published forecast GeoJSON, one file per fire (see frontend/src/services/predictionsApi.js)
+PREDICTIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'public', 'data', 'predictions'))
+predictions = prediction_store.PredictionStore(PREDICTIONS_DIR)
+
+def sync_tile_layer(layer):
+    """Point a vector-tile layer at the current data (a no-op if unchanged)"""
+    tiles = vector_tiles.LAYERS[layer]
+    if layer == 'fires':
+        fire_data = load_fire_data()
+        tiles.sync(fire_data, vector_tiles.fire_features(fire_data))
+    elif layer in ('modis', 'viirs'):
+        satellite_data = load_satellite_data(layer)
+        tiles.sync(satellite_data, vector_tiles.hotspot_features(satellite_data))
+    else:
+        index_path = os.path.join(PREDICTIONS_DIR, 'index.json')
+        version = os.stat(index_path).st_mtime_ns if os.path.exists(index_path) else None
+        if version != tiles.source:
+            tiles.sync(version, vector_tiles.prediction_features(PREDICTIONS_DIR))
+    return tiles
+
+def observe_fire_version():
+    """Register the current fire data with the change log and return its version"""
+    if SERVING_MODE in SNAPSHOT_MODES:
+        snapshot = get_snapshot('fires')
+        return fire_changes.observe(snapshot.data(), snapshot.version)
+    return fire_changes.observe(load_fire_data())
+
+def current_fire_changes(since):
+    """Delta from fire-data version `since` to the current one (see fire_changes)"""
+    observe_fire_version()
+    return fire_changes.changes_since(since)
+
+def dataset_versions():
+    """Current version and summary counts of every dataset, for the event stream"""
+    versions = {}
+    if SERVING_MODE in SNAPSHOT_MODES:
+        for name in SNAPSHOT_SOURCES:
+            meta = snapshot_store.current_meta(name)
+            if meta:
+                versions[name] = {'version': meta['version'], 'total': meta['total'], 'publishedAt': meta['publishedAt']}
+    else:
+        # Live mode never fetches on its own; report whatever this process has cached
+        if fire_data_cache['data'] is not None:
+            versions['fires'] = {
+                'version': fire_changes.observe(fire_data_cache['data']),
+                'total': fire_data_cache['data'].get('total', 0),
+                'publishedAt': fire_data_cache['data'].get('timestamp')
+            }
+        for name in ('modis', 'viirs'):
+            cache = satellite_data_cache[name]
+            if cache['data'] is not None:
+                versions[name] = {
+                    'version': int(cache['timestamp'] * 1000),
+                    'total': cache['data'].get('total', 0),
+                    'publishedAt': cache['data'].get('timestamp')
+                }
+
+    index = predictions.index()
+    if index is not None:
+        versions['predictions'] = {
+            'version': predictions.version() // 1000000,
+            'total': len(index.get('fires', [])),
+            'publishedAt': index.get('generatedAt')
+        }
+    return versions
+
 def is_cache_valid(cache_timestamp):
     """Check if the cached data is still valid"""
     if not cache_timestamp:
@@ -88,13 +422,40 @@ def index():
         'timestamp': datetime.now().isoformat()
     })
 
+def breaker_status():
+    return {name: breaker.status() for name, breaker in breakers.items()}
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint for monitoring"""
+    if SERVING_MODE in SNAPSHOT_MODES:
+        snapshots = {}
+        for name in SNAPSHOT_SOURCES:
+            snapshot = snapshot_store.open_snapshot(name)
+            snapshots[name] = {
+                'version': snapshot.version,
+                'publishedAt': snapshot.published_at,
+                'ageSeconds': round(snapshot.age_seconds(), 1),
+                'parsed': snapshot.parsed  # this worker holds a decoded copy (see snapshot_store)
+            } if snapshot else None
+        return jsonify({
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'serving_mode': SERVING_MODE,
+            'pid': os.getpid(),
+            'snapshots': snapshots,
+            'upstream': arcgis_pager.reports()
+        })
+
+    breaker_states = breaker_status()
     return jsonify({
-        'status': 'healthy',
+        'status': 'degraded' if any(b['state'] != circuit_breaker.CLOSED for b in breaker_states.values()) else 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'cache_status': 'valid' if is_cache_valid(fire_data_cache['timestamp']) else 'expired'
+        'serving_mode': SERVING_MODE,
+        'cache_status': 'valid' if is_cache_valid(fire_data_cache['timestamp']) else 'expired',
+        'caches': live_cache_status(),
+        'breakers': breaker_states,
+        'upstream': arcgis_pager.reports()
     })
 
 @app.route('/api/fires', methods=['GET'])
@@ -103,22 +464,30 @@ def get_fires():
     try:
         logger.info("Received request for fire data")
         
-        # Check if we have valid cached data
-        if is_cache_valid(fire_data_cache['timestamp']):
-            logger.info("Returning cached fire data")
-            return jsonify(fire_data_cache['data'])
+        # Projection / filter / pagination queries (see fire_query)
+        if request.args:
+            try:
+                result = query_fires(load_fire_data(), request.args)
+            except QueryError as e:
+                return jsonify({
+                    'error': 'Invalid query',
+                    'message': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
+            with stage('jsonify'):
+                return collection_response(result, 'fires')
         
-        # Fetch fresh data
-        logger.info("Fetching fresh fire data from external API")
-        fire_data = get_fires_data()
+        if SERVING_MODE in SNAPSHOT_MODES:
+            return snapshot_response('fires')
         
-        # Update cache
-        fire_data_cache['data'] = fire_data
-        fire_data_cache['timestamp'] = datetime.now().timestamp()
-        
-        logger.info(f"Successfully fetched {fire_data.get('total', 0)} fires")
-        return jsonify(fire_data)
+        # Cached, fetched within the request deadline, or the last good copy flagged stale
+        fire_data = load_live_data('fires')
+        logger.info(f"Returning {fire_data.get('total', 0)} fires")
+        with stage('jsonify'):
+            return collection_response(stale_marked('fires', fire_data), 'fires')
         
+    except circuit_breaker.UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error fetching fire data: {str(e)}")
         return jsonify({
@@ -133,22 +502,17 @@ def get_modis():
     try:
         logger.info("Received request for MODIS data")
         
-        # Check if we have valid cached data
-        if is_satellite_cache_valid('modis'):
-            logger.info("Returning cached MODIS data")
-            return jsonify(satellite_data_cache['modis']['data'])
-        
-        # Fetch fresh data
-        logger.info("Fetching fresh MODIS data from external API")
-        modis_data = get_modis_data()
-        
-        # Update cache
-        satellite_data_cache['modis']['data'] = modis_data
-        satellite_data_cache['modis']['timestamp'] = datetime.now().timestamp()
+        if SERVING_MODE in SNAPSHOT_MODES:
+            return snapshot_response('modis')
         
-        logger.info(f"Successfully fetched {modis_data.get('total', 0)} MODIS hotspots")
-        return jsonify(modis_data)
+        # Cached, fetched within the request deadline, or the last good copy flagged stale
+        modis_data = load_live_data('modis')
+        logger.info(f"Returning {modis_data.get('total', 0)} MODIS hotspots")
+        with stage('jsonify'):
+            return collection_response(stale_marked('modis', modis_data), 'hotspots')
         
+    except circuit_breaker.UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error fetching MODIS data: {str(e)}")
         return jsonify({
@@ -163,22 +527,17 @@ def get_viirs():
     try:
         logger.info("Received request for VIIRS data")
         
-        # Check if we have valid cached data
-        if is_satellite_cache_valid('viirs'):
-            logger.info("Returning cached VIIRS data")
-            return jsonify(satellite_data_cache['viirs']['data'])
-        
-        # Fetch fresh data
-        logger.info("Fetching fresh VIIRS data from external API")
-        viirs_data = get_viirs_data()
-        
-        # Update cache
-        satellite_data_cache['viirs']['data'] = viirs_data
-        satellite_data_cache['viirs']['timestamp'] = datetime.now().timestamp()
+        if SERVING_MODE in SNAPSHOT_MODES:
+            return snapshot_response('viirs')
         
-        logger.info(f"Successfully fetched {viirs_data.get('total', 0)} VIIRS hotspots")
-        return jsonify(viirs_data)
+        # Cached, fetched within the request deadline, or the last good copy flagged stale
+        viirs_data = load_live_data('viirs')
+        logger.info(f"Returning {viirs_data.get('total', 0)} VIIRS hotspots")
+        with stage('jsonify'):
+            return collection_response(stale_marked('viirs', viirs_data), 'hotspots')
         
+    except circuit_breaker.UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error fetching VIIRS data: {str(e)}")
         return jsonify({
@@ -187,19 +546,98 @@ def get_viirs():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/hotspots', methods=['GET'])
+def get_hotspots():
+    """Get MODIS and VIIRS hotspots merged into one deduplicated feed (see hotspot_merge)"""
+    try:
+        with stage('merge_hotspots'):
+            merged = hotspot_merge.merged_hotspots(load_satellite_data('modis'), load_satellite_data('viirs'))
+        
+        with stage('jsonify'):
+            return collection_response({
+                'hotspots': merged['hotspots'],
+                'total': len(merged['hotspots']),
+                'source': 'MODIS+VIIRS',
+                'stats': merged['stats'],
+                'timestamp': datetime.now().isoformat()
+            }, 'hotspots')
+        
+    except circuit_breaker.UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error merging hotspot feeds: {str(e)}")
+        return jsonify({
+            'error': 'Failed to fetch hotspot data',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/hotspots/grid', methods=['GET'])
+def get_hotspot_grid():
+    """Get aggregated hotspot cells for a map zoom and bbox (see hotspot_grid)"""
+    try:
+        try:
+            zoom, bbox, source = hotspot_grid.parse_grid_query(request.args)
+        except ValueError as e:
+            return jsonify({
+                'error': 'Invalid query',
+                'message': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        pyramids = load_grid_pyramids()
+        with stage('grid_cells'):
+            grid = hotspot_grid.grid_cells(pyramids, zoom, bbox, source)
+        
+        with stage('jsonify'):
+            return jsonify({
+                'zoom': zoom,
+                'level': grid['level'],
+                'source': source,
+                'cells': grid['cells'],
+                'count': len(grid['cells']),
+                'truncated': grid['truncated'],
+                'timestamp': datetime.now().isoformat()
+            })
+        
+    except circuit_breaker.UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error building hotspot grid: {str(e)}")
+        return jsonify({
+            'error': 'Failed to build hotspot grid',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
 @app.route('/api/fires/<fire_id>', methods=['GET'])
 def get_fire_details(fire_id):
     """Get details for a specific fire"""
     try:
         logger.info(f"Received request for fire details: {fire_id}")
         
+        try:
+            lod = level_from_args(request.args)
+        except ValueError as e:
+            return jsonify({
+                'error': 'Invalid query',
+                'message': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        if SERVING_MODE in SNAPSHOT_MODES and lod is None:
+            # Slice the fire's bytes out of the mapped snapshot, no parse needed
+            fire_json = get_snapshot('fires').item(fire_id)
+            if fire_json is None:
+                return jsonify({
+                    'error': 'Fire not found',
+                    'fire_id': fire_id,
+                    'timestamp': datetime.now().isoformat()
+                }), 404
+            return Response(fire_json, mimetype='application/json')
+        
         # Get current fire data
-        if is_cache_valid(fire_data_cache['timestamp']):
-            fire_data = fire_data_cache['data']
-        else:
-            fire_data = get_fires_data()
-            fire_data_cache['data'] = fire_data
-            fire_data_cache['timestamp'] = datetime.now().timestamp()
+        fire_data = load_fire_data()
         
         # Find the specific fire
         fires = fire_data.get('fires', [])
@@ -212,9 +650,14 @@ def get_fire_details(fire_id):
                 'timestamp': datetime.now().isoformat()
             }), 404
         
+        if lod is not None:
+            fire = dict(fire, geometry=lod_geometry(fire_data, fire, lod))
+        
         logger.info(f"Successfully found fire: {fire.get('name', 'Unknown')}")
         return jsonify(fire)
         
+    except circuit_breaker.UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error fetching fire details: {str(e)}")
         return jsonify({
@@ -223,22 +666,169 @@ def get_fire_details(fire_id):
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/fires/changes', methods=['GET'])
+def get_fire_changes():
+    """Get fires added, updated or removed since ?since=<version> (see fire_changes)"""
+    try:
+        changes = current_fire_changes(request.args.get('since'))
+        with stage('jsonify'):
+            return jsonify(changes)
+        
+    except circuit_breaker.UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching fire changes: {str(e)}")
+        return jsonify({
+            'error': 'Failed to fetch fire changes',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/stream', methods=['GET'])
+def get_stream_unavailable():
+    """/api/stream is served by asgi.py; reached only when running plain WSGI"""
+    return jsonify({
+        'error': 'Stream unavailable',
+        'message': 'GET /api/stream needs the ASGI server (asgi:application, the gunicorn.conf.py default); '
+                   'poll /api/fires/changes instead',
+        'timestamp': datetime.now().isoformat()
+    }), 501
+
+@app.route('/api/fires/activity', methods=['GET'])
+def get_fire_activity():
+    """Get MODIS/VIIRS hotspot activity inside each fire perimeter (see fire_activity)"""
+    try:
+        with stage('spatial_join'):
+            result = fire_activity.activity_for(
+                load_fire_data(), load_satellite_data('modis'), load_satellite_data('viirs')
+            )
+        return jsonify({
+            'activity': result['fires'],
+            'matchedHotspots': result['matched'],
+            'unmatchedHotspots': result['unmatched'],
+            'joinMs': result['joinMs'],
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except circuit_breaker.UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error joining hotspots to fires: {str(e)}")
+        return jsonify({
+            'error': 'Failed to compute fire activity',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/fires/<fire_id>/history', methods=['GET'])
+def get_fire_history(fire_id):
+    """Get stored perimeter versions for a fire's incident (?from=&to=&geometry=none)"""
+    try:
+        try:
+            start, end = history_store.parse_range(request.args)
+        except ValueError as e:
+            return jsonify({
+                'error': 'Invalid query',
+                'message': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        history = history_store.fire_history(fire_id, start, end,
+                                             include_geometry=request.args.get('geometry') != 'none')
+        if history is None:
+            return jsonify({
+                'error': 'Fire not found',
+                'fire_id': fire_id,
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        
+        return jsonify({
+            'fireId': fire_id,
+            'incident': history['incident'],
+            'versions': history['versions'],
+            'count': len(history['versions']),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching fire history: {str(e)}")
+        return jsonify({
+            'error': 'Failed to fetch fire history',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/hotspots/history', methods=['GET'])
+def get_hotspot_history():
+    """Get stored hotspots in a bbox and time range (?bbox=&from=&to=&source=)"""
+    try:
+        try:
+            bbox = history_store.parse_bbox(request.args.get('bbox'))
+            start, end = history_store.parse_range(request.args)
+        except ValueError as e:
+            return jsonify({
+                'error': 'Invalid query',
+                'message': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        hotspots = history_store.hotspot_history(bbox, start, end, source=request.args.get('source'))
+        return jsonify({
+            'hotspots': hotspots,
+            'count': len(hotspots),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching hotspot history: {str(e)}")
+        return jsonify({
+            'error': 'Failed to fetch hotspot history',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+def record_refresh(name, result, latency):
+    """Count a forced refresh's outcome in the feed's circuit breaker (live mode only)"""
+    if SERVING_MODE in SNAPSHOT_MODES:
+        return  # the breakers guard live-mode fetches; snapshot refreshes don't go through them
+    failed = isinstance(result, BaseException)
+    breakers[name].record(not failed, latency, (str(result) or type(result).__name__) if failed else None,
+                          claimed=False)
+
 @app.route('/api/fires/refresh', methods=['POST'])
-def refresh_fire_data():
+async def refresh_fire_data():
     """Force refresh of fire data cache"""
     try:
         logger.info("Received request to refresh fire data cache")
         
-        # Clear cache
-        fire_data_cache['data'] = None
-        fire_data_cache['timestamp'] = None
+        if SERVING_MODE == 'snapshot':
+            # Reload the generator's file; snapshot mode never calls upstream
+            meta = published_snapshots.publish_from_file('fires', items_key='fires')
+            return jsonify({
+                'message': 'Fire data reloaded from published snapshot',
+                'total': meta['total'],
+                'version': meta['version'],
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        # Non-blocking fetch with a strict deadline (see async_upstream)
+        started = time.monotonic()
+        fire_data = (await fetch_feeds(['fires']))['fires']
+        record_refresh('fires', fire_data, time.monotonic() - started)
+        if isinstance(fire_data, BaseException):
+            raise fire_data
         
-        # Fetch fresh data
-        fire_data = get_fires_data()
+        if SERVING_MODE == 'shared':
+            meta = snapshot_store.refresh('fires', lambda: fire_data, items_key='fires')
+            return jsonify({
+                'message': 'Fire data refreshed successfully',
+                'total': meta['total'],
+                'version': meta['version'],
+                'timestamp': datetime.now().isoformat()
+            })
         
         # Update cache
-        fire_data_cache['data'] = fire_data
-        fire_data_cache['timestamp'] = datetime.now().timestamp()
+        store_live_data('fires', fire_data)
         
         logger.info(f"Successfully refreshed fire data: {fire_data.get('total', 0)} fires")
         return jsonify({
@@ -256,34 +846,49 @@ def refresh_fire_data():
         }), 500
 
 @app.route('/api/satellite/refresh', methods=['POST'])
-def refresh_satellite_data():
+async def refresh_satellite_data():
     """Force refresh of satellite data cache"""
     try:
         logger.info("Received request to refresh satellite data cache")
         
-        # Clear caches
-        satellite_data_cache['modis']['data'] = None
-        satellite_data_cache['modis']['timestamp'] = None
-        satellite_data_cache['viirs']['data'] = None
-        satellite_data_cache['viirs']['timestamp'] = None
+        if SERVING_MODE == 'snapshot':
+            modis_meta = published_snapshots.publish_from_file('modis')
+            viirs_meta = published_snapshots.publish_from_file('viirs')
+            return jsonify({
+                'message': 'Satellite data reloaded from published snapshots',
+                'modis_total': modis_meta['total'],
+                'viirs_total': viirs_meta['total'],
+                'modis_version': modis_meta['version'],
+                'viirs_version': viirs_meta['version'],
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        # Fetch MODIS and VIIRS concurrently; a feed that fails or times out
+        # keeps its previous cache entry while the other one still updates
+        started = time.monotonic()
+        results = await fetch_feeds(['modis', 'viirs'])
+        for name, result in results.items():
+            record_refresh(name, result, time.monotonic() - started)
+        errors = {name: str(result) or type(result).__name__
+                  for name, result in results.items() if isinstance(result, BaseException)}
         
-        # Fetch fresh data
-        modis_data = get_modis_data()
-        viirs_data = get_viirs_data()
+        response = {'message': 'Satellite data refreshed successfully'}
+        for name, data in results.items():
+            if name in errors:
+                continue
+            if SERVING_MODE == 'shared':
+                meta = snapshot_store.refresh(name, lambda: data)
+                response[f'{name}_version'] = meta['version']
+            else:
+                store_live_data(name, data)
+            response[f'{name}_total'] = data.get('total', 0)
         
-        # Update caches
-        satellite_data_cache['modis']['data'] = modis_data
-        satellite_data_cache['modis']['timestamp'] = datetime.now().timestamp()
-        satellite_data_cache['viirs']['data'] = viirs_data
-        satellite_data_cache['viirs']['timestamp'] = datetime.now().timestamp()
+        if errors:
+            raise RuntimeError('; '.join(f'{name}: {error}' for name, error in errors.items()))
         
-        logger.info(f"Successfully refreshed satellite data: {modis_data.get('total', 0)} MODIS, {viirs_data.get('total', 0)} VIIRS")
-        return jsonify({
-            'message': 'Satellite data refreshed successfully',
-            'modis_total': modis_data.get('total', 0),
-            'viirs_total': viirs_data.get('total', 0),
-            'timestamp': datetime.now().isoformat()
-        })
+        logger.info(f"Successfully refreshed satellite data: {response['modis_total']} MODIS, {response['viirs_total']} VIIRS")
+        response['timestamp'] = datetime.now().isoformat()
+        return jsonify(response)
         
     except Exception as e:
         logger.error(f"Error refreshing satellite data: {str(e)}")
@@ -295,52 +900,38 @@ def refresh_satellite_data():
 
 @app.route('/api/prediction/<fire_id>', methods=['GET'])
 def get_fire_prediction(fire_id):
-    """Get prediction for a specific fire (mock implementation)"""
+    """Published forecast summary for a fire, by name, IRWIN id or OBJECTID"""
     try:
         logger.info(f"Received request for fire prediction: {fire_id}")
-        
-        # Get current fire data to validate fire_id
-        if is_cache_valid(fire_data_cache['timestamp']):
-            fire_data = fire_data_cache['data']
-        else:
-            fire_data = get_fires_data()
-            fire_data_cache['data'] = fire_data
-            fire_data_cache['timestamp'] = datetime.now().timestamp()
-        
-        # Find the specific fire
-        fires = fire_data.get('fires', [])
-        fire = next((f for f in fires if str(f.get('id')) == str(fire_id)), None)
-        
-        if not fire:
+
+        with stage('resolve'):
+            entry, matched_by = predictions.resolve(fire_id, lambda: load_fire_data().get('fires', []))
+        if not entry:
             return jsonify({
-                'error': 'Fire not found',
+                'error': 'No published prediction for this fire',
                 'fire_id': fire_id,
                 'timestamp': datetime.now().isoformat()
             }), 404
-        
-        # Mock prediction data (replace with actual ML model in production)
-        import random
-        current_size = fire.get('size', 0)
+
+        with stage('summarize'):
+            summary = predictions.summary(entry)
         prediction = {
             'fireId': fire_id,
-            'fireName': fire.get('name', 'Unknown'),
-            'currentSize': current_size,
-            'predictionDate': datetime.now().isoformat(),
-            'estimatedSize': current_size * (1.2 + random.random() * 0.8),
-            'confidence': random.randint(75, 95),
-            'riskLevel': random.choice(['High', 'Critical', 'Medium']),
-            'growthRate': random.uniform(0.1, 0.5),
-            'factors': {
-                'weather': random.choice(['Favorable', 'Unfavorable', 'Critical']),
-                'terrain': random.choice(['Flat', 'Hilly', 'Mountainous']),
-                'vegetation': random.choice(['Sparse', 'Moderate', 'Dense']),
-                'humidity': random.randint(10, 80)
-            }
+            'fireName': entry.get('name'),
+            'matchedBy': matched_by,
+            'forecast': {key: value for key, value in entry.items() if key != 'summary'},
+            'summary': summary,
+            'timestamp': datetime.now().isoformat()
         }
-        
-        logger.info(f"Successfully generated prediction for fire: {fire.get('name', 'Unknown')}")
+        if request.args.get('geometry', '').lower() in ('1', 'true'):
+            with stage('load_geojson'):
+                prediction['geojson'] = predictions.load(entry)
+
+        logger.info(f"Returning prediction for fire: {entry.get('name')} (matched by {matched_by})")
         return jsonify(prediction)
-        
+
+    except circuit_breaker.UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error generating fire prediction: {str(e)}")
         return jsonify({
@@ -354,23 +945,54 @@ def get_perimeter_predictions():
     """Serve perimeter predictions GeoJSON"""
     try:
         file_path = os.path.join(os.path.dirname(__file__), 'services', 'perimeter_predictions.json')
-        logger.info(f"Loading perimeter predictions from: {file_path}")
-        with open(file_path) as f:
-            data = json.load(f)
-        logger.info(f"Loaded data keys: {list(data.keys())}")
-        logger.info(f"Type field: {data.get('type')}")
-        logger.info(f"Number of features: {len(data.get('features', []))}")
-        
-        # Set proper headers
-        response = jsonify(data)
-        response.headers['Content-Type'] = 'application/json'
-        return response
+        logger.info(f"Serving perimeter predictions from: {file_path}")
+        # Already a GeoJSON document on disk: send its bytes (sendfile under
+        # gunicorn) instead of parsing it and encoding it again per request
+        return send_file(file_path, mimetype='application/json', max_age=0)
     except Exception as e:
         logger.error(f"Failed to load perimeter predictions: {e}")
         return jsonify({'error': f'Failed to load perimeter predictions: {e}'}), 500
 
 
 
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.pbf', methods=['GET'])
+def get_vector_tile(layer, z, x, y):
+    """Serve a Mapbox Vector Tile for fires, modis, viirs or predictions"""
+    try:
+        if layer not in vector_tiles.LAYERS or z > vector_tiles.MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return jsonify({
+                'error': 'Tile not found',
+                'message': f'No tile {layer}/{z}/{x}/{y}',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        
+        tiles = sync_tile_layer(layer)
+        with stage('render_tile'):
+            tile = tiles.render(z, x, y)
+        
+        response = Response(tile, status=200 if tile else 204, mimetype=vector_tiles.CONTENT_TYPE)
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
+        
+    except circuit_breaker.UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Error rendering tile {layer}/{z}/{x}/{y}: {str(e)}")
+        return jsonify({
+            'error': 'Failed to render tile',
+            'message': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/debug/traces', methods=['GET'])
+def get_slow_traces():
+    """List recent slow profiling traces (only populated when profiling is enabled)"""
+    return jsonify({
+        'profiling': profiling_enabled(),
+        'traces': recent_slow_traces(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -390,7 +1012,8 @@ def internal_error(error):
         'timestamp': datetime.now().isoformat()
     }), 500
 
-# Production configuration - must be at the end after all routes are defined
+# Development server - must be at the end after all routes are defined.
+# Production runs multi-worker gunicorn instead: gunicorn -c gunicorn.conf.py (asgi:application)
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
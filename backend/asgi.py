@@ -0,0 +1,55 @@
+"""
+ASGI entry point, used by default by gunicorn -c gunicorn.conf.py,
+or directly: uvicorn asgi:application
+
+Runs the Flask app behind an ASGI server so a single process can keep many
+slow upstream refreshes (the async views built on async_upstream) in flight
+without tying up the threads that serve API traffic.
+
+Flask requests run on a pool of WSGI_THREADS threads. asgiref's stock
+WsgiToAsgi runs every request through a thread-sensitive sync_to_async, i.e.
+on one shared thread per worker, so a single slow refresh or query stalled all
+API traffic in that worker; ThreadedWsgiToAsgi hands each request to the pool
+instead.
+
+/api/stream (Server-Sent Events, see services/event_stream.py) is handled
+natively here rather than through Flask: each open stream is a coroutine on
+the worker's event loop, not a WSGI thread held for the life of the client.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import app, current_fire_changes, dataset_versions
+from event_stream import Broadcaster, serve_stream
+
+WSGI_THREADS = int(os.environ.get('FLAMEFLUX_WSGI_THREADS', 8))
+
+_wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # The stock run_wsgi_app is a thread-sensitive sync_to_async; rewrap its function for the pool
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+                                 thread_sensitive=False, executor=_wsgi_executor)
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that serves concurrent requests on a thread pool."""
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+flask_application = ThreadedWsgiToAsgi(app)
+broadcaster = Broadcaster(dataset_versions, load_delta=current_fire_changes)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == '/api/stream' and scope['method'] == 'GET':
+        await serve_stream(broadcaster, scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
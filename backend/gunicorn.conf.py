@@ -0,0 +1,42 @@
+"""
+Production server config: gunicorn -c gunicorn.conf.py
+
+Every worker imports app.py on its own (no preload), starts the snapshot
+refresher thread, and only the one that wins refresher.lock talks to ArcGIS.
+The rest serve the shared snapshot files, so upstream traffic and memory stay
+flat as WEB_CONCURRENCY grows.
+
+Workers are uvicorn workers running asgi:application: each drives its
+upstream calls on an event loop, runs Flask requests on a pool of
+FLAMEFLUX_WSGI_THREADS threads, and serves /api/stream (Server-Sent Events),
+which needs an ASGI server. FLAMEFLUX_ASGI=0 falls back to threaded WSGI
+workers (GUNICORN_THREADS each) running app:app, where /api/stream answers
+501 and clients have to poll.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+if os.environ.get('FLAMEFLUX_ASGI', '1') == '1':
+    wsgi_app = 'asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+    worker_class = 'gthread'
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Snapshot bodies are served with sendfile straight from the page cache.
+sendfile = True
+preload_app = False
+
+raw_env = [f"FLAMEFLUX_SERVING_MODE={os.environ.get('FLAMEFLUX_SERVING_MODE', 'shared')}"]
+
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,37 @@
+"""
+fireCast model helpers (see notes.txt for the original training script).
+
+TensorFlow is only imported when a model is actually loaded, so importing
+this module (and models.patches) stays cheap for the API processes.
+"""
+
+import os
+
+import numpy as np
+
+from models.patches import BATCH_SIZE, PatchExtractor, predict_points
+
+MODELS_DIR = os.environ.get('FLAMEFLUX_MODELS_DIR', os.path.join(os.path.dirname(__file__), 'weights'))
+
+
+def load_model(weights_name):
+    """Load models/<weights_name>.h5 (or an absolute path) with Keras."""
+    import tensorflow as tf
+
+    path = weights_name if os.path.isabs(weights_name) else os.path.join(MODELS_DIR, weights_name + '.h5')
+    return tf.keras.models.load_model(path)
+
+
+def predict_fire(model, stack, weather, points, radius, batch_size=BATCH_SIZE):
+    """Batched replacement for fireCastPredict.
+
+    `stack` is the (H, W, C) layer stack in the model's channel order,
+    `weather` the weather input vector (or one row per point) and `points`
+    the (row, col) pixels to predict. Returns ({point: prediction}, predictions).
+    """
+    points = list(points)
+    extractor = PatchExtractor(stack, radius)
+    rows = np.fromiter((p[0] for p in points), dtype=np.intp, count=len(points))
+    cols = np.fromiter((p[1] for p in points), dtype=np.intp, count=len(points))
+    results = predict_points(model.predict_on_batch, extractor, rows, cols, weather, batch_size)
+    return dict(zip(points, results.tolist())), results
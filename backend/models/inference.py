@@ -0,0 +1,315 @@
+"""
+Resident fireCast inference worker with micro-batching across fires.
+
+Prediction runs used to be one-shot scripts that reloaded the .h5 weights
+(and paid graph warm-up) for every fire. An InferenceWorker loads the model
+once in its own thread and serves per-fire jobs from a local queue:
+
+    worker = InferenceWorker(weights='20240801-120000mod')
+    future = worker.submit(stack, weather, rows, cols, radius)
+    predictions = future.result()          # (N,) float32, in point order
+    worker.stats()                         # patchesPerSecond, latencyMs, ...
+
+Patches from all queued jobs share each model call. The worker fills a batch
+of up to `max_batch` patches FIFO across jobs; if the batch is still partial
+it waits at most `max_delay` seconds (FLAMEFLUX_INFER_DELAY_MS) for more jobs
+before running it, so small fires ride along with big ones instead of each
+paying a mostly-empty batch.
+
+Jobs are checked when submitted: points inside the stack, and a weather
+width and patch shape (kernel, channels) matching the first job's (or the
+ones the worker was built with), so one malformed fire can't break a shared
+batch. If a batch still fails, its jobs are rerun one at a time and only the
+job that fails on its own is failed.
+
+From the command line, over .npz jobs with `stack`, `weather`, `rows`, `cols`
+(and optionally `radius`) arrays; predictions are written next to each job.
+At most --max-inflight jobs (each holding its padded stack) are loaded at a
+time:
+
+    python -m models.inference --weights 20240801-120000mod --radius 30 fires/*.npz
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from models.patches import BATCH_SIZE, PatchExtractor, weather_batch
+
+MAX_DELAY = float(os.environ.get('FLAMEFLUX_INFER_DELAY_MS', 20)) / 1000
+MAX_INFLIGHT = int(os.environ.get('FLAMEFLUX_INFER_MAX_INFLIGHT', 8))
+LATENCY_WINDOW = 256  # jobs kept for latency percentiles
+
+
+class _Job:
+    def __init__(self, extractor, rows, cols, weather, name):
+        self.extractor = extractor
+        self.rows = np.asarray(rows)
+        self.cols = np.asarray(cols)
+        self.weather = weather
+        self.name = name
+        self.results = np.empty(len(self.rows), dtype=np.float32)
+        self.next = 0  # first point not yet batched
+        self.done = 0  # points with predictions
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+    @property
+    def remaining(self):
+        return len(self.rows) - self.next
+
+
+class InferenceWorker:
+    """Single model-owning thread; `submit` is safe to call from any thread."""
+
+    def __init__(self, predict=None, weights=None, max_batch=BATCH_SIZE, max_delay=MAX_DELAY,
+                 weather_width=None, patch_shape=None):
+        if (predict is None) == (weights is None):
+            raise ValueError('Pass exactly one of predict or weights')
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._predict = predict
+        self._weights = weights
+        # (weather width, (kernel, channels)) every job must match; the first job's unless given
+        self._signature = (weather_width, tuple(patch_shape) if patch_shape else None)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {'jobs': 0, 'failed': 0, 'patches': 0, 'batches': 0, 'isolated': 0, 'busy': 0.0,
+                       'loadMs': None}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._thread = threading.Thread(target=self._run, name='firecast-inference', daemon=True)
+        self._thread.start()
+
+    def submit(self, stack, weather, rows, cols, radius, name=None):
+        """Queue one fire; returns a Future resolving to its (N,) predictions."""
+        return self.submit_extractor(PatchExtractor(stack, radius), weather, rows, cols, name)
+
+    def submit_extractor(self, extractor, weather, rows, cols, name=None):
+        """Queue one fire with a prebuilt PatchExtractor; raises ValueError on malformed inputs."""
+        job = _Job(extractor, rows, cols, weather, name)
+        self._check(job)
+        if not job.remaining:
+            job.future.set_result(job.results)
+            return job.future
+        self._queue.put(job)
+        return job.future
+
+    def _check(self, job):
+        label = job.name or 'job'
+        if job.rows.ndim != 1 or job.rows.shape != job.cols.shape:
+            raise ValueError(f'{label}: rows and cols must be 1-D arrays of the same length')
+        if job.remaining:
+            height, width = job.extractor.shape
+            if job.rows.min() < 0 or job.cols.min() < 0 or job.rows.max() >= height or job.cols.max() >= width:
+                raise ValueError(f'{label}: points outside the {height}x{width} stack')
+        weather = np.asarray(job.weather)
+        if weather.ndim not in (1, 2) or (weather.ndim == 2 and len(weather) != len(job.rows)):
+            raise ValueError(f'{label}: weather must be one vector or one row per point, got {weather.shape}')
+        job.weather = weather
+        weather_width = weather.shape[-1]
+        patch_shape = (job.extractor.kernel, job.extractor.channels)
+        with self._lock:
+            expected_width, expected_patch = self._signature
+            if expected_width is not None and weather_width != expected_width:
+                raise ValueError(f'{label}: weather width {weather_width}, expected {expected_width}')
+            if expected_patch is not None and patch_shape != expected_patch:
+                raise ValueError(f'{label}: patches of kernel {patch_shape[0]} x {patch_shape[1]} channels, '
+                                 f'expected {expected_patch[0]} x {expected_patch[1]}')
+            self._signature = (weather_width, patch_shape)
+
+    def close(self, wait=True):
+        """Finish queued jobs, then stop the worker thread."""
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = np.array(self._latencies) if self._latencies else None
+        stats['queued'] = self._queue.qsize()
+        stats['meanBatch'] = round(stats['patches'] / stats['batches'], 1) if stats['batches'] else 0
+        stats['patchesPerSecond'] = round(stats['patches'] / stats['busy'], 1) if stats['busy'] else 0
+        stats['busy'] = round(stats['busy'], 3)
+        stats['latencyMs'] = None if latencies is None else {
+            'p50': round(float(np.percentile(latencies, 50)) * 1000, 1),
+            'p95': round(float(np.percentile(latencies, 95)) * 1000, 1),
+            'max': round(float(latencies.max()) * 1000, 1),
+        }
+        return stats
+
+    def _load(self):
+        if self._predict is None:
+            from models.firecast import load_model
+
+            started = time.perf_counter()
+            model = load_model(self._weights)
+            self._predict = model.predict_on_batch
+            with self._lock:
+                self._stats['loadMs'] = round((time.perf_counter() - started) * 1000, 1)
+            print(f"fireCast model {self._weights} loaded in {self._stats['loadMs']} ms")
+        return self._predict
+
+    def _run(self):
+        try:
+            predict = self._load()
+        except Exception as e:
+            print(f"fireCast model failed to load: {e}")
+            self._fail_queued(e)
+            return
+
+        active = deque()
+        stopping = False
+        while not (stopping and not active):
+            if not active:
+                job = self._queue.get()
+                if job is None:
+                    break
+                active.append(job)
+
+            # Top the batch up with whatever arrives within the latency budget
+            deadline = time.perf_counter() + self.max_delay
+            while not stopping and sum(job.remaining for job in active) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    job = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                else:
+                    active.append(job)
+
+            self._run_batch(predict, active)
+            while active and active[0].next >= len(active[0].rows) and active[0].future.done():
+                active.popleft()
+
+    def _run_batch(self, predict, active):
+        segments = []  # (job, start, stop)
+        size = 0
+        for job in active:
+            if size >= self.max_batch:
+                break
+            take = min(job.remaining, self.max_batch - size)
+            if take:
+                segments.append((job, job.next, job.next + take))
+                job.next += take
+                size += take
+
+        started = time.perf_counter()
+        try:
+            outputs = [(segments, self._predict_segments(predict, segments))]
+        except Exception as e:
+            if len(segments) == 1:
+                self._fail(segments[0][0], e)
+                return
+            # Rerun each job's segment alone so only the job that breaks the batch fails
+            outputs = []
+            for segment in segments:
+                try:
+                    outputs.append(([segment], self._predict_segments(predict, [segment])))
+                except Exception as job_error:
+                    self._fail(segment[0], job_error)
+            with self._lock:
+                self._stats['isolated'] += 1
+        finished = time.perf_counter()
+        elapsed = finished - started
+
+        latencies = []
+        patches = 0
+        for done_segments, output in outputs:
+            offset = 0
+            for job, a, b in done_segments:
+                job.results[a:b] = output[offset:offset + b - a]
+                offset += b - a
+                job.done += b - a
+                patches += b - a
+                if job.done == len(job.rows):
+                    job.future.set_result(job.results)
+                    latencies.append(finished - job.submitted)
+        with self._lock:
+            self._latencies.extend(latencies)
+            self._stats['jobs'] += len(latencies)
+            self._stats['patches'] += patches
+            self._stats['batches'] += 1
+            self._stats['busy'] += elapsed
+
+    def _predict_segments(self, predict, segments):
+        patches = np.concatenate([job.extractor.patches(job.rows[a:b], job.cols[a:b]) for job, a, b in segments])
+        weather = np.concatenate([weather_batch(job.weather, a, b) for job, a, b in segments])
+        output = np.asarray(predict([weather, patches])).reshape(-1)
+        if len(output) != len(patches):
+            raise ValueError(f'model returned {len(output)} predictions for {len(patches)} patches')
+        return output
+
+    def _fail(self, job, error):
+        job.next = len(job.rows)
+        if not job.future.done():
+            job.future.set_exception(error)
+            with self._lock:
+                self._stats['failed'] += 1
+
+    def _fail_queued(self, error):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job.future.set_exception(error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run fireCast predictions for many fires with one resident model.')
+    parser.add_argument('jobs', nargs='+', help='.npz files with stack, weather, rows, cols')
+    parser.add_argument('--weights', required=True, help='Weights name under models/weights, or a path')
+    parser.add_argument('--radius', type=int, default=None, help='AOI radius, unless stored in each job')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-inflight', type=int, default=MAX_INFLIGHT,
+                        help='Jobs loaded (padded stack in memory) at once')
+    args = parser.parse_args()
+
+    worker = InferenceWorker(weights=args.weights, max_batch=args.batch_size)
+    started = time.perf_counter()
+    inflight = deque()  # (path, future), oldest first
+    for path in args.jobs:
+        if len(inflight) >= max(args.max_inflight, 1):
+            _save_predictions(*inflight.popleft())
+        # Read the arrays out and close the file: a long run would otherwise hold one descriptor per job
+        with np.load(path) as job:
+            radius = int(job['radius']) if 'radius' in job else args.radius
+            arrays = [job[name] for name in ('stack', 'weather', 'rows', 'cols')]
+        if radius is None:
+            parser.error(f'{path} has no radius; pass --radius')
+        try:
+            future = worker.submit(*arrays, radius, name=path)
+        except ValueError as e:
+            print(f"{path}: skipped: {e}")
+            continue
+        inflight.append((path, future))
+    while inflight:
+        _save_predictions(*inflight.popleft())
+    worker.close()
+
+    stats = worker.stats()
+    print(f"{stats['jobs']} fires, {stats['patches']} patches in {time.perf_counter() - started:.1f}s "
+          f"({stats['patchesPerSecond']} patches/s, mean batch {stats['meanBatch']}, "
+          f"latency {stats['latencyMs']})")
+
+
+def _save_predictions(path, future):
+    try:
+        predictions = future.result()
+        out = os.path.splitext(path)[0] + '.pred.npy'
+        np.save(out, predictions)
+        print(f"{path}: {len(predictions)} points -> {out}")
+    except Exception as e:
+        print(f"{path}: failed: {e}")
+
+
+if __name__ == '__main__':
+    main()
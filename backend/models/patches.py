@@ -0,0 +1,91 @@
+"""
+Batched AOI patch extraction for fireCast inference.
+
+fireCastPredict used to build every point's (kernelDiam, kernelDiam, nchannels)
+crop up front via preProcessor.process(dataset) and hand the whole array to
+mod.predict. For a large fire that is millions of copied windows, and peak
+memory grows with fire area.
+
+Here the layer stack is padded by the AOI radius once and exposed as a
+sliding-window view: windows[row, col] *is* the crop centred on that pixel,
+with no data copied. Points are streamed to the model in batches of
+`batch_size`, so only one batch of crops is materialized at a time:
+
+    peak ~ padded stack + batch_size * kernelDiam**2 * nchannels * 4 bytes
+
+independent of how many points the fire has.
+
+    extractor = PatchExtractor(stack, radius=preProcessor.AOIRadius)
+    rows, cols = aoi_points(perimeter_mask)
+    preds = predict_points(model.predict_on_batch, extractor, rows, cols, weather)
+"""
+
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 512 x 61 x 61 x 8 float32 crops (AOIRadius 30) is ~60 MB per batch
+BATCH_SIZE = int(os.environ.get('FLAMEFLUX_PATCH_BATCH', 512))
+
+
+def stack_layers(layers, dtype=np.float32):
+    """(H, W, C) stack from a list of equally-sized 2-D layers, in model channel order."""
+    return np.stack([np.asarray(layer, dtype=dtype) for layer in layers], axis=-1)
+
+
+def aoi_points(mask):
+    """(rows, cols) of the pixels to predict, from a boolean mask."""
+    rows, cols = np.nonzero(mask)
+    return rows, cols
+
+
+class PatchExtractor:
+    """Zero-copy (kernelDiam, kernelDiam, C) windows around any pixel of a layer stack."""
+
+    def __init__(self, stack, radius, pad_value=0.0, dtype=np.float32):
+        stack = np.asarray(stack, dtype=dtype)
+        if stack.ndim == 2:
+            stack = stack[:, :, None]
+        self.radius = int(radius)
+        self.kernel = 2 * self.radius + 1
+        self.shape = stack.shape[:2]
+        self.channels = stack.shape[2]
+        # Pixels near the edge see pad_value outside the raster, like a zero-filled crop
+        r = self.radius
+        self._padded = np.pad(stack, ((r, r), (r, r), (0, 0)), mode='constant', constant_values=pad_value)
+        # (H, W, C, k, k) view -> (H, W, k, k, C), still a view of _padded
+        self.windows = np.moveaxis(sliding_window_view(self._padded, (self.kernel, self.kernel), axis=(0, 1)), 2, -1)
+
+    def patches(self, rows, cols):
+        """(N, k, k, C) array of crops centred on (rows, cols); copies only these N windows."""
+        return self.windows[np.asarray(rows), np.asarray(cols)]
+
+    def iter_batches(self, rows, cols, batch_size=BATCH_SIZE):
+        """Yield (start, stop, patches) over the points in order, batch_size at a time."""
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        for start in range(0, len(rows), batch_size):
+            stop = min(start + batch_size, len(rows))
+            yield start, stop, self.patches(rows[start:stop], cols[start:stop])
+
+
+def weather_batch(weather, start, stop):
+    """Weather inputs for points start..stop: per-point rows, or one vector broadcast (no copy)."""
+    weather = np.asarray(weather, dtype=np.float32)
+    if weather.ndim == 1:
+        return np.broadcast_to(weather, (stop - start, len(weather)))
+    return weather[start:stop]
+
+
+def predict_points(predict, extractor, rows, cols, weather, batch_size=BATCH_SIZE):
+    """Run `predict([weather, patches])` over all points in batches; returns (N,) predictions.
+
+    `predict` is anything that takes the model's two inputs for one batch,
+    e.g. a Keras model's predict_on_batch.
+    """
+    results = np.empty(len(rows), dtype=np.float32)
+    for start, stop, patches in extractor.iter_batches(rows, cols, batch_size):
+        output = predict([np.ascontiguousarray(weather_batch(weather, start, stop)), patches])
+        results[start:stop] = np.asarray(output).reshape(-1)
+    return results
@@ -0,0 +1,294 @@
+"""
+Memory-mapped training shards for fireCastFit.
+
+fireCastFit ran preProcessor.process() on the whole training and validation
+sets up front and handed fully materialized arrays to mod.fit, so the corpus
+was capped by RAM. Instead, samples are preprocessed once into shard files
+and streamed back during training:
+
+    <dir>/manifest.json
+    <dir>/shard-00000.weather.npy   (n, numWeatherInputs) float32
+    <dir>/shard-00000.patches.npy   (n, k, k, C)          float32
+    <dir>/shard-00000.labels.npy    (n,)                  float32
+
+Shards are plain .npy files of about FLAMEFLUX_SHARD_MB each, memory-mapped
+with mmap_mode='r' only while their batches are in flight, so resident
+memory is a couple of mixing windows whatever the corpus size.
+
+A shard is filled in write order, so it holds one fire or a few; batches
+drawn from a single shard would be far from IID. Each epoch therefore walks
+the shards in a random order, `mix_shards` at a time (FLAMEFLUX_SHARD_MIX,
+default 4): the samples of those shards are pooled and permuted together,
+and batches are cut from that stream. That group is the mixing window: a
+batch is a uniform sample of the window's shards (one spanning two windows
+at a window boundary), and samples from shards in different windows never
+share a batch. Batches are gathered by `workers` threads and up to
+`prefetch` batches are kept in flight ahead of the model.
+
+    with ShardWriter('data/train', weather_size=8, patch_shape=(61, 61, 5)) as writer:
+        writer.add_fire(extractor, rows, cols, weather, labels)
+    fit_streaming(model, 'data/train', 'data/validate', epochs=25)
+
+Benchmark (synthetic data, reports samples/s and peak RSS):
+
+    python -m models.training --samples 200000 --radius 30 --channels 5
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from models.patches import BATCH_SIZE, weather_batch
+
+SHARD_BYTES = int(float(os.environ.get('FLAMEFLUX_SHARD_MB', 64)) * 2 ** 20)
+FIT_BATCH_SIZE = 32
+WORKERS = 2
+PREFETCH = 8
+MIX_SHARDS = int(os.environ.get('FLAMEFLUX_SHARD_MIX', 4))
+
+_ARRAYS = ('weather', 'patches', 'labels')
+
+
+def _shard_path(directory, index, name):
+    return os.path.join(directory, f'shard-{index:05d}.{name}.npy')
+
+
+class ShardWriter:
+    """Append samples to fixed-size memory-mapped shards; close() writes the manifest.
+
+    Used as a context manager, the manifest is only written if the block
+    completes: a directory whose writing failed has no manifest, so it can't
+    be read as a complete corpus.
+    """
+
+    def __init__(self, directory, weather_size, patch_shape, shard_size=None):
+        os.makedirs(directory, exist_ok=True)
+        # Shards are about to be overwritten: an older manifest would no longer describe them
+        try:
+            os.remove(os.path.join(directory, 'manifest.json'))
+        except FileNotFoundError:
+            pass
+        self.directory = directory
+        self.weather_size = int(weather_size)
+        self.patch_shape = tuple(int(v) for v in patch_shape)
+        sample_bytes = 4 * (self.weather_size + int(np.prod(self.patch_shape)) + 1)
+        self.shard_size = shard_size or max(1, SHARD_BYTES // sample_bytes)
+        self.counts = []
+        self._shard = None
+        self._filled = 0
+
+    def _open_shard(self):
+        index = len(self.counts)
+        shapes = {
+            'weather': (self.shard_size, self.weather_size),
+            'patches': (self.shard_size, *self.patch_shape),
+            'labels': (self.shard_size,),
+        }
+        self._shard = {name: np.lib.format.open_memmap(_shard_path(self.directory, index, name), mode='w+',
+                                                       dtype=np.float32, shape=shapes[name])
+                       for name in _ARRAYS}
+        self.counts.append(0)
+        self._filled = 0
+
+    def add(self, weather, patches, labels):
+        """Append a batch: (n, weather_size), (n, k, k, C), (n,)."""
+        n = len(labels)
+        offset = 0
+        while offset < n:
+            if self._shard is None or self._filled == self.shard_size:
+                self._flush()
+                self._open_shard()
+            take = min(n - offset, self.shard_size - self._filled)
+            end = self._filled + take
+            self._shard['weather'][self._filled:end] = weather[offset:offset + take]
+            self._shard['patches'][self._filled:end] = patches[offset:offset + take]
+            self._shard['labels'][self._filled:end] = labels[offset:offset + take]
+            self._filled = end
+            self.counts[-1] = end
+            offset += take
+
+    def add_fire(self, extractor, rows, cols, weather, labels, batch_size=BATCH_SIZE):
+        """Append one fire's points straight from a PatchExtractor, a batch at a time."""
+        labels = np.asarray(labels, dtype=np.float32)
+        for start, stop, patches in extractor.iter_batches(rows, cols, batch_size):
+            self.add(weather_batch(weather, start, stop), patches, labels[start:stop])
+
+    def _flush(self):
+        if self._shard is not None:
+            for array in self._shard.values():
+                array.flush()
+            self._shard = None
+
+    def close(self):
+        self._flush()
+        manifest = {
+            'weatherSize': self.weather_size,
+            'patchShape': list(self.patch_shape),
+            'shardSize': self.shard_size,
+            'counts': self.counts,
+            'total': sum(self.counts),
+        }
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._flush()
+
+
+class ShardDataset:
+    """Read side of a shard directory: shuffled, prefetched batches."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.counts = self.manifest['counts']
+        self.total = self.manifest['total']
+        self.directory = directory
+
+    def steps(self, batch_size=FIT_BATCH_SIZE):
+        return -(-self.total // batch_size)
+
+    def _plan(self, batch_size, rng, mix_shards):
+        """[(shard, sorted indices), ...] per batch for one epoch, mixing mix_shards shards at a time."""
+        order = rng.permutation(len(self.counts)) if rng is not None else np.arange(len(self.counts))
+        mix_shards = max(1, mix_shards)
+        shards = samples = np.zeros(0, dtype=np.int64)  # the stream batches are cut from
+        for start in range(0, len(order), mix_shards):
+            window = order[start:start + mix_shards]
+            counts = [self.counts[shard] for shard in window]
+            window_shards = np.repeat(window, counts)
+            window_samples = np.concatenate([np.arange(count) for count in counts])
+            if rng is not None:
+                permutation = rng.permutation(len(window_shards))
+                window_shards, window_samples = window_shards[permutation], window_samples[permutation]
+            shards = np.concatenate([shards, window_shards])
+            samples = np.concatenate([samples, window_samples])
+            while len(shards) >= batch_size:
+                yield self._batch_parts(shards[:batch_size], samples[:batch_size])
+                shards, samples = shards[batch_size:], samples[batch_size:]
+        if len(shards):
+            yield self._batch_parts(shards, samples)
+
+    @staticmethod
+    def _batch_parts(shards, samples):
+        # Sorted within each shard: same samples, more sequential page access
+        return [(shard, np.sort(samples[shards == shard])) for shard in np.unique(shards)]
+
+    def _open(self, shard):
+        return {name: np.load(_shard_path(self.directory, shard, name), mmap_mode='r') for name in _ARRAYS}
+
+    @staticmethod
+    def _gather(parts):
+        weather = np.concatenate([arrays['weather'][indices] for arrays, indices in parts])
+        patches = np.concatenate([arrays['patches'][indices] for arrays, indices in parts])
+        labels = np.concatenate([arrays['labels'][indices] for arrays, indices in parts])
+        return (weather, patches), labels
+
+    def batches(self, batch_size=FIT_BATCH_SIZE, shuffle=True, seed=None, repeat=False,
+                workers=WORKERS, prefetch=PREFETCH, mix_shards=MIX_SHARDS):
+        """Yield ((weather, patches), labels) batches, epoch after epoch if repeat."""
+        rng = np.random.default_rng(seed) if shuffle else None
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard-prefetch') as pool:
+            while True:
+                pending = deque()
+                mapped = OrderedDict()  # shard -> arrays, least recently used first
+                for parts in self._plan(batch_size, rng, mix_shards):
+                    for shard, _ in parts:
+                        if shard not in mapped:
+                            mapped[shard] = self._open(shard)
+                            # Only the current and previous windows stay mapped (batches
+                            # in flight hold their own references), not the corpus
+                            if len(mapped) > 2 * max(1, mix_shards):
+                                mapped.popitem(last=False)
+                        mapped.move_to_end(shard)
+                    parts = [(mapped[shard], indices) for shard, indices in parts]
+                    pending.append(pool.submit(self._gather, parts))
+                    if len(pending) >= prefetch:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+                if not repeat:
+                    return
+
+
+def fit_streaming(model, train_dir, validate_dir=None, epochs=25, batch_size=FIT_BATCH_SIZE,
+                  mix_shards=MIX_SHARDS):
+    """fireCastFit over shard directories instead of in-memory arrays."""
+    train = ShardDataset(train_dir)
+    kwargs = {}
+    if validate_dir:
+        validate = ShardDataset(validate_dir)
+        kwargs = {
+            'validation_data': validate.batches(batch_size, shuffle=False, repeat=True),
+            'validation_steps': validate.steps(batch_size),
+        }
+    return model.fit(train.batches(batch_size, repeat=True, mix_shards=mix_shards),
+                     steps_per_epoch=train.steps(batch_size),
+                     epochs=epochs, **kwargs)
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the memory-mapped fireCast training pipeline.')
+    parser.add_argument('--samples', type=int, default=100000)
+    parser.add_argument('--radius', type=int, default=30)
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--weather', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=FIT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--mix', type=int, default=MIX_SHARDS, help='Shards mixed into each batch window')
+    parser.add_argument('--dir', help='Shard directory to reuse (default: a temporary one)')
+    args = parser.parse_args()
+
+    kernel = 2 * args.radius + 1
+    directory = args.dir or tempfile.mkdtemp(prefix='firecast-shards-')
+    sample_mb = (kernel * kernel * args.channels + args.weather + 1) * 4 / 2 ** 20
+    try:
+        if not os.path.exists(os.path.join(directory, 'manifest.json')):
+            started = time.perf_counter()
+            rng = np.random.default_rng(0)
+            with ShardWriter(directory, args.weather, (kernel, kernel, args.channels)) as writer:
+                for start in range(0, args.samples, BATCH_SIZE):
+                    n = min(BATCH_SIZE, args.samples - start)
+                    writer.add(rng.random((n, args.weather), dtype=np.float32),
+                               rng.random((n, kernel, kernel, args.channels), dtype=np.float32),
+                               (rng.random(n) > 0.5).astype(np.float32))
+            elapsed = time.perf_counter() - started
+            print(f"Wrote {args.samples} samples ({args.samples * sample_mb:.0f} MB) "
+                  f"in {elapsed:.1f}s ({args.samples / elapsed:,.0f} samples/s)")
+
+        dataset = ShardDataset(directory)
+        started = time.perf_counter()
+        seen = 0
+        batches = dataset.batches(args.batch_size, seed=0, workers=args.workers, mix_shards=args.mix)
+        for (weather, patches), labels in batches:
+            seen += len(labels)
+        elapsed = time.perf_counter() - started
+        print(f"Streamed one shuffled epoch of {seen} samples in {elapsed:.1f}s "
+              f"({seen / elapsed:,.0f} samples/s), peak RSS {_peak_rss_mb():.0f} MB "
+              f"(corpus {dataset.total * sample_mb:.0f} MB)")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
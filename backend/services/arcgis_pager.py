@@ -0,0 +1,286 @@
+"""
+Paged retrieval for ArcGIS FeatureServer queries.
+
+One `query` call returns at most the layer's maxRecordCount features and
+flags the rest with `exceededTransferLimit`, so at peak season the one-shot
+fetches silently dropped perimeters and hotspots. PagedQuery fetches a whole
+feed instead:
+
+  1. a returnIdsOnly call lists the object IDs matching the query (ID lists
+     are not capped by maxRecordCount);
+  2. the sorted IDs are cut into PAGE_SIZE batches, fetched CONCURRENCY at a
+     time with `objectIds` (as POSTs, so long ID lists don't hit URL limits);
+  3. a page that still comes back truncated has its missing IDs requested
+     again, and a failed request is retried up to RETRIES times with backoff;
+  4. pages are yielded in object-ID order as soon as every earlier page is
+     in, so callers can transform page 1 while page 7 is still downloading.
+
+Layers that can't list IDs fall back to returnCountOnly plus
+resultOffset/resultRecordCount pages.
+
+    query = PagedQuery(MODIS_api, 'modis', headers=headers)
+    for features in query.pages():
+        ...
+    query.report()  # {'pages', 'requests', 'retries', 'expected', 'received', 'complete', 'error', 'elapsedMs'}
+
+The latest report of each feed is kept in `last_reports` (see /api/health),
+failed and abandoned fetches included: those are recorded with
+complete=False, the error and the pages received so far. A page that still
+fails after its retries raises IncompleteFeed: a feed missing a page is
+never returned as if it were whole.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+PAGE_SIZE = int(os.environ.get('FLAMEFLUX_PAGE_SIZE', 1000))
+CONCURRENCY = int(os.environ.get('FLAMEFLUX_PAGE_CONCURRENCY', 4))
+RETRIES = int(os.environ.get('FLAMEFLUX_PAGE_RETRIES', 2))
+RETRY_BACKOFF = 0.5  # seconds, doubled on every attempt
+TIMEOUT = (10, 30)  # (connect, read) per request
+
+_reports_lock = threading.Lock()
+last_reports = {}  # feed name -> report of its latest fetch
+
+
+class IncompleteFeed(Exception):
+    """A page could not be fetched even after retries."""
+
+
+class RetryableError(Exception):
+    """A failure worth retrying: 5xx / 429, or an ArcGIS error body."""
+
+
+def _truncated(data):
+    return bool(data.get('exceededTransferLimit') or (data.get('properties') or {}).get('exceededTransferLimit'))
+
+
+def _check_body(data):
+    if not isinstance(data, dict):
+        raise RetryableError(f'unexpected response: {type(data).__name__}')
+    if 'error' in data:
+        error = data['error'] or {}
+        raise RetryableError(f"ArcGIS error {error.get('code')}: {error.get('message')}")
+    return data
+
+
+class PagedQuery:
+    def __init__(self, url, name, headers=None, page_size=PAGE_SIZE, concurrency=CONCURRENCY,
+                 retries=RETRIES, timeout=TIMEOUT):
+        parts = urlsplit(url)
+        self.endpoint = urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+        self.params = dict(parse_qsl(parts.query))
+        self.name = name
+        self.headers = headers or {}
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._counts = {'pages': 0, 'requests': 0, 'retries': 0, 'received': 0}
+        self._expected = None
+        self._started = None
+        self._finished = None
+        self._error = None
+
+    # -- planning / page bookkeeping, shared by the sync and async drivers --
+
+    def _ids_params(self):
+        return {'where': self.params.get('where', '1=1'), 'returnIdsOnly': 'true', 'f': 'json'}
+
+    def _count_params(self):
+        return {'where': self.params.get('where', '1=1'), 'returnCountOnly': 'true', 'f': 'json'}
+
+    def _plan(self, ids_data, count_data=None):
+        """Page specs: ('ids', [oid, ...]) batches, or ('offset', start, count) without IDs."""
+        ids = (ids_data or {}).get('objectIds')
+        if ids is not None:
+            ids = sorted(ids)
+            self._expected = len(ids)
+            return [('ids', ids[i:i + self.page_size]) for i in range(0, len(ids), self.page_size)]
+        total = int(count_data['count'])
+        self._expected = total
+        return [('offset', start, min(self.page_size, total - start)) for start in range(0, total, self.page_size)]
+
+    def _page_params(self, spec):
+        params = dict(self.params)
+        if spec[0] == 'ids':
+            params.pop('where', None)
+            params['objectIds'] = ','.join(str(oid) for oid in spec[1])
+        else:
+            params['resultOffset'] = spec[1]
+            params['resultRecordCount'] = spec[2]
+        return params
+
+    def _remainder(self, spec, data):
+        """The part of a page a truncated response left out, or None when it is complete."""
+        features = data.get('features') or []
+        if not _truncated(data) or not features:
+            return None
+        if spec[0] == 'offset':
+            left = spec[2] - len(features)
+            return ('offset', spec[1] + len(features), left) if left > 0 else None
+        got = {feature.get('id') for feature in features}
+        missing = [oid for oid in spec[1] if oid not in got]
+        return ('ids', missing) if missing and len(missing) < len(spec[1]) else None
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def _page_done(self, features):
+        with self._lock:
+            self._counts['pages'] += 1
+            self._counts['received'] += len(features)
+
+    def _backoff(self, attempt):
+        return RETRY_BACKOFF * 2 ** attempt
+
+    def report(self):
+        with self._lock:
+            report = dict(self._counts, expected=self._expected)
+        report['complete'] = self._finished is not None and self._error is None \
+            and report['received'] >= (report['expected'] or 0)
+        report['error'] = self._error
+        report['elapsedMs'] = round(((self._finished or time.monotonic()) - self._started) * 1000) \
+            if self._started else None
+        return report
+
+    def _finish(self, error=None):
+        """Record the fetch's report, failed or not; `error` is what ended it early."""
+        self._finished = time.monotonic()
+        if isinstance(error, GeneratorExit):
+            self._error = 'abandoned by the caller'
+        elif error is not None:
+            self._error = str(error) or type(error).__name__
+        report = dict(self.report(), finishedAt=datetime.now().isoformat())
+        with _reports_lock:
+            last_reports[self.name] = report
+        outcome = 'Fetched' if self._error is None else 'Failed to fetch'
+        print(f"{outcome} {self.name}: {report['received']}/{report['expected']} features in {report['pages']} pages "
+              f"({report['requests']} requests, {report['retries']} retries, {report['elapsedMs']} ms)"
+              + (f": {self._error}" if self._error else ''))
+
+    # -- blocking driver (requests + a thread pool) --
+
+    def _post(self, session, params):
+        import requests  # deferred so the app can start serving before it is needed
+
+        for attempt in range(self.retries + 1):
+            self._count('requests')
+            try:
+                response = session.post(self.endpoint, data=params, headers=self.headers, timeout=self.timeout)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise RetryableError(f'HTTP {response.status_code}')
+                response.raise_for_status()
+                return _check_body(response.json())
+            except (RetryableError, requests.ConnectionError, requests.Timeout, ValueError) as e:
+                if attempt == self.retries:
+                    raise IncompleteFeed(f'{self.name}: page failed after {attempt + 1} attempts ({e})') from e
+                self._count('retries')
+                time.sleep(self._backoff(attempt))
+
+    def _fetch_page(self, session, spec):
+        features = []
+        while spec:
+            data = self._post(session, self._page_params(spec))
+            features.extend(data.get('features') or [])
+            spec = self._remainder(spec, data)
+        self._page_done(features)
+        return features
+
+    def pages(self):
+        """Yield each page's GeoJSON features in object-ID order, fetching ahead concurrently."""
+        import requests
+
+        self._started = time.monotonic()
+        error = None
+        try:
+            with requests.Session() as session:
+                try:
+                    plan = self._plan(self._post(session, self._ids_params()))
+                except IncompleteFeed:
+                    plan = self._plan(None, self._post(session, self._count_params()))
+                with ThreadPoolExecutor(max_workers=self.concurrency,
+                                        thread_name_prefix=f'{self.name}-pages') as pool:
+                    futures = [pool.submit(self._fetch_page, session, spec) for spec in plan]
+                    try:
+                        for future in futures:
+                            yield future.result()
+                    finally:
+                        for future in futures:
+                            future.cancel()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(error)
+
+    def features(self):
+        """Every feature of the feed, in object-ID order."""
+        return [feature for page in self.pages() for feature in page]
+
+    # -- asyncio driver (aiohttp; see async_upstream) --
+
+    async def _post_async(self, session, params):
+        import asyncio
+        import aiohttp
+
+        for attempt in range(self.retries + 1):
+            self._count('requests')
+            try:
+                async with session.post(self.endpoint, data=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        raise RetryableError(f'HTTP {response.status}')
+                    response.raise_for_status()
+                    return _check_body(await response.json(content_type=None))
+            except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError, ValueError) as e:
+                if attempt == self.retries:
+                    raise IncompleteFeed(f'{self.name}: page failed after {attempt + 1} attempts ({e})') from e
+                self._count('retries')
+                await asyncio.sleep(self._backoff(attempt))
+
+    async def _fetch_page_async(self, session, spec, slots):
+        features = []
+        async with slots:
+            while spec:
+                data = await self._post_async(session, self._page_params(spec))
+                features.extend(data.get('features') or [])
+                spec = self._remainder(spec, data)
+        self._page_done(features)
+        return features
+
+    async def features_async(self, session):
+        """Every feature of the feed in object-ID order, pages fetched concurrently on the event loop."""
+        import asyncio
+
+        self._started = time.monotonic()
+        error = None
+        try:
+            try:
+                plan = self._plan(await self._post_async(session, self._ids_params()))
+            except IncompleteFeed:
+                plan = self._plan(None, await self._post_async(session, self._count_params()))
+            slots = asyncio.Semaphore(self.concurrency)
+            async with asyncio.TaskGroup() as group:  # one failed page cancels the rest
+                tasks = [group.create_task(self._fetch_page_async(session, spec, slots)) for spec in plan]
+        except BaseException as e:
+            error = e.exceptions[0] if isinstance(e, BaseExceptionGroup) and len(e.exceptions) == 1 else e
+            raise
+        finally:
+            self._finish(error)
+        return [feature for task in tasks for feature in task.result()]
+
+
+def feature_collection(features):
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def reports():
+    """Latest fetch report of every feed fetched by this process."""
+    with _reports_lock:
+        return dict(last_reports)
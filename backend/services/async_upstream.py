@@ -0,0 +1,61 @@
+"""
+Asyncio service layer for the upstream ArcGIS feeds.
+
+The sync services (`get_fires_data`, `get_modis_data`, `get_viirs_data`) each
+block a worker thread for the whole download. Here the HTTP calls are
+non-blocking (aiohttp), all requested feeds - and every page of each feed,
+see arcgis_pager - are fetched concurrently on one event loop, and every feed
+runs under a strict deadline. A feed that misses
+its deadline is cancelled (closing its connection) without taking the other
+feeds down with it. The CPU-bound processing reuses the sync services'
+`process_*` functions and runs in a thread so it never stalls the loop.
+
+    results = await fetch_feeds(['modis', 'viirs'])
+    results['modis']  # payload dict, or the exception that feed raised
+"""
+
+import asyncio
+import os
+
+import arcgis_pager
+from fire_service import HEADERS, WFIGS_API, process_fire_collection
+from satellite_service import MODIS_api, VIIRS_api, process_modis_features, process_viirs_features
+
+UPSTREAM_TIMEOUT = float(os.environ.get('FLAMEFLUX_UPSTREAM_TIMEOUT', 30))
+CONNECT_TIMEOUT = 10
+
+FEEDS = {
+    'fires': (WFIGS_API, process_fire_collection),
+    'modis': (MODIS_api, lambda data: process_modis_features(data['features'])),
+    'viirs': (VIIRS_api, lambda data: process_viirs_features(data['features'])),
+}
+
+
+async def fetch_feed(session, name, timeout=UPSTREAM_TIMEOUT):
+    """Fetch every page of one feed within `timeout` seconds and process it into its API payload."""
+    url, process = FEEDS[name]
+    async with asyncio.timeout(timeout):
+        features = await arcgis_pager.PagedQuery(url, name).features_async(session)
+    return await asyncio.to_thread(process, arcgis_pager.feature_collection(features))
+
+
+async def fetch_feeds(names, timeout=UPSTREAM_TIMEOUT):
+    """Fetch several feeds concurrently.
+
+    Returns {name: payload or exception}; one feed failing or timing out does
+    not cancel the others.
+    """
+    import aiohttp  # ~150 ms to import; only needed once something refreshes
+
+    client_timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=CONNECT_TIMEOUT)
+    async with aiohttp.ClientSession(headers=HEADERS, timeout=client_timeout) as session:
+        results = await asyncio.gather(
+            *(fetch_feed(session, name, timeout=timeout) for name in names),
+            return_exceptions=True
+        )
+    return dict(zip(names, results))
+
+
+def fetch_feeds_sync(names, timeout=UPSTREAM_TIMEOUT):
+    """Blocking wrapper for callers outside an event loop (refresher thread, scripts)."""
+    return asyncio.run(fetch_feeds(names, timeout=timeout))
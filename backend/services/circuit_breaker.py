@@ -0,0 +1,184 @@
+"""
+Per-feed circuit breakers and deadline-bounded upstream calls.
+
+When ArcGIS is slow or down, every cache miss used to block a worker for the
+full upstream timeout and then return a 500. Each feed (fires, modis, viirs)
+now goes through a CircuitBreaker:
+
+    closed     calls go through; the last WINDOW outcomes are tracked, and once
+               at least MIN_CALLS are in, an error rate >= ERROR_RATE trips it
+               (calls slower than SLOW_CALL_SECONDS count as errors)
+    open       calls fail fast with UpstreamUnavailable for OPEN_SECONDS
+    half_open  one probe call is let through; success closes, failure re-opens
+
+GuardedFetch wraps a feed's fetcher with the breaker plus single-flight (one
+upstream call per feed at a time, concurrent callers share it) and a per-call
+deadline. A caller that hits its deadline gets DeadlineExceeded, but the
+fetch keeps running and `on_success` still stores its result, so the work is
+not wasted. Callers are expected to fall back to their last good data.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+
+WINDOW = int(os.environ.get('FLAMEFLUX_BREAKER_WINDOW', 10))
+MIN_CALLS = int(os.environ.get('FLAMEFLUX_BREAKER_MIN_CALLS', 3))
+ERROR_RATE = float(os.environ.get('FLAMEFLUX_BREAKER_ERROR_RATE', 0.5))
+SLOW_CALL_SECONDS = float(os.environ.get('FLAMEFLUX_BREAKER_SLOW_SECONDS', 20))
+OPEN_SECONDS = float(os.environ.get('FLAMEFLUX_BREAKER_OPEN_SECONDS', 60))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='upstream')
+
+
+class UpstreamUnavailable(Exception):
+    """The feed can't answer in time: breaker open, deadline passed, or the call failed."""
+
+    def __init__(self, name, reason):
+        super().__init__(f'{name}: {reason}')
+        self.name = name
+        self.reason = reason
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=WINDOW, min_calls=MIN_CALLS, error_rate=ERROR_RATE,
+                 slow_call_seconds=SLOW_CALL_SECONDS, open_seconds=OPEN_SECONDS):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window)  # (ok, latency seconds)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probing = False
+        self._last_error = None
+        self._last_success = None
+        self._trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+        return self._state
+
+    def allow(self):
+        """Whether a call may go upstream now (claims the probe slot when half-open)."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok, latency, error=None, claimed=True):
+        """Count a call's outcome. claimed=False is for calls made without allow() (forced
+        refreshes): ignored while half-open, where only the probe's outcome decides."""
+        ok = ok and latency < self.slow_call_seconds
+        with self._lock:
+            if not claimed and self._current_state() == HALF_OPEN:
+                return
+            if ok:
+                self._last_success = datetime.now().isoformat()
+            else:
+                self._last_error = error or f'slow call ({latency:.1f}s)'
+            if self._state == HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._trip()
+                return
+            self._calls.append((ok, latency))
+            failures = sum(1 for call_ok, _ in self._calls if not call_ok)
+            if self._state == CLOSED and len(self._calls) >= self.min_calls \
+                    and failures / len(self._calls) >= self.error_rate:
+                self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._trips += 1
+        print(f"Circuit breaker {self.name}: open for {self.open_seconds:.0f}s ({self._last_error})")
+
+    def status(self):
+        with self._lock:
+            state = self._current_state()
+            latencies = sorted(latency for _, latency in self._calls)
+            failures = sum(1 for ok, _ in self._calls if not ok)
+            return {
+                'state': state,
+                'calls': len(self._calls),
+                'errorRate': round(failures / len(self._calls), 3) if self._calls else 0.0,
+                'p50LatencyMs': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                'retryInSeconds': round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+                if state == OPEN else None,
+                'trips': self._trips,
+                'lastError': self._last_error,
+                'lastSuccess': self._last_success,
+            }
+
+
+class GuardedFetch:
+    """Single-flight, deadline-bounded calls to one feed through its breaker."""
+
+    def __init__(self, breaker, fetch, on_success=None):
+        self.breaker = breaker
+        self.fetch = fetch
+        self.on_success = on_success
+        self._lock = threading.Lock()
+        self._inflight = None
+
+    def start(self):
+        """Start a fetch in the background unless one is in flight; its future."""
+        with self._lock:
+            if self._inflight is None:
+                if not self.breaker.allow():
+                    raise UpstreamUnavailable(self.breaker.name, 'circuit open')
+                self._inflight = _executor.submit(self._run)
+            return self._inflight
+
+    def __call__(self, deadline):
+        """Fresh data within `deadline` seconds, or UpstreamUnavailable."""
+        future = self.start()
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeout:
+            raise DeadlineExceeded(self.breaker.name, f'no response within {deadline:g}s')
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            raise UpstreamUnavailable(self.breaker.name, str(e) or type(e).__name__) from e
+
+    def _run(self):
+        started = time.monotonic()
+        try:
+            try:
+                data = self.fetch()
+            except Exception as e:
+                self.breaker.record(False, time.monotonic() - started, str(e) or type(e).__name__)
+                raise
+            self.breaker.record(True, time.monotonic() - started)
+            if self.on_success:
+                self.on_success(data)  # before clearing _inflight, so no caller sees neither
+            return data
+        finally:
+            with self._lock:
+                self._inflight = None
@@ -0,0 +1,200 @@
+"""
+Rasterized coverage mask: is a point inside the area FlameFlux supports?
+
+The supported area is the one the map shows unshaded - CONUS and Hawaii,
+i.e. everything outside frontend/public/data/us-unsupported-area-mask.geojson
+(built from the Natural Earth 1:110m state polygons by
+frontend/scripts/build-us-unsupported-mask.mjs). It replaces the old
+hand-drawn lat/lon rectangles, which took in large parts of Canada and
+Mexico.
+
+The test is exact against the mask polygons, with no tolerance band: a
+point just across the border, or offshore of the 1:110m coastline, is not
+covered. (That coastline is coarse - Big Sur sits 2.5 km "offshore" - so a
+few coastal detections fall outside too.)
+
+The mask is rasterized once into a grid of CELL_DEGREES cells:
+
+  * cells no boundary edge passes through are wholly in or out, decided by
+    a scanline parity test of the cell centre;
+  * the remaining "edge" cells keep a CSR list of the boundary edges that
+    cross them, and points falling in one get an exact point-in-polygon
+    test: parity relative to the cell centre (crossings along
+    centre -> point).
+
+`contains(lats, lons)` is one grid lookup per point plus exact work for the
+few points in edge cells - millions of points per second.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+MASK_PATH = os.environ.get('FLAMEFLUX_COVERAGE_MASK', os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'frontend', 'public', 'data', 'us-unsupported-area-mask.geojson')))
+CELL_DEGREES = 0.1
+EDGE_PAD_DEGREES = 1e-9  # so an edge along a cell border is listed for the cells on both sides
+
+OUTSIDE, INSIDE, NEAR = 0, 1, 2
+
+_lock = threading.Lock()
+_mask = {'grid': None}
+
+
+def _mask_edges(path):
+    """(x1, y1, x2, y2) of every ring edge of the mask geometry."""
+    with open(path) as f:
+        data = json.load(f)
+    features = data.get('features') or [data]
+    x1, y1, x2, y2 = [], [], [], []
+    for feature in features:
+        geometry = feature.get('geometry', feature)
+        polygons = geometry['coordinates'] if geometry.get('type') == 'MultiPolygon' else [geometry['coordinates']]
+        for polygon in polygons:
+            for ring in polygon:
+                ring = np.asarray(ring, dtype=float)[:, :2]
+                x1.append(ring[:-1, 0])
+                y1.append(ring[:-1, 1])
+                x2.append(ring[1:, 0])
+                y2.append(ring[1:, 1])
+    return tuple(np.concatenate(v) for v in (x1, y1, x2, y2))
+
+
+class CoverageGrid:
+    def __init__(self, x1, y1, x2, y2, cell=CELL_DEGREES):
+        self.edges = (x1, y1, x2, y2)
+        self.cell = cell
+
+        # Grid extent: the finite part of the mask (not its world-frame ring), plus a cell
+        xs, ys = np.concatenate([x1, x2]), np.concatenate([y1, y2])
+        finite = (np.abs(xs) < 180) & (np.abs(ys) < 90)
+        self.y0 = ys[finite].min() - cell
+        self.x0 = xs[finite].min() - cell
+        self.nx = int(np.ceil((xs[finite].max() + cell - self.x0) / cell))
+        self.ny = int(np.ceil((ys[finite].max() + cell - self.y0) / cell))
+
+        in_mask = self._center_parity()
+        self.grid = np.where(in_mask, OUTSIDE, INSIDE).astype(np.uint8)
+        self._index_near_cells(in_mask)
+
+    def _center_parity(self):
+        """(ny, nx) even-odd inside-mask flags of every cell centre, one scanline per row."""
+        x1, y1, x2, y2 = self.edges
+        centers_x = self.x0 + (np.arange(self.nx) + 0.5) * self.cell
+        parity = np.zeros((self.ny, self.nx), dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for row in range(self.ny):
+                cy = self.y0 + (row + 0.5) * self.cell
+                straddles = (y1 > cy) != (y2 > cy)
+                crossings = np.sort(x1[straddles] + (cy - y1[straddles]) * (x2[straddles] - x1[straddles])
+                                    / (y2[straddles] - y1[straddles]))
+                to_right = len(crossings) - np.searchsorted(crossings, centers_x, side='right')
+                parity[row] = to_right % 2 == 1
+        return parity
+
+    def _index_near_cells(self, in_mask):
+        """Mark cells an edge passes through NEAR and build their CSR edge lists."""
+        x1, y1, x2, y2 = self.edges
+        cell = self.cell
+        # Split edges into pieces no longer than a cell, so each piece's bbox is tight
+        pieces = np.maximum(1, np.ceil(np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)) / cell)).astype(np.int64)
+        edge = np.repeat(np.arange(len(x1)), pieces)
+        step = np.arange(len(edge)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        t0, t1 = step / pieces[edge], (step + 1) / pieces[edge]
+        ax, ay = x1[edge] + t0 * (x2 - x1)[edge], y1[edge] + t0 * (y2 - y1)[edge]
+        bx, by = x1[edge] + t1 * (x2 - x1)[edge], y1[edge] + t1 * (y2 - y1)[edge]
+
+        pad = EDGE_PAD_DEGREES
+        ix0 = np.clip(np.floor((np.minimum(ax, bx) - pad - self.x0) / cell), 0, self.nx).astype(np.int64)
+        ix1 = np.clip(np.floor((np.maximum(ax, bx) + pad - self.x0) / cell), -1, self.nx - 1).astype(np.int64)
+        iy0 = np.clip(np.floor((np.minimum(ay, by) - pad - self.y0) / cell), 0, self.ny).astype(np.int64)
+        iy1 = np.clip(np.floor((np.maximum(ay, by) + pad - self.y0) / cell), -1, self.ny - 1).astype(np.int64)
+        width = np.maximum(ix1 - ix0 + 1, 0)
+        height = np.maximum(iy1 - iy0 + 1, 0)
+        counts = width * height
+
+        # Every (cell, edge) pair covered by a piece's bbox
+        piece = np.repeat(np.arange(len(edge)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        w = np.maximum(width[piece], 1)
+        cells = (iy0[piece] + local // w) * self.nx + ix0[piece] + local % w
+        pairs = np.unique(cells * len(x1) + edge[piece])
+        pair_cell, pair_edge = pairs // len(x1), pairs % len(x1)
+
+        near_cells, starts = np.unique(pair_cell, return_index=True)
+        self.grid.flat[near_cells] = NEAR
+        self.near_slot = np.full(self.nx * self.ny, -1, dtype=np.int64)
+        self.near_slot[near_cells] = np.arange(len(near_cells))
+        self.near_start = starts
+        self.near_count = np.diff(np.append(starts, len(pairs)))
+        self.near_edges = pair_edge
+        self.near_in_mask = in_mask.flat[near_cells]
+
+    def contains(self, lats, lons):
+        """Boolean array: which (lat, lon) points are covered."""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        ix = np.floor((lons - self.x0) / self.cell)
+        iy = np.floor((lats - self.y0) / self.cell)
+        on_grid = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)  # NaN compares False
+        flat = np.where(on_grid, iy * self.nx + ix, 0).astype(np.int64)
+        codes = np.where(on_grid, self.grid.flat[flat], OUTSIDE)
+
+        result = codes == INSIDE
+        near = np.nonzero(codes == NEAR)[0]
+        if len(near):
+            result[near] = self._exact(lats[near], lons[near], flat[near])
+        return result
+
+    def _exact(self, py, px, flat):
+        slot = self.near_slot[flat]
+        counts = self.near_count[slot]
+        point = np.repeat(np.arange(len(px)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        edge = self.near_edges[np.repeat(self.near_start[slot], counts) + offsets]
+        x1, y1, x2, y2 = (a[edge] for a in self.edges)
+        qx, qy = px[point], py[point]
+        cx = self.x0 + (flat % self.nx + 0.5)[point] * self.cell
+        cy = self.y0 + (flat // self.nx + 0.5)[point] * self.cell
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Leg 1: centre -> (qx, cy); a crossing at x flips the rightward-ray parity
+            straddles = (y1 > cy) != (y2 > cy)
+            xc = x1 + (cy - y1) * (x2 - x1) / (y2 - y1)
+            flips = straddles & (xc > np.minimum(cx, qx)) & (xc <= np.maximum(cx, qx))
+            # Leg 2: (qx, cy) -> (qx, qy)
+            spans = (x1 > qx) != (x2 > qx)
+            yc = y1 + (qx - x1) * (y2 - y1) / (x2 - x1)
+            flips ^= spans & (yc > np.minimum(cy, qy)) & (yc <= np.maximum(cy, qy))
+        in_mask = self.near_in_mask[slot] ^ (np.bincount(point, weights=flips, minlength=len(px)) % 2 == 1)
+        return ~in_mask
+
+
+def _legacy_contains(lats, lons):
+    """CONUS and Hawaii rectangles (the mask's coverage; no Alaska), for when the mask file is missing."""
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    return (((lats >= 24.396308) & (lats <= 49.384358) & (lons >= -125.0) & (lons <= -66.93457))
+            | ((lats >= 18.5) & (lats <= 22.5) & (lons >= -160.5) & (lons <= -154.5)))
+
+
+def get_grid():
+    """The coverage grid, built on first use (None if the mask file is unavailable)."""
+    with _lock:
+        if _mask['grid'] is None:
+            try:
+                _mask['grid'] = CoverageGrid(*_mask_edges(MASK_PATH))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Coverage mask unavailable ({e}); falling back to lat/lon boxes")
+                _mask['grid'] = False
+        return _mask['grid'] or None
+
+
+def contains(lats, lons):
+    """Vectorized: which (lat, lon) points fall in the supported area."""
+    grid = get_grid()
+    if grid is None:
+        return _legacy_contains(lats, lons)
+    return grid.contains(lats, lons)
@@ -0,0 +1,167 @@
+"""
+Server-Sent Events broadcast of dataset updates (GET /api/stream).
+
+Served by asgi.py, the default production entry point. Under plain WSGI
+(FLAMEFLUX_ASGI=0, or the Flask dev server) /api/stream answers 501: a stream
+would hold a worker thread for the life of every client.
+
+Dashboards used to poll /api/fires, /api/modis and /api/viirs on a timer.
+With the stream open they get one small event whenever a new version of a
+dataset (fires, modis, viirs, predictions) becomes current:
+
+    id: fires-42
+    event: fires
+    data: {"dataset": "fires", "version": 42, "total": 318, ...}
+
+With ?deltas=1, fires events also carry the added/updated/removed fires since
+the previous version (see fire_changes), so the client never refetches the
+full list. A client that falls behind can still catch up through
+/api/fires/changes?since=<its last version>.
+
+One Broadcaster task per process polls the dataset versions every
+POLL_INTERVAL seconds (a stat() per snapshot pointer) and fans each event out
+to per-client asyncio queues. Each connection is a coroutine parked on its
+queue, so thousands of idle clients cost memory, not threads. A client whose
+queue is full loses its oldest event rather than slowing everyone else down.
+"""
+
+import asyncio
+import json
+import os
+
+POLL_INTERVAL = float(os.environ.get('FLAMEFLUX_STREAM_POLL', 2))
+HEARTBEAT_INTERVAL = 15
+QUEUE_SIZE = 16
+
+
+def format_event(event, data, event_id=None):
+    """Encode one SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class Subscriber:
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def push(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()  # drop the oldest; versions let the client resync
+        self.queue.put_nowait(message)
+
+
+class Broadcaster:
+    """Polls dataset versions and pushes an event per new version to every subscriber.
+
+    `poll_versions()` returns {dataset: {'version': ..., 'total': ..., ...}} and
+    `load_delta(since)` returns a fire_changes delta; both block, so they run
+    in a worker thread.
+    """
+
+    def __init__(self, poll_versions, load_delta=None, poll_interval=POLL_INTERVAL):
+        self.poll_versions = poll_versions
+        self.load_delta = load_delta
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        self.current = {}
+        self.ready = asyncio.Event()  # set once the first poll has filled `current`
+        self._task = None
+
+    def subscribe(self, deltas=False):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        subscriber = Subscriber(deltas)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def initial_events(self):
+        """Current version of every dataset, sent when a client connects."""
+        return [format_event(name, dict(info, dataset=name), f"{name}-{info['version']}")
+                for name, info in self.current.items()]
+
+    async def _run(self):
+        while True:
+            try:
+                versions = await asyncio.to_thread(self.poll_versions)
+                for name, info in versions.items():
+                    previous = self.current.get(name)
+                    if previous and previous['version'] == info['version']:
+                        continue
+                    self.current[name] = info
+                    if previous is None:
+                        continue  # first poll: nothing changed from the clients' point of view
+                    await self._publish(name, info, previous['version'])
+            except Exception as e:
+                print(f"Event stream: failed to poll dataset versions: {e}")
+            self.ready.set()
+            await asyncio.sleep(self.poll_interval)
+
+    async def _publish(self, name, info, previous_version):
+        event_id = f"{name}-{info['version']}"
+        data = dict(info, dataset=name, previousVersion=previous_version)
+        message = format_event(name, data, event_id)
+
+        delta_message = message
+        if name == 'fires' and self.load_delta and any(s.deltas for s in self.subscribers):
+            delta = await asyncio.to_thread(self.load_delta, previous_version)
+            if not delta.get('resync'):
+                delta_message = format_event(name, dict(
+                    data, added=delta['added'], updated=delta['updated'], removed=delta['removed']
+                ), event_id)
+
+        for subscriber in list(self.subscribers):
+            subscriber.push(delta_message if subscriber.deltas else message)
+
+
+async def serve_stream(broadcaster, scope, receive, send):
+    """ASGI handler for one SSE connection."""
+    query = scope.get('query_string', b'').decode()
+    deltas = any(part in ('deltas=1', 'deltas=true') for part in query.split('&'))
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'access-control-allow-origin', b'*'),
+            (b'x-accel-buffering', b'no'),  # keep proxies from buffering the stream
+        ],
+    })
+    subscriber = broadcaster.subscribe(deltas=deltas)
+
+    async def wait_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    disconnected = asyncio.ensure_future(wait_disconnect())
+    try:
+        try:
+            await asyncio.wait_for(broadcaster.ready.wait(), timeout=HEARTBEAT_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        body = b'retry: 5000\n\n' + b''.join(broadcaster.initial_events())
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        while not disconnected.done():
+            getter = asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=HEARTBEAT_INTERVAL,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                message = getter.result()
+            else:
+                getter.cancel()
+                message = b': keepalive\n\n'
+            if disconnected.done():
+                break
+            await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        disconnected.cancel()
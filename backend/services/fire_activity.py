@@ -0,0 +1,140 @@
+"""
+Spatial join of MODIS/VIIRS hotspots to the WFIGS perimeters they fall in.
+
+For every fire this gives an `activity` record:
+
+    {'hotspots': 12, 'modis': 3, 'viirs': 9, 'frpTotal': 184.2, 'newestAge': 2}
+
+plus the number of hotspots that fall inside no perimeter at all (new or
+unmapped fires). The join runs once per (fires, MODIS, VIIRS) version:
+
+  * hotspots are sorted by longitude once, so each perimeter's bbox prefilter
+    is two binary searches plus a latitude mask over that slice;
+  * the remaining candidates are tested against all edges of the perimeter
+    at once (even-odd crossing test broadcast over points x edges, in
+    chunks), which handles holes and multipolygons without per-point Python.
+"""
+
+import itertools
+import threading
+import time
+
+import numpy as np
+
+MAX_MATRIX = 4_000_000  # points x edges evaluated per chunk
+
+_lock = threading.Lock()
+_cache = {'fires': None, 'modis': None, 'viirs': None, 'result': None}
+# Perimeter edges only change with the fire data, not with each hotspot refresh
+_edge_cache = {'data': None, 'edges': {}}
+
+
+def _ring_array(ring):
+    if len(ring[0]) == 2:
+        # ~2x faster than np.asarray on nested lists
+        return np.fromiter(itertools.chain.from_iterable(ring), dtype=float, count=2 * len(ring)).reshape(-1, 2)
+    return np.asarray(ring, dtype=float)[:, :2]
+
+
+def _edges(geometry):
+    """(x1, y1, x2, y2, bbox) edge arrays over every ring of a Polygon/MultiPolygon."""
+    polygons = geometry['coordinates'] if geometry.get('type') == 'MultiPolygon' else [geometry['coordinates']]
+    rings = [_ring_array(ring) for polygon in polygons for ring in polygon if len(ring) >= 4]
+    if not rings:
+        return None
+    points = np.concatenate(rings)
+    starts = np.concatenate([ring[:-1] for ring in rings])
+    ends = np.concatenate([ring[1:] for ring in rings])
+    bbox = (*points.min(axis=0), *points.max(axis=0))
+    return starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1], bbox
+
+
+def _fire_edges(fire_data):
+    """Edges per fire id for this fire-data version."""
+    with _lock:
+        if _edge_cache['data'] is fire_data:
+            return _edge_cache['edges']
+    edges = {}
+    for fire in fire_data.get('fires', []):
+        geometry = fire.get('geometry')
+        if geometry and geometry.get('coordinates'):
+            fire_edges = _edges(geometry)
+            if fire_edges is not None:
+                edges[str(fire.get('id'))] = fire_edges
+    with _lock:
+        _edge_cache.update(data=fire_data, edges=edges)
+    return edges
+
+
+def points_in_polygon(px, py, edges):
+    """Boolean mask of the points inside a polygon given as edge arrays."""
+    x1, y1, x2, y2 = edges[:4]
+    inside = np.zeros(len(px), dtype=bool)
+    chunk = max(1, MAX_MATRIX // len(x1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(px), chunk):
+            cx = px[start:start + chunk, None]
+            cy = py[start:start + chunk, None]
+            straddles = (y1 > cy) != (y2 > cy)
+            x_cross = x1 + (cy - y1) * (x2 - x1) / (y2 - y1)
+            crossings = np.count_nonzero(straddles & (cx < x_cross), axis=1)
+            inside[start:start + chunk] = crossings % 2 == 1
+    return inside
+
+
+def _hotspot_arrays(modis_data, viirs_data):
+    hotspots = (modis_data or {}).get('hotspots', []) + (viirs_data or {}).get('hotspots', [])
+    lng = np.array([h.get('longitude') for h in hotspots], dtype=float)
+    lat = np.array([h.get('latitude') for h in hotspots], dtype=float)
+    frp = np.array([h.get('intensity') or 0 for h in hotspots], dtype=float)
+    age = np.array([np.inf if h.get('age') is None else h['age'] for h in hotspots], dtype=float)
+    is_modis = np.array([h.get('source') == 'MODIS' for h in hotspots], dtype=bool)
+    return lng, lat, frp, age, is_modis
+
+
+def join(fire_data, modis_data, viirs_data):
+    """Per-fire hotspot activity and the unmatched hotspot count."""
+    started = time.perf_counter()
+    lng, lat, frp, age, is_modis = _hotspot_arrays(modis_data, viirs_data)
+    order = np.argsort(lng, kind='stable')
+    sorted_lng = lng[order]
+    matched = np.zeros(len(lng), dtype=bool)
+
+    activity = {}
+    for fire_id, edges in _fire_edges(fire_data).items():
+        min_lng, min_lat, max_lng, max_lat = edges[4]
+
+        # Bbox prefilter: longitude slice by binary search, then latitude mask
+        lo = np.searchsorted(sorted_lng, min_lng, side='left')
+        hi = np.searchsorted(sorted_lng, max_lng, side='right')
+        candidates = order[lo:hi]
+        candidates = candidates[(lat[candidates] >= min_lat) & (lat[candidates] <= max_lat)]
+
+        hits = candidates[points_in_polygon(lng[candidates], lat[candidates], edges)] if len(candidates) else candidates
+        matched[hits] = True
+        activity[fire_id] = {
+            'hotspots': int(len(hits)),
+            'modis': int(is_modis[hits].sum()),
+            'viirs': int(len(hits) - is_modis[hits].sum()),
+            'frpTotal': round(float(frp[hits].sum()), 2),
+            'newestAge': float(age[hits].min()) if len(hits) and np.isfinite(age[hits].min()) else None,
+        }
+
+    return {
+        'fires': activity,
+        'matched': int(matched.sum()),
+        'unmatched': int(len(matched) - matched.sum()),
+        'joinMs': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def activity_for(fire_data, modis_data, viirs_data):
+    """Memoized join for this combination of fire and hotspot data versions."""
+    with _lock:
+        if (_cache['result'] is not None and _cache['fires'] is fire_data
+                and _cache['modis'] is modis_data and _cache['viirs'] is viirs_data):
+            return _cache['result']
+    result = join(fire_data, modis_data, viirs_data)
+    with _lock:
+        _cache.update(fires=fire_data, modis=modis_data, viirs=viirs_data, result=result)
+    return result
@@ -0,0 +1,120 @@
+"""
+Change log of fire-data versions for the /api/fires/changes delta feed.
+
+    GET /api/fires/changes?since=<version>
+    -> {'version', 'since', 'added': [fire], 'updated': [fire], 'removed': [id], 'resync': False}
+
+Every fire-data version this process serves is diffed against the previous
+one on fire id + content hash, and the difference is kept in a bounded deque
+of MAX_ENTRIES entries. A client passes the version from its last response
+and gets back only the fires added, updated (full record, with geometry) or
+removed since then, folded across however many versions have passed.
+
+If `since` is older than the oldest entry (or from another process whose
+versions this one never saw), the response has 'resync': True and the whole
+current fire list in 'fires', and the client starts over from 'version'.
+
+Versions are the shared snapshot versions in snapshot serving modes, and a
+per-process counter in live mode. A worker that skipped a snapshot version
+records one combined entry for the jump, so cursors stay valid across it.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime
+
+from fire_transform import content_hash
+
+MAX_ENTRIES = 64
+
+_lock = threading.Lock()
+_state = {
+    'data': None,      # fire-data object last observed
+    'version': None,   # its version
+    'hashes': {},      # fire id -> content hash for that version
+    'fires': {},       # fire id -> record for that version
+    'counter': 0,      # live-mode version sequence
+}
+# (from_version, to_version, added ids, updated ids, removed ids), oldest first
+_log = deque(maxlen=MAX_ENTRIES)
+
+
+def observe(fire_data, version=None):
+    """Record fire_data as the current version, diffing it against the last one.
+
+    Returns the version number assigned to fire_data.
+    """
+    with _lock:
+        if fire_data is _state['data']:
+            return _state['version']
+        if version is None:
+            _state['counter'] += 1
+            version = _state['counter']
+        elif version == _state['version']:
+            return version
+
+        fires = {str(fire.get('id')): fire for fire in fire_data.get('fires', [])}
+        hashes = {fire_id: content_hash(fire) for fire_id, fire in fires.items()}
+        previous = _state['hashes']
+
+        if _state['version'] is not None:
+            added = [fire_id for fire_id in hashes if fire_id not in previous]
+            updated = [fire_id for fire_id, h in hashes.items() if fire_id in previous and previous[fire_id] != h]
+            removed = [fire_id for fire_id in previous if fire_id not in hashes]
+            _log.append((_state['version'], version, added, updated, removed))
+
+        _state.update(data=fire_data, version=version, hashes=hashes, fires=fires)
+        return version
+
+
+def _parse_since(since):
+    try:
+        return int(since)
+    except (TypeError, ValueError):
+        return None
+
+
+def changes_since(since):
+    """Delta from version `since` to the current version (see module docstring)."""
+    since = _parse_since(since)
+    with _lock:
+        current = _state['version']
+        fires = _state['fires']
+        entries = list(_log)
+
+    response = {
+        'version': current,
+        'since': since,
+        'timestamp': datetime.now().isoformat()
+    }
+
+    if since == current:
+        response.update(added=[], updated=[], removed=[], resync=False)
+        return response
+
+    start = next((i for i, entry in enumerate(entries) if entry[0] == since), None)
+    if since is None or start is None:
+        response.update(resync=True, fires=list(fires.values()), total=len(fires))
+        return response
+
+    # Fold entries since..current into one net change per fire id
+    status = {}
+    for _, _, added, updated, removed in entries[start:]:
+        for fire_id in added:
+            # Removed then re-added within the window: the client still has it
+            status[fire_id] = 'updated' if status.get(fire_id) == 'removed' else 'added'
+        for fire_id in updated:
+            status[fire_id] = status.get(fire_id) if status.get(fire_id) == 'added' else 'updated'
+        for fire_id in removed:
+            if status.get(fire_id) == 'added':
+                del status[fire_id]  # appeared and vanished in between: client never saw it
+            else:
+                status[fire_id] = 'removed'
+
+    response.update(
+        added=[fires[fire_id] for fire_id, s in status.items() if s == 'added'],
+        updated=[fires[fire_id] for fire_id, s in status.items() if s == 'updated'],
+        removed=[fire_id for fire_id, s in status.items() if s == 'removed'],
+        resync=False
+    )
+    return response
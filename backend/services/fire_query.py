@@ -0,0 +1,267 @@
+"""
+Field projection, filtering, sorting and cursor pagination for /api/fires.
+
+    /api/fires?fields=summary&geometry=none&severity=High,Medium&min_size=1000
+              &sort=-size&limit=50&cursor=<nextCursor from the previous page>
+
+With geometry=full, ?zoom= or ?tolerance= swaps in simplified perimeters
+from the precomputed LOD levels (see geometry_lod).
+
+Everything that does not depend on the filters is built once per fire-data
+version and reused: the projected records for each (fields, geometry) pair
+and the sorted order for each sort key. A request then only filters indices,
+slices a page and picks pre-built records, so summary pages for the list
+view cost almost nothing to produce. Geometry for one fire is fetched from
+/api/fires/<id>.
+
+Building a projection for a new version doesn't redo geometry work for
+unchanged perimeters: LOD levels and bboxes come from fire_transform's
+`perimeter_cache`, keyed by geometry hash rather than by version.
+"""
+
+import base64
+import json
+import threading
+from datetime import datetime
+
+from fire_transform import cached_bbox
+from geometry_lod import level_from_args, lod_geometry
+
+SUMMARY_FIELDS = ('id', 'name', 'lat', 'lng', 'size', 'severity', 'containment')
+ALL_FIELDS = ('id', 'name', 'lat', 'lng', 'size', 'containment', 'severity', 'lastUpdate', 'weather')
+GEOMETRY_MODES = ('none', 'bbox', 'full')
+SORT_KEYS = ('id', 'name', 'size', 'containment', 'severity', 'lastUpdate')
+SEVERITY_RANK = {'Low': 0, 'Medium': 1, 'High': 2}
+MAX_LIMIT = 1000
+MAX_CACHED_VIEWS = 16
+
+_lock = threading.Lock()
+_state = {'data': None, 'projections': {}, 'orders': {}, 'positions': {}}
+
+
+class QueryError(ValueError):
+    """Invalid query parameter; reported to the client as a 400."""
+
+
+def _parse_float(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise QueryError(f"'{name}' must be a number")
+
+
+def parse_query(args):
+    """Validate request args into a query dict."""
+    fields = args.get('fields', 'all')
+    if fields == 'summary':
+        fields = SUMMARY_FIELDS
+    elif fields == 'all':
+        fields = ALL_FIELDS
+    else:
+        fields = tuple(f for f in fields.split(',') if f)
+        unknown = [f for f in fields if f not in ALL_FIELDS]
+        if unknown:
+            raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+        if 'id' not in fields:
+            fields = ('id',) + fields  # cursors need the id
+
+    geometry = args.get('geometry', 'full' if args.get('fields') in (None, 'all') else 'none')
+    if geometry not in GEOMETRY_MODES:
+        raise QueryError(f"'geometry' must be one of {', '.join(GEOMETRY_MODES)}")
+
+    sort = args.get('sort', 'id')
+    if sort.lstrip('-') not in SORT_KEYS:
+        raise QueryError(f"'sort' must be one of {', '.join(SORT_KEYS)} (prefix with - for descending)")
+
+    severity = args.get('severity')
+    severities = set(severity.split(',')) if severity else None
+
+    updated_since = args.get('updated_since')
+    if updated_since:
+        try:
+            datetime.fromisoformat(updated_since)
+        except ValueError:
+            raise QueryError("'updated_since' must be an ISO 8601 timestamp")
+
+    limit = args.get('limit')
+    if limit not in (None, ''):
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise QueryError("'limit' must be an integer")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise QueryError(f"'limit' must be between 1 and {MAX_LIMIT}")
+    else:
+        limit = None
+
+    cursor = args.get('cursor')
+    if cursor:
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise QueryError("Invalid 'cursor'")
+        # Values are compared against fire ids and sort keys, so only what _encode_cursor writes is accepted
+        if (not isinstance(cursor, dict) or not isinstance(cursor.get('id'), str)
+                or not isinstance(cursor.get('k'), (str, int, float, type(None)))):
+            raise QueryError("Invalid 'cursor'")
+
+    try:
+        lod = level_from_args(args)
+    except ValueError as e:
+        raise QueryError(str(e))
+
+    return {
+        'fields': fields,
+        'geometry': geometry,
+        'lod': lod,
+        'sort': sort,
+        'severity': severities,
+        'min_size': _parse_float(args, 'min_size'),
+        'max_size': _parse_float(args, 'max_size'),
+        'min_containment': _parse_float(args, 'min_containment'),
+        'max_containment': _parse_float(args, 'max_containment'),
+        'updated_since': updated_since,
+        'limit': limit,
+        'cursor': cursor,
+    }
+
+
+def _sort_value(fire, key):
+    value = fire.get(key)
+    if key == 'severity':
+        value = SEVERITY_RANK.get(value)
+    elif key == 'id':
+        value = str(value)
+    return value
+
+
+def _sort_key(fire, key):
+    # Missing values always sort last, whichever direction is requested.
+    value = _sort_value(fire, key)
+    return (value is None, value if value is not None else 0, str(fire.get('id')))
+
+
+def _project(fire_data, fire, fields, geometry, lod):
+    record = {field: fire.get(field) for field in fields}
+    if geometry == 'full':
+        record['geometry'] = lod_geometry(fire_data, fire, lod)
+    elif geometry == 'bbox':
+        record['bbox'] = cached_bbox(fire.get('geometry'))
+    return record
+
+
+def _views_for(fire_data):
+    """Per-version caches; reset whenever a new fire-data object is served."""
+    if _state['data'] is not fire_data:
+        _state.update(data=fire_data, projections={}, orders={}, positions={})
+    return _state
+
+
+def _projection(state, fires, fields, geometry, lod):
+    key = (fields, geometry, lod if geometry == 'full' else None)
+    projected = state['projections'].get(key)
+    if projected is None:
+        if len(state['projections']) >= MAX_CACHED_VIEWS:
+            state['projections'].pop(next(iter(state['projections'])))
+        projected = [_project(state['data'], fire, fields, geometry, lod) for fire in fires]
+        state['projections'][key] = projected
+    return projected
+
+
+def _order(state, fires, sort):
+    order = state['orders'].get(sort)
+    if order is None:
+        key = sort.lstrip('-')
+        ascending = sorted(range(len(fires)), key=lambda i: _sort_key(fires[i], key))
+        if sort.startswith('-'):
+            # Reverse the present values but keep missing ones at the end
+            present = [i for i in ascending if _sort_value(fires[i], key) is not None]
+            missing = [i for i in ascending if _sort_value(fires[i], key) is None]
+            order = present[::-1] + missing
+        else:
+            order = ascending
+        state['orders'][sort] = order
+        state['positions'][sort] = {str(fires[i].get('id')): pos for pos, i in enumerate(order)}
+    return order, state['positions'][sort]
+
+
+def _matches(fire, query):
+    if query['severity'] and fire.get('severity') not in query['severity']:
+        return False
+    size = fire.get('size') or 0
+    if query['min_size'] is not None and size < query['min_size']:
+        return False
+    if query['max_size'] is not None and size > query['max_size']:
+        return False
+    containment = fire.get('containment')
+    if query['min_containment'] is not None and (containment is None or containment < query['min_containment']):
+        return False
+    if query['max_containment'] is not None and (containment is None or containment > query['max_containment']):
+        return False
+    if query['updated_since'] and (fire.get('lastUpdate') or '') < query['updated_since']:
+        return False
+    return True
+
+
+def _encode_cursor(fire, sort):
+    payload = {'id': str(fire.get('id')), 'sort': sort, 'k': _sort_value(fire, sort.lstrip('-'))}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def _comes_after(fire, cursor, sort):
+    """Whether `fire` sorts strictly after the cursor position in `sort` order."""
+    key = sort.lstrip('-')
+    value, fire_id = _sort_value(fire, key), str(fire.get('id'))
+    cursor_value, cursor_id = cursor.get('k'), cursor.get('id')
+    if (value is None) != (cursor_value is None):
+        return value is None  # missing values come last in both directions
+    if value is None:
+        return fire_id > cursor_id
+    try:
+        if sort.startswith('-'):
+            return (value, fire_id) < (cursor_value, cursor_id)
+        return (value, fire_id) > (cursor_value, cursor_id)
+    except TypeError:
+        raise QueryError("Invalid 'cursor'")
+
+
+def query_fires(fire_data, args):
+    """Run a /api/fires query against the current fire data."""
+    query = parse_query(args)
+    fires = fire_data.get('fires', [])
+
+    with _lock:
+        state = _views_for(fire_data)
+        projected = _projection(state, fires, query['fields'], query['geometry'], query['lod'])
+        order, positions = _order(state, fires, query['sort'])
+
+    matched = [i for i in order if _matches(fires[i], query)]
+    total = len(matched)
+
+    cursor = query['cursor']
+    if cursor:
+        if cursor.get('sort') != query['sort']:
+            raise QueryError("'cursor' was issued for a different sort order")
+        if cursor.get('id') in positions:
+            start = positions[cursor['id']] + 1
+            matched = [i for i in matched if positions[str(fires[i].get('id'))] >= start]
+        else:
+            # The cursor's fire dropped out since the last page (new data
+            # version); resume at the first fire that sorts after it.
+            matched = [i for i in matched if _comes_after(fires[i], cursor, query['sort'])]
+
+    page = matched[:query['limit']] if query['limit'] else matched
+    next_cursor = None
+    if query['limit'] and len(matched) > len(page):
+        next_cursor = _encode_cursor(fires[page[-1]], query['sort'])
+
+    return {
+        'fires': [projected[i] for i in page],
+        'count': len(page),
+        'total': total,
+        'nextCursor': next_cursor,
+        'timestamp': fire_data.get('timestamp')
+    }
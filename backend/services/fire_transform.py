@@ -0,0 +1,392 @@
+"""
+Shared transforms from raw ArcGIS features to the fire / hotspot records we serve.
+
+Both the live API (fire_service, satellite_service) and the static snapshot
+generator (scripts/generate_data.py) build their output with these functions,
+so the two paths cannot drift apart again. Payload envelopes differ between
+the two ({'fires', 'total', 'timestamp'} vs {'generatedAt', 'count', 'fires'})
+but the records inside are identical.
+
+Geometry-derived values (rounded geometry, center, bbox, simplified LOD
+levels, and the encoded geometry history_store stores) are memoized in
+`perimeter_cache`, keyed by a hash of the raw coordinates: most WFIGS
+perimeters are unchanged from one refresh to the next, and hashing a ring's
+coordinates through numpy costs a fraction of re-deriving them. Entries for
+perimeters that drop out of the feed are evicted at the end of each refresh,
+and the reuse rate is logged. Cached geometries are shared between
+refreshes, so they must not be mutated.
+
+Entries are also indexed by the hash of the served (rounded) geometry, so
+code that only sees fire records - LOD levels (geometry_lod), bboxes
+(fire_query) - finds them too. With a `path` (FLAMEFLUX_PERIMETER_CACHE for
+the API; scripts/generate_data.py defaults to backend/cache/) the cache
+is loaded on first use and saved after each refresh, so separate runs reuse
+each other's work. Processes that never build fire records (shared-mode
+workers) don't load it.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import coverage
+from utils.profiling import stage
+
+COORD_PRECISION = 5  # decimal degrees (~1.1 m) - plenty for fire perimeters, keeps payloads small
+LATEST_WINDOW_HOURS = 48  # perimeters older than this are not considered current
+
+# VIIRS reports confidence as a category ("low"/"nominal"/"high") rather than
+# a 0-100 score like MODIS; map it so the heatmap can weight points sensibly
+# instead of treating every VIIRS hotspot as zero-confidence.
+VIIRS_CONFIDENCE_MAP = {'low': 30, 'nominal': 70, 'high': 90}
+MODIS_MIN_CONFIDENCE = 80
+PERIMETER_CACHE_PATH = os.environ.get('FLAMEFLUX_PERIMETER_CACHE') or None
+PERIMETER_CACHE_FORMAT = 1
+
+
+def round_coords(obj):
+    """Recursively round every number in a nested coordinate array."""
+    if isinstance(obj, (int, float)):
+        return round(obj, COORD_PRECISION)
+    if isinstance(obj, list):
+        return [round_coords(x) for x in obj]
+    return obj
+
+
+def calc_center(coordinates, geom_type):
+    """Mean of the outer-ring vertices, as [lng, lat]."""
+    all_coords = []
+    if geom_type == 'Polygon':
+        all_coords = coordinates[0]
+    elif geom_type == 'MultiPolygon':
+        for polygon in coordinates:
+            all_coords.extend(polygon[0])
+    if not all_coords:
+        return None
+    lng_sum = sum(c[0] for c in all_coords)
+    lat_sum = sum(c[1] for c in all_coords)
+    return [lng_sum / len(all_coords), lat_sum / len(all_coords)]
+
+
+def geometry_bbox(geometry):
+    """[min_lng, min_lat, max_lng, max_lat] of a Polygon/MultiPolygon, or None."""
+    if not geometry or not geometry.get('coordinates'):
+        return None
+    polygons = geometry['coordinates'] if geometry.get('type') == 'MultiPolygon' else [geometry['coordinates']]
+    xs, ys = [], []
+    for polygon in polygons:
+        for ring in polygon:
+            xs.extend(c[0] for c in ring)
+            ys.extend(c[1] for c in ring)
+    if not xs:
+        return None
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def geometry_key(geometry):
+    """Fast 128-bit digest of a geometry's raw coordinates (ring bytes through numpy)."""
+    digest = hashlib.blake2b(str(geometry.get('type')).encode('utf-8'), digest_size=16)
+    try:
+        polygons = geometry['coordinates'] if geometry.get('type') == 'MultiPolygon' else [geometry['coordinates']]
+        for polygon in polygons:
+            digest.update(len(polygon).to_bytes(4, 'little'))
+            for ring in polygon:
+                points = np.asarray(ring, dtype=float)
+                digest.update(len(points).to_bytes(4, 'little'))
+                digest.update(points.tobytes())
+    except (ValueError, TypeError):  # ragged or unexpected nesting
+        digest.update(json.dumps(geometry.get('coordinates'), separators=(',', ':')).encode('utf-8'))
+    return digest.digest()
+
+
+class PerimeterCache:
+    """Geometry-derived fire data memoized across refreshes (and runs, with a path) by geometry_key."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._served = {}  # geometry_key of the rounded geometry -> entry
+        self._seen = set()
+        self._hits = 0
+        self._misses = 0
+        self._loaded = False
+        self._dirty = False
+
+    def get(self, geometry):
+        """{'geometry' (rounded), 'center', 'bbox', 'lod'} of a perimeter, or None without coordinates."""
+        coords = geometry.get('coordinates') if geometry else None
+        if not coords:
+            return None
+        if self.path and not self._loaded:
+            self.load()
+        key = geometry_key(geometry)
+        with self._lock:
+            entry = self._entries.get(key)
+            # Count each perimeter once per refresh, however many steps look it up
+            if key not in self._seen:
+                self._seen.add(key)
+                if entry is None:
+                    self._misses += 1
+                else:
+                    self._hits += 1
+        if entry is None:
+            rounded = {'type': geometry.get('type'), 'coordinates': round_coords(coords)}
+            entry = {
+                'geometry': rounded,
+                'center': calc_center(coords, geometry.get('type')),
+                'bbox': geometry_bbox(rounded),
+                'lod': {},  # LOD level -> simplified geometry, filled by geometry_lod
+                'servedKey': geometry_key(rounded),
+            }
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = entry
+                    self._served[entry['servedKey']] = entry
+                    self._dirty = True
+                entry = self._entries[key]
+        return entry
+
+    def served(self, geometry):
+        """The entry whose rounded geometry is `geometry` (a served fire's), or None."""
+        if not geometry or not geometry.get('coordinates'):
+            return None
+        key = geometry_key(geometry)
+        with self._lock:
+            return self._served.get(key)
+
+    def add_lod(self, entry, level, geometry):
+        """Store an LOD level computed for an entry (saved with it)."""
+        with self._lock:
+            entry['lod'][level] = geometry
+            self._dirty = True
+
+    def sweep(self):
+        """End a refresh: evict perimeters not looked up since the last sweep and return its reuse stats."""
+        with self._lock:
+            stale = self._entries.keys() - self._seen
+            for key in stale:
+                self._served.pop(self._entries.pop(key)['servedKey'], None)
+            self._dirty = self._dirty or bool(stale)
+            stats = {'reused': self._hits, 'computed': self._misses, 'evicted': len(stale),
+                     'entries': len(self._entries)}
+            self._seen = set()
+            self._hits = self._misses = 0
+        return stats
+
+    def load(self):
+        """Merge the entries saved at `path` into the cache; returns how many were loaded."""
+        self._loaded = True
+        try:
+            with open(self.path, 'rb') as fh:
+                stored = json.loads(gzip.decompress(fh.read()))
+            if stored.get('format') != PERIMETER_CACHE_FORMAT:
+                return 0
+            entries = {
+                bytes.fromhex(key): {
+                    'geometry': value['geometry'],
+                    'center': value['center'],
+                    'bbox': value['bbox'],
+                    'lod': {int(level): geometry for level, geometry in value['lod'].items()},
+                    'servedKey': bytes.fromhex(value['servedKey']),
+                }
+                for key, value in stored['entries'].items()
+            }
+        except FileNotFoundError:
+            return 0
+        except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError) as e:  # BadGzipFile is an OSError
+            print(f"Perimeter cache: ignoring unreadable {self.path}: {e}")
+            return 0
+        with self._lock:
+            for key, entry in entries.items():
+                if key not in self._entries:
+                    self._entries[key] = entry
+                    self._served[entry['servedKey']] = entry
+        return len(entries)
+
+    def save(self):
+        """Write the cache to `path` (atomically) if anything changed since the last save."""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return False
+            stored = {
+                'format': PERIMETER_CACHE_FORMAT,
+                'entries': {
+                    key.hex(): {
+                        'geometry': entry['geometry'],
+                        'center': entry['center'],
+                        'bbox': entry['bbox'],
+                        'lod': {str(level): geometry for level, geometry in entry['lod'].items()},
+                        'servedKey': entry['servedKey'].hex(),
+                    }
+                    for key, entry in self._entries.items()
+                },
+            }
+            self._dirty = False
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            body = json.dumps(stored, separators=(',', ':')).encode('utf-8')
+            with open(tmp, 'wb') as fh:
+                fh.write(gzip.compress(body, compresslevel=1))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Perimeter cache: failed to save {self.path}: {e}")
+            self._dirty = True
+            return False
+        return True
+
+
+perimeter_cache = PerimeterCache(PERIMETER_CACHE_PATH)
+
+
+def cached_bbox(geometry):
+    """geometry_bbox of a served (rounded) geometry, from its perimeter_cache entry when there is one."""
+    entry = perimeter_cache.served(geometry)
+    return entry['bbox'] if entry is not None else geometry_bbox(geometry)
+
+
+def encoded_geometry(entry):
+    """(compact JSON, 16-byte blake2b digest) of a perimeter_cache entry's rounded geometry, memoized."""
+    if 'encoded' not in entry:
+        encoded = json.dumps(entry['geometry'], separators=(',', ':'))
+        entry['digest'] = hashlib.blake2b(encoded.encode(), digest_size=16).digest()
+        entry['encoded'] = encoded
+    return entry['encoded'], entry['digest']
+
+
+def content_hash(record):
+    """Stable digest of a JSON-serializable record, for change detection."""
+    payload = json.dumps(record, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def severity_from_size(area):
+    if area >= 10000:
+        return 'High'
+    if area >= 1000:
+        return 'Medium'
+    return 'Low'
+
+
+def covered_features(features):
+    """Point features that fall in the supported area (coverage mask), tested in one batch."""
+    if not features:
+        return []
+    coords = np.array([val['geometry']['coordinates'][:2] for val in features], dtype=float)
+    keep = coverage.contains(coords[:, 1], coords[:, 0])
+    return [val for val, inside in zip(features, keep.tolist()) if inside]
+
+
+def get_latest_fires_by_name(features, window_hours=LATEST_WINDOW_HOURS):
+    """Keep only the most recent perimeter per incident within the window."""
+    fire_map = {}
+    cutoff = datetime.now().timestamp() * 1000 - (window_hours * 60 * 60 * 1000)
+    for feature in features:
+        props = feature.get('properties') or {}
+        name = props.get('poly_IncidentName') or props.get('incident_name')
+        date_ms = props.get('poly_DateCurrent') or 0
+        if not name or date_ms < cutoff:
+            continue
+        existing = fire_map.get(name)
+        if existing is None or date_ms > ((existing.get('properties') or {}).get('poly_DateCurrent') or 0):
+            fire_map[name] = feature
+    return list(fire_map.values())
+
+
+def containment_from_props(props):
+    """Incident containment first, then perimeter, then the legacy field."""
+    for key in ('attr_PercentContained', 'poly_PercentContained', 'percent_contained'):
+        if props.get(key) is not None:
+            return props.get(key)
+    return None
+
+
+def build_fire(feature, i):
+    """One WFIGS perimeter feature -> fire record, or None if it can't be placed."""
+    props = feature.get('properties') or {}
+    derived = perimeter_cache.get(feature.get('geometry'))
+    if not derived or not derived['center']:
+        return None
+    center = derived['center']
+
+    epoch_ms = props.get('poly_DateCurrent')
+    last_update = datetime.fromtimestamp(epoch_ms / 1000).isoformat() if epoch_ms else None
+    area = round(props.get('poly_Acres_AutoCalc') or 0)
+
+    return {
+        'id': props.get('OBJECTID') or f'fire_{i + 1}',
+        'name': props.get('poly_IncidentName') or f'Fire_{i + 1}',
+        'lat': center[1],
+        'lng': center[0],
+        'size': area,
+        'containment': containment_from_props(props),
+        'severity': severity_from_size(area),
+        'lastUpdate': last_update,
+        'weather': None,
+        'geometry': derived['geometry'],
+    }
+
+
+def process_fire_features(features):
+    """Latest-per-incident, placeable fire records inside the coverage mask, from raw WFIGS features."""
+    with stage('get_latest_fires_by_name'):
+        latest = get_latest_fires_by_name(features)
+    with stage('process_features'):
+        fires = [fire for fire in (build_fire(feature, i) for i, feature in enumerate(latest)) if fire is not None]
+    with stage('coverage'):
+        if fires:
+            keep = coverage.contains([fire['lat'] for fire in fires], [fire['lng'] for fire in fires])
+            fires = [fire for fire, inside in zip(fires, keep.tolist()) if inside]
+
+    stats = perimeter_cache.sweep()
+    seen = stats['reused'] + stats['computed']
+    if seen:
+        print(f"Perimeter cache: {stats['reused']}/{seen} perimeters reused ({stats['reused'] / seen:.0%}), "
+              f"{stats['computed']} computed, {stats['evicted']} evicted")
+    perimeter_cache.save()
+    return fires
+
+
+def process_modis_features(features):
+    """High-confidence hotspot records inside the coverage mask, from raw MODIS features."""
+    hotspots = []
+    for val in covered_features(features):
+        props = val.get('properties') or {}
+        lng, lat = val['geometry']['coordinates'][0], val['geometry']['coordinates'][1]
+        confidence = props.get('CONFIDENCE')
+        if confidence is None or confidence < MODIS_MIN_CONFIDENCE:
+            continue
+        hotspots.append({
+            'id': val.get('id'),
+            'latitude': lat,
+            'longitude': lng,
+            'age': props.get('HOURS_OLD'),
+            'confidence': confidence,
+            'intensity': props.get('FRP'),
+            'source': 'MODIS',
+        })
+    return hotspots
+
+
+def process_viirs_features(features):
+    """Hotspot records inside the coverage mask from raw VIIRS features, with categorical confidence mapped to 0-100."""
+    hotspots = []
+    for val in covered_features(features):
+        props = val.get('properties') or {}
+        lng, lat = val['geometry']['coordinates'][0], val['geometry']['coordinates'][1]
+        hotspots.append({
+            'id': val.get('id'),
+            'latitude': lat,
+            'longitude': lng,
+            'age': props.get('hours_old'),
+            'confidence': VIIRS_CONFIDENCE_MAP.get(str(props.get('confidence')).lower(), 70),
+            'intensity': props.get('frp'),
+            'source': 'VIIRS',
+        })
+    return hotspots
@@ -0,0 +1,250 @@
+"""
+Zoom-dependent level-of-detail (LOD) geometry for fire perimeters.
+
+WFIGS perimeters carry thousands of vertices that are invisible at national
+zoom. Each perimeter can be simplified to a small, fixed set of levels
+(Douglas-Peucker per ring, vectorized with numpy). Every level of every
+fire is built once per refresh, off the request path: `prepare` runs
+`build_levels` on a background thread whenever a process gets a new
+fire-data version (app.py calls it on each live refresh, and snapshot-mode
+workers on the first parse of a new version). A request that arrives before
+the build reaches its fire computes that level itself.
+
+Levels are stored on the perimeter's fire_transform `perimeter_cache` entry,
+which is keyed by geometry hash: an unchanged perimeter keeps its levels
+across refreshes (and, with a persisted cache, across generator runs). Each
+fire's entry is looked up once per fire-data version; perimeters the cache
+doesn't hold (shared-mode workers, which never build fire records) are
+memoized for that version only.
+
+Simplification keeps each ring valid for rendering:
+  * every ring stays closed and keeps at least 4 positions;
+  * outer rings are never dropped; holes smaller than the tolerance are;
+  * if simplifying a ring flips its orientation, changes its area by more
+    than MAX_AREA_CHANGE or makes it cross itself, a finer tolerance is
+    tried for that ring, and failing those the ring is kept as is.
+
+Rings are simplified independently, so this is not topology-preserving
+across rings: a simplified hole can cross its simplified shell, and
+neighbouring polygons of a MultiPolygon can overlap. Both are rare at
+these tolerances and only affect rendering.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fire_transform import perimeter_cache
+
+# Tolerance in degrees per LOD level (level 0 is the coarsest).
+LOD_TOLERANCES = (0.01, 0.003, 0.0008, 0.0002)
+# Highest zoom served by each level; above the last one the full geometry is used.
+LOD_MAX_ZOOM = (5, 8, 10, 12)
+MAX_AREA_CHANGE = 0.5
+
+_lock = threading.Lock()
+_cache = {'data': None, 'fires': {}}
+_prepared = {'data': None, 'future': None}
+_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geometry-lod')
+
+
+def level_for_zoom(zoom):
+    """LOD level for a web-map zoom, or None for full detail."""
+    for level, max_zoom in enumerate(LOD_MAX_ZOOM):
+        if zoom <= max_zoom:
+            return level
+    return None
+
+
+def level_for_tolerance(tolerance):
+    """Coarsest precomputed level whose tolerance does not exceed the request."""
+    for level, level_tolerance in enumerate(LOD_TOLERANCES):
+        if level_tolerance <= tolerance:
+            return level
+    return None
+
+
+def level_from_args(args):
+    """LOD level from ?zoom= or ?tolerance= request args (None = full geometry)."""
+    zoom = args.get('zoom')
+    tolerance = args.get('tolerance')
+    try:
+        if zoom not in (None, ''):
+            return level_for_zoom(float(zoom))
+        if tolerance not in (None, ''):
+            return level_for_tolerance(float(tolerance))
+    except ValueError:
+        raise ValueError("'zoom' and 'tolerance' must be numbers")
+    return None
+
+
+def _douglas_peucker(points, tolerance):
+    """Indices-preserving DP simplification of an (n, 2) array."""
+    n = len(points)
+    if n < 3:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        inner = points[start + 1:end]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            dist = np.abs(dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def _signed_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def _self_intersects(points):
+    """Whether a closed ring's edges properly cross each other (x-sorted sweep, vectorized)."""
+    a, b = points[:-1], points[1:]
+    m = len(a)
+    if m < 4:
+        return False
+    x_min, x_max = np.minimum(a[:, 0], b[:, 0]), np.maximum(a[:, 0], b[:, 0])
+    order = np.argsort(x_min, kind='stable')
+    # For each edge in x_min order, the later edges starting within its x range
+    ends = np.searchsorted(x_min[order], x_max[order], side='right')
+    counts = np.maximum(ends - np.arange(1, m + 1), 0)
+    total = int(counts.sum())
+    if not total:
+        return False
+    i = np.repeat(order, counts)
+    starts = np.repeat(np.arange(1, m + 1) - np.cumsum(counts) + counts, counts)
+    j = order[starts + np.arange(total)]
+
+    y_min, y_max = np.minimum(a[:, 1], b[:, 1]), np.maximum(a[:, 1], b[:, 1])
+    gap = np.abs(i - j)
+    keep = (y_min[i] <= y_max[j]) & (y_min[j] <= y_max[i]) & (gap != 1) & (gap != m - 1)
+    i, j = i[keep], j[keep]
+
+    def cross(o, p, q):
+        return (p[:, 0] - o[:, 0]) * (q[:, 1] - o[:, 1]) - (p[:, 1] - o[:, 1]) * (q[:, 0] - o[:, 0])
+
+    ai, bi, aj, bj = a[i], b[i], a[j], b[j]
+    return bool(np.any((cross(ai, bi, aj) * cross(ai, bi, bj) < 0) & (cross(aj, bj, ai) * cross(aj, bj, bi) < 0)))
+
+
+def simplify_ring(ring, tolerance, is_outer):
+    """Simplified ring as a list, or None if a hole vanishes at this tolerance."""
+    points = np.asarray(ring, dtype=float)
+    if len(points) <= 4:
+        return ring
+    original_area = _signed_area(points)
+    if not is_outer and abs(original_area) < tolerance * tolerance:
+        return None
+
+    # Fall back through finer tolerances until the ring stays valid.
+    for tol in (tolerance, tolerance / 4, tolerance / 16):
+        simplified = _douglas_peucker(points, tol)
+        if len(simplified) < 4:
+            continue
+        area = _signed_area(simplified)
+        if original_area and (area * original_area <= 0
+                              or abs(area - original_area) > MAX_AREA_CHANGE * abs(original_area)):
+            continue
+        if _self_intersects(simplified):
+            continue
+        return simplified.tolist()
+    return ring
+
+
+def simplify_geometry(geometry, tolerance):
+    """Simplify a Polygon/MultiPolygon GeoJSON geometry ring by ring."""
+    if not geometry or not geometry.get('coordinates'):
+        return geometry
+
+    def simplify_polygon(polygon):
+        rings = []
+        for i, ring in enumerate(polygon):
+            simplified = simplify_ring(ring, tolerance, is_outer=(i == 0))
+            if simplified is not None:
+                rings.append(simplified)
+        return rings
+
+    if geometry.get('type') == 'Polygon':
+        coordinates = simplify_polygon(geometry['coordinates'])
+    elif geometry.get('type') == 'MultiPolygon':
+        coordinates = [simplify_polygon(polygon) for polygon in geometry['coordinates']]
+    else:
+        return geometry
+    return {'type': geometry['type'], 'coordinates': coordinates}
+
+
+def lod_geometry(fire_data, fire, level):
+    """A fire's geometry at an LOD level, from its perimeter_cache entry or memoized for this fire-data version."""
+    geometry = fire.get('geometry')
+    if level is None or not geometry:
+        return geometry
+
+    key = str(fire.get('id'))
+    with _lock:
+        if _cache['data'] is not fire_data:
+            _cache.update(data=fire_data, fires={})
+        entry = _cache['fires'].get(key)
+    if entry is None:
+        entry = perimeter_cache.served(geometry) or {'lod': {}}
+        with _lock:
+            if _cache['data'] is fire_data:
+                entry = _cache['fires'].setdefault(key, entry)
+    simplified = entry['lod'].get(level)
+    if simplified is not None:
+        return simplified
+
+    simplified = simplify_geometry(geometry, LOD_TOLERANCES[level])
+    if 'servedKey' in entry:
+        perimeter_cache.add_lod(entry, level, simplified)
+    else:
+        with _lock:
+            entry['lod'][level] = simplified
+    return simplified
+
+
+
+def build_levels(fire_data):
+    """Build every LOD level of every fire in this fire-data version; returns how many fires."""
+    fires = [fire for fire in fire_data.get('fires', []) if fire.get('geometry')]
+    for fire in fires:
+        for level in range(len(LOD_TOLERANCES)):
+            lod_geometry(fire_data, fire, level)
+    return len(fires)
+
+
+def prepare(fire_data):
+    """Build the levels for a new fire-data version on the background thread (once per version)."""
+    with _lock:
+        if fire_data is None or _prepared['data'] is fire_data:
+            return _prepared['future']
+
+    def build():
+        try:
+            started = time.perf_counter()
+            count = build_levels(fire_data)
+            print(f"LOD: built {len(LOD_TOLERANCES)} levels for {count} fires "
+                  f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        except Exception as e:
+            print(f"LOD: failed to build levels: {e}")
+
+    future = _builder.submit(build)
+    with _lock:
+        _prepared.update(data=fire_data, future=future)
+    return future
@@ -0,0 +1,274 @@
+"""
+Append-only history of perimeter versions and hotspots (SQLite + R*Tree).
+
+`get_latest_fires_by_name` keeps only the newest perimeter per incident and
+every refresh replaces the previous data, so the API could never answer
+"how did this fire grow?". Each refresh now also appends what it fetched:
+
+  * every raw WFIGS perimeter feature (before latest-per-incident filtering),
+    deduplicated on (incident, poly_DateCurrent, geometry hash);
+  * every processed MODIS/VIIRS hotspot, deduplicated on source + position
+    within an hour of an already stored detection (feeds only report
+    HOURS_OLD, so the derived detection time jitters between refreshes).
+
+Reads are indexed: perimeter versions by (incident_key, observed_at), and
+both tables have an R*Tree on their bounding boxes for area queries. Rows
+older than RETENTION_DAYS are pruned after each append.
+
+Recording never raises: a history failure is logged and the refresh goes on.
+Only processes that fetch upstream write history (live and shared modes).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from fire_transform import containment_from_props, encoded_geometry, perimeter_cache
+
+HISTORY_DB = os.environ.get(
+    'FLAMEFLUX_HISTORY_DB',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'history', 'history.sqlite3')
+)
+RETENTION_DAYS = float(os.environ.get('FLAMEFLUX_HISTORY_DAYS', 180))
+HOTSPOT_DEDUP_MS = 60 * 60 * 1000
+MAX_HISTORY_ROWS = 5000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS perimeters (
+    id INTEGER PRIMARY KEY,
+    incident_key TEXT NOT NULL,
+    object_id INTEGER,
+    name TEXT,
+    observed_at INTEGER NOT NULL,
+    acres REAL,
+    containment REAL,
+    geom_hash BLOB NOT NULL,
+    geometry TEXT NOT NULL,
+    ingested_at INTEGER NOT NULL,
+    UNIQUE (incident_key, observed_at, geom_hash)
+);
+CREATE INDEX IF NOT EXISTS perimeters_object ON perimeters (object_id);
+CREATE INDEX IF NOT EXISTS perimeters_observed ON perimeters (observed_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS perimeters_rtree USING rtree (id, min_lng, max_lng, min_lat, max_lat);
+
+CREATE TABLE IF NOT EXISTS hotspots (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    observed_at INTEGER NOT NULL,
+    confidence REAL,
+    intensity REAL,
+    ingested_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hotspots_position ON hotspots (source, lat, lng, observed_at);
+CREATE INDEX IF NOT EXISTS hotspots_observed ON hotspots (observed_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS hotspots_rtree USING rtree (id, min_lng, max_lng, min_lat, max_lat);
+'''
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect():
+    """Per-thread connection (sqlite3 connections are not shareable across threads)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(HISTORY_DB), exist_ok=True)
+        conn = sqlite3.connect(HISTORY_DB, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with _schema_lock:
+            if HISTORY_DB not in _schema_ready:
+                conn.executescript(SCHEMA)
+                _schema_ready.add(HISTORY_DB)
+        _local.conn = conn
+    return conn
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def incident_key(props):
+    """Stable incident identity: IRWIN id when present, else the incident name."""
+    irwin = props.get('poly_IrwinID') or props.get('attr_IrwinID') or props.get('irwin_id')
+    if irwin:
+        return 'irwin:' + str(irwin).strip('{}').upper()
+    name = props.get('poly_IncidentName') or props.get('incident_name')
+    return 'name:' + name.strip().lower() if name else None
+
+
+def _prune(conn, table):
+    cutoff = _now_ms() - int(RETENTION_DAYS * 86400 * 1000)
+    conn.execute(f'DELETE FROM {table}_rtree WHERE id IN (SELECT id FROM {table} WHERE observed_at < ?)', (cutoff,))
+    conn.execute(f'DELETE FROM {table} WHERE observed_at < ?', (cutoff,))
+
+
+def _perimeter_row(feature, ingested_at):
+    props = feature.get('properties') or {}
+    geometry = feature.get('geometry') or {}
+    key = incident_key(props)
+    observed_at = props.get('poly_DateCurrent')
+    if not key or not observed_at or not geometry.get('coordinates'):
+        return None
+    derived = perimeter_cache.get(geometry)  # shared with build_fire, see fire_transform
+    bbox = derived['bbox']
+    if bbox is None:
+        return None
+    encoded, digest = encoded_geometry(derived)
+    return (
+        (key, props.get('OBJECTID'), props.get('poly_IncidentName'), int(observed_at),
+         props.get('poly_Acres_AutoCalc'), containment_from_props(props),
+         digest, encoded, ingested_at),
+        bbox,
+    )
+
+
+def record_perimeters(features):
+    """Append new perimeter versions from raw WFIGS features; returns rows added."""
+    try:
+        ingested_at = _now_ms()
+        conn = _connect()
+        added = 0
+        with conn:
+            for feature in features:
+                row = _perimeter_row(feature, ingested_at)
+                if row is None:
+                    continue
+                values, bbox = row
+                cur = conn.execute(
+                    'INSERT OR IGNORE INTO perimeters (incident_key, object_id, name, observed_at, acres, '
+                    'containment, geom_hash, geometry, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', values)
+                if cur.rowcount:
+                    conn.execute('INSERT INTO perimeters_rtree VALUES (?, ?, ?, ?, ?)',
+                                 (cur.lastrowid, bbox[0], bbox[2], bbox[1], bbox[3]))
+                    added += 1
+            _prune(conn, 'perimeters')
+        return added
+    except Exception as e:
+        print(f"History: failed to record perimeters: {e}")
+        return 0
+
+
+def record_hotspots(hotspots):
+    """Append processed MODIS/VIIRS hotspots not already stored; returns rows added."""
+    try:
+        ingested_at = _now_ms()
+        conn = _connect()
+        added = 0
+        with conn:
+            for hotspot in hotspots:
+                lat, lng = hotspot.get('latitude'), hotspot.get('longitude')
+                if lat is None or lng is None:
+                    continue
+                observed_at = ingested_at - int((hotspot.get('age') or 0) * 3600 * 1000)
+                duplicate = conn.execute(
+                    'SELECT 1 FROM hotspots WHERE source = ? AND lat = ? AND lng = ? '
+                    'AND observed_at BETWEEN ? AND ? LIMIT 1',
+                    (hotspot.get('source'), lat, lng, observed_at - HOTSPOT_DEDUP_MS, observed_at + HOTSPOT_DEDUP_MS)
+                ).fetchone()
+                if duplicate:
+                    continue
+                cur = conn.execute(
+                    'INSERT INTO hotspots (source, lat, lng, observed_at, confidence, intensity, ingested_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (hotspot.get('source'), lat, lng, observed_at, hotspot.get('confidence'),
+                     hotspot.get('intensity'), ingested_at))
+                conn.execute('INSERT INTO hotspots_rtree VALUES (?, ?, ?, ?, ?)', (cur.lastrowid, lng, lng, lat, lat))
+                added += 1
+            _prune(conn, 'hotspots')
+        return added
+    except Exception as e:
+        print(f"History: failed to record hotspots: {e}")
+        return 0
+
+
+def _parse_time(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an ISO 8601 timestamp")
+
+
+def parse_range(args):
+    """(from_ms, to_ms) from ?from= and ?to= request args; raises ValueError."""
+    start = _parse_time(args.get('from'), 'from')
+    end = _parse_time(args.get('to'), 'to')
+    return (start if start is not None else 0, end if end is not None else _now_ms())
+
+
+def parse_bbox(value):
+    """[min_lng, min_lat, max_lng, max_lat] from a ?bbox= arg; raises ValueError."""
+    try:
+        bbox = [float(v) for v in value.split(',')]
+    except (AttributeError, ValueError):
+        bbox = None
+    if not bbox or len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError("'bbox' must be min_lng,min_lat,max_lng,max_lat")
+    return bbox
+
+
+def _iso(ms):
+    return datetime.fromtimestamp(ms / 1000).isoformat()
+
+
+def fire_history(fire_id, start, end, include_geometry=True):
+    """Stored perimeter versions of the incident a fire id belongs to, oldest first.
+
+    Returns None if the fire id was never recorded.
+    """
+    conn = _connect()
+    row = conn.execute('SELECT incident_key FROM perimeters WHERE object_id = ? LIMIT 1', (fire_id,)).fetchone()
+    if row is None:
+        return None
+    columns = 'object_id, name, observed_at, acres, containment' + (', geometry' if include_geometry else '')
+    rows = conn.execute(
+        f'SELECT {columns} FROM perimeters WHERE incident_key = ? AND observed_at BETWEEN ? AND ? '
+        f'ORDER BY observed_at LIMIT ?',
+        (row['incident_key'], start, end, MAX_HISTORY_ROWS)
+    ).fetchall()
+    versions = []
+    for r in rows:
+        version = {
+            'objectId': r['object_id'],
+            'name': r['name'],
+            'observedAt': _iso(r['observed_at']),
+            'acres': r['acres'],
+            'containment': r['containment'],
+        }
+        if include_geometry:
+            version['geometry'] = json.loads(r['geometry'])
+        versions.append(version)
+    return {'incident': row['incident_key'], 'versions': versions}
+
+
+def hotspot_history(bbox, start, end, source=None):
+    """Stored hotspots inside a bbox and time range, via the R*Tree."""
+    conn = _connect()
+    sql = ('SELECT h.source, h.lat, h.lng, h.observed_at, h.confidence, h.intensity '
+           'FROM hotspots_rtree r JOIN hotspots h ON h.id = r.id '
+           'WHERE r.min_lng >= ? AND r.max_lng <= ? AND r.min_lat >= ? AND r.max_lat <= ? '
+           'AND h.observed_at BETWEEN ? AND ?')
+    params = [bbox[0], bbox[2], bbox[1], bbox[3], start, end]
+    if source:
+        sql += ' AND h.source = ?'
+        params.append(source.upper())
+    sql += ' ORDER BY h.observed_at LIMIT ?'
+    params.append(MAX_HISTORY_ROWS)
+    return [{
+        'source': r['source'],
+        'latitude': r['lat'],
+        'longitude': r['lng'],
+        'observedAt': _iso(r['observed_at']),
+        'confidence': r['confidence'],
+        'intensity': r['intensity'],
+    } for r in conn.execute(sql, params)]
+
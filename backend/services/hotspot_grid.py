@@ -0,0 +1,268 @@
+"""
+Quadkey grid pyramid of MODIS/VIIRS hotspots for server-side heatmaps.
+
+    GET /api/hotspots/grid?zoom=4&bbox=-125,24,-66,50&source=all
+
+At national zoom the heatmap only needs per-cell aggregates, not every
+detection. Once per satellite-data version, every hotspot is placed in a
+Web Mercator cell at MAX_LEVEL and rolled up through all coarser levels with
+numpy (np.unique + bincount / ufunc.at, no per-point Python). Each cell holds:
+
+    count        detections in the cell
+    frpMax/Mean  fire radiative power (max, mean over points that report it)
+    weight       sum of confidence / 100 - the heatmap intensity
+    frpWeighted  sum of FRP * confidence / 100
+    youngestAge  smallest HOURS_OLD in the cell
+
+The 'all' source aggregates the deduplicated MODIS+VIIRS feed (hotspot_merge).
+
+A map zoom z is served from level z + CELLS_PER_TILE_LEVELS, so each 256px
+tile gets a 64 x 64 grid of ~4px cells whatever the zoom.
+
+The pyramids are built when the data changes, not by the first request after
+it: in live mode `prepare` is called whenever a feed is stored and builds them
+on a background thread; in the snapshot modes the process that publishes a
+MODIS or VIIRS snapshot writes them to an .npz file named after both versions
+(`save_pyramids`), which every worker loads instead of parsing the feeds
+(`load_pyramids`). `pyramids_for` still builds them on demand when neither
+has happened yet (a cold start).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from hotspot_merge import merged_hotspots
+from vector_tiles import world_xy
+
+MAX_LEVEL = 18
+CELLS_PER_TILE_LEVELS = 6
+MAX_CELLS = 50000
+SOURCES = ('modis', 'viirs', 'all')
+
+_lock = threading.Lock()
+_cache = {'modis': None, 'viirs': None, 'pyramids': None, 'pending': None}
+_loaded = {'path': None, 'pyramids': None}  # the last .npz read by load_pyramids
+_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hotspot-grid')
+_FIELDS = ('x', 'y', 'count', 'frpMax', 'frpMean', 'weight', 'frpWeighted', 'youngestAge')
+
+
+def quadkey(x, y, level):
+    """Bing-style quadkey string of cell (x, y) at a level."""
+    digits = []
+    for i in range(level, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return ''.join(digits)
+
+
+def level_for_zoom(zoom):
+    return max(0, min(int(zoom) + CELLS_PER_TILE_LEVELS, MAX_LEVEL))
+
+
+def _column(hotspots, key, fill):
+    return np.array([fill if h.get(key) is None else h.get(key) for h in hotspots], dtype=float)
+
+
+def build_pyramid(hotspots):
+    """{level: dict of per-cell arrays} for a list of hotspot records."""
+    if not hotspots:
+        return {}
+    lngs = _column(hotspots, 'longitude', np.nan)
+    lats = _column(hotspots, 'latitude', np.nan)
+    frp = _column(hotspots, 'intensity', np.nan)
+    confidence = _column(hotspots, 'confidence', 0)
+    age = _column(hotspots, 'age', np.inf)
+    valid = ~(np.isnan(lngs) | np.isnan(lats))
+    lngs, lats, frp, confidence, age = lngs[valid], lats[valid], frp[valid], confidence[valid], age[valid]
+
+    size = 2 ** MAX_LEVEL
+    wx, wy = world_xy(lngs, lats, MAX_LEVEL)
+    ix = np.clip(wx, 0, size - 1).astype(np.int64)
+    iy = np.clip(wy, 0, size - 1).astype(np.int64)
+
+    has_frp = ~np.isnan(frp)
+    frp0 = np.where(has_frp, frp, 0.0)
+    weight = confidence / 100.0
+
+    pyramid = {}
+    for level in range(MAX_LEVEL + 1):
+        shift = MAX_LEVEL - level
+        cx, cy = ix >> shift, iy >> shift
+        keys, inverse = np.unique((cx << level) | cy, return_inverse=True)
+        n = len(keys)
+        frp_count = np.bincount(inverse, weights=has_frp, minlength=n)
+        frp_sum = np.bincount(inverse, weights=frp0, minlength=n)
+        frp_max = np.full(n, -np.inf)
+        np.maximum.at(frp_max, inverse[has_frp], frp[has_frp])
+        youngest = np.full(n, np.inf)
+        np.minimum.at(youngest, inverse, age)
+        pyramid[level] = {
+            'x': keys >> level,
+            'y': keys & ((1 << level) - 1),
+            'count': np.bincount(inverse, minlength=n).astype(np.int64),
+            'frpMax': frp_max,
+            'frpMean': np.divide(frp_sum, frp_count, out=np.full(n, np.nan), where=frp_count > 0),
+            'weight': np.bincount(inverse, weights=weight, minlength=n),
+            'frpWeighted': np.bincount(inverse, weights=frp0 * weight, minlength=n),
+            'youngestAge': youngest,
+        }
+    return pyramid
+
+
+def build_pyramids(modis_data, viirs_data):
+    """{source: pyramid} for the MODIS and VIIRS feeds."""
+    modis = (modis_data or {}).get('hotspots', [])
+    viirs = (viirs_data or {}).get('hotspots', [])
+    return {
+        'modis': build_pyramid(modis),
+        'viirs': build_pyramid(viirs),
+        # Cross-sensor duplicates removed, so overlapping detections aren't counted twice
+        'all': build_pyramid(merged_hotspots(modis_data, viirs_data)['hotspots']),
+    }
+
+
+def pyramids_for(modis_data, viirs_data):
+    """Pyramids for each source, rebuilt only when either feed's data object changes."""
+    with _lock:
+        if _cache['pyramids'] is not None and _cache['modis'] is modis_data and _cache['viirs'] is viirs_data:
+            return _cache['pyramids']
+        pending = _cache['pending']
+    if pending and pending[0] is modis_data and pending[1] is viirs_data and not pending[2].done():
+        pending[2].result()  # already being built by prepare: wait for it rather than build twice
+        return pyramids_for(modis_data, viirs_data)
+    pyramids = build_pyramids(modis_data, viirs_data)
+    with _lock:
+        _cache.update(modis=modis_data, viirs=viirs_data, pyramids=pyramids)
+    return pyramids
+
+
+def prepare(modis_data, viirs_data):
+    """Build the pyramids for new feed data on the background thread."""
+    def build():
+        try:
+            with _lock:
+                if _cache['modis'] is modis_data and _cache['viirs'] is viirs_data:
+                    return
+            pyramids = build_pyramids(modis_data, viirs_data)
+            with _lock:
+                _cache.update(modis=modis_data, viirs=viirs_data, pyramids=pyramids)
+        except Exception as e:
+            print(f"Hotspot grid: failed to build pyramids: {e}")
+    future = _builder.submit(build)
+    with _lock:
+        _cache['pending'] = (modis_data, viirs_data, future)
+    return future
+
+
+# ---------------------------------------------------------------------------
+# Published pyramids (snapshot modes)
+# ---------------------------------------------------------------------------
+def pyramid_path(directory, modis_version, viirs_version):
+    return os.path.join(directory, f'hotspot-grid.m{modis_version}.v{viirs_version}.npz')
+
+
+def save_pyramids(path, pyramids):
+    """Write pyramids to an .npz atomically and remove older ones next to it."""
+    arrays = {f'{source}/{level}/{field}': cells[field]
+              for source, pyramid in pyramids.items()
+              for level, cells in pyramid.items()
+              for field in _FIELDS}
+    directory = os.path.dirname(path)
+    tmp = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    for filename in os.listdir(directory):
+        if filename.startswith('hotspot-grid.') and filename.endswith('.npz') \
+                and filename != os.path.basename(path) and '.tmp' not in filename:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+def load_pyramids(path):
+    """Pyramids saved at `path` (kept in memory until another path is asked for), or None."""
+    with _lock:
+        if _loaded['path'] == path:
+            return _loaded['pyramids']
+    try:
+        with np.load(path) as npz:
+            pyramids = {source: {} for source in SOURCES}
+            for key in npz.files:
+                source, level, field = key.split('/')
+                pyramids[source].setdefault(int(level), {})[field] = npz[key]
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    with _lock:
+        _loaded.update(path=path, pyramids=pyramids)
+    return pyramids
+
+
+def parse_grid_query(args):
+    """(zoom, bbox, source) from request args; raises ValueError."""
+    try:
+        zoom = float(args.get('zoom', 0))
+    except ValueError:
+        raise ValueError("'zoom' must be a number")
+    if not np.isfinite(zoom):
+        raise ValueError("'zoom' must be a finite number")
+    bbox = args.get('bbox')
+    if bbox:
+        try:
+            bbox = [float(v) for v in bbox.split(',')]
+        except ValueError:
+            bbox = None
+        if not bbox or len(bbox) != 4 or not all(np.isfinite(bbox)):
+            raise ValueError("'bbox' must be min_lng,min_lat,max_lng,max_lat")
+        if bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise ValueError("'bbox' min_lng/min_lat must not exceed max_lng/max_lat")
+    else:
+        bbox = [-180, -85, 180, 85]
+    source = args.get('source', 'all').lower()
+    if source not in SOURCES:
+        raise ValueError(f"'source' must be one of {', '.join(SOURCES)}")
+    return zoom, bbox, source
+
+
+def _value(v):
+    v = float(v)
+    return None if not np.isfinite(v) else round(v, 3)
+
+
+def grid_cells(pyramids, zoom, bbox, source='all'):
+    """Aggregated cells of one source at a map zoom, inside a lng/lat bbox."""
+    level = level_for_zoom(zoom)
+    cells = pyramids[source].get(level)
+    if cells is None:
+        return {'level': level, 'cells': [], 'truncated': False}
+
+    wx0, wy1 = world_xy(np.array([bbox[0]]), np.array([bbox[1]]), level)
+    wx1, wy0 = world_xy(np.array([bbox[2]]), np.array([bbox[3]]), level)
+    mask = ((cells['x'] >= int(wx0[0])) & (cells['x'] <= int(wx1[0]))
+            & (cells['y'] >= int(wy0[0])) & (cells['y'] <= int(wy1[0])))
+    hits = np.nonzero(mask)[0]
+    truncated = len(hits) > MAX_CELLS
+    if truncated:
+        # Keep the busiest cells
+        hits = hits[np.argsort(-cells['count'][hits], kind='stable')[:MAX_CELLS]]
+
+    n = 2 ** level
+    result = []
+    for i in hits:
+        x, y = int(cells['x'][i]), int(cells['y'][i])
+        lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 0.5) / n))))
+        result.append({
+            'quadkey': quadkey(x, y, level),
+            'lat': round(float(lat), 5),
+            'lng': round((x + 0.5) / n * 360 - 180, 5),
+            'count': int(cells['count'][i]),
+            'frpMax': _value(cells['frpMax'][i]),
+            'frpMean': _value(cells['frpMean'][i]),
+            'weight': _value(cells['weight'][i]),
+            'frpWeighted': _value(cells['frpWeighted'][i]),
+            'youngestAge': _value(cells['youngestAge'][i]),
+        })
+    return {'level': level, 'cells': result, 'truncated': truncated}
@@ -0,0 +1,71 @@
+"""
+Streamed JSON responses for large collection payloads.
+
+`jsonify(fire_data)` built the whole body - the national fire list with every
+perimeter's coordinates - as one string next to the data it came from, so
+each concurrent request held a second full copy of the payload, and nothing
+was sent until all of it was encoded. `collection_response` instead writes
+the envelope, then the items one at a time, as a chunked response:
+
+    {"total":1234,"timestamp":"...","fires":[{...},{...},...]}
+
+Items are encoded one by one into CHUNK_BYTES chunks, so a request holds at
+most one chunk of output at a time and the first bytes go out as soon as the
+first chunk is full. Payloads with fewer than STREAM_MIN_ITEMS items are
+encoded in one go, where chunking would only add overhead. Encoding a streamed
+body happens after the view returns; it is profiled as the 'encode' stage
+(see utils.profiling.timed_iter).
+
+orjson is used when it is installed (several times faster than the stdlib
+encoder); otherwise json.dumps with compact separators.
+"""
+
+import json
+import os
+
+from flask import Response
+
+from utils.profiling import timed_iter
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is slower but equivalent
+    orjson = None
+
+CHUNK_BYTES = int(os.environ.get('FLAMEFLUX_STREAM_CHUNK_KB', 64)) * 1024
+STREAM_MIN_ITEMS = int(os.environ.get('FLAMEFLUX_STREAM_MIN_ITEMS', 200))
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """Compact JSON bytes."""
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS)
+else:
+    def dumps(obj):
+        """Compact JSON bytes."""
+        return json.dumps(obj, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def iter_collection(data, items_key, chunk_bytes=CHUNK_BYTES):
+    """Yield `data` as JSON byte chunks, its `items_key` list encoded item by item (and written last)."""
+    envelope = dumps({key: value for key, value in data.items() if key != items_key})
+    prefix = envelope[:-1] + (b',' if len(envelope) > 2 else b'') + dumps(items_key) + b':['
+    chunk = bytearray(prefix)
+    for i, item in enumerate(data.get(items_key) or []):
+        if i:
+            chunk += b','
+        chunk += dumps(item)
+        if len(chunk) >= chunk_bytes:
+            yield bytes(chunk)
+            chunk.clear()
+    chunk += b']}'
+    yield bytes(chunk)
+
+
+def collection_response(data, items_key, status=200):
+    """JSON response for a {..., items_key: [...]} payload, streamed when the list is large."""
+    if len(data.get(items_key) or []) < STREAM_MIN_ITEMS:
+        return Response(dumps(data), status=status, mimetype='application/json')
+    return Response(timed_iter('encode', iter_collection(data, items_key)), status=status,
+                    mimetype='application/json')
@@ -0,0 +1,362 @@
+"""
+Published fire-spread forecasts for /api/prediction/<fire_id>.
+
+The export step writes frontend/public/data/predictions/index.json plus one
+GeoJSON per fire (<normalized name>.geojson) with 27 layers:
+observed_perimeter, predicted_perimeter_24h, predicted_growth_24h and the
+hourly isochrones predicted_reach_h01..h24.
+
+PredictionStore resolves a fire to its forecast by normalized incident name
+(as normalizeFireName in the frontend), IRWIN id, or WFIGS OBJECTID (through
+the current fire list), re-reading index.json only when its mtime changes.
+Per-fire GeoJSON is loaded lazily into an LRU bounded by file bytes
+(FLAMEFLUX_PREDICTION_CACHE_MB), and `summarize` derives, once per file
+version:
+
+    observedAcres, predictedAcres24h, growthAcres24h, growthVsWfigs
+    hourly        [{'hour', 'validAt', 'acres', 'newAcres'}] from the reach layers
+    reachStopsHour  first hour after which the reach no longer grows
+    layers        {layer: {'acres', 'bbox', 'centroid'}}
+
+Areas are geodesic (spherical excess, as turf.area), computed for all layers
+of a file in one vectorized pass.
+
+`embed_summaries` writes the same summaries into index.json (as each fire's
+'summary', with the file's size and hash), so the dashboard list and
+timeline need no geometry; the store reuses an embedded summary while its
+file is unchanged.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_BYTES = int(float(os.environ.get('FLAMEFLUX_PREDICTION_CACHE_MB', 64)) * 2 ** 20)
+EARTH_RADIUS_M = 6378137.0
+SQ_METERS_PER_ACRE = 4046.8564224
+REACH_PREFIX = 'predicted_reach_h'
+# Reach growth below this fraction of the final reach counts as "stopped"
+REACH_GROWTH_TOLERANCE = 0.001
+
+
+def normalize_name(name):
+    """Key for an incident name: normalizeFireName (trim, spaces -> _), case-insensitive."""
+    if not name:
+        return None
+    return '_'.join(str(name).split()).lower()
+
+
+def normalize_irwin(irwin_id):
+    if not irwin_id:
+        return None
+    return str(irwin_id).strip().strip('{}').upper()
+
+
+def _ring_array(ring):
+    if len(ring[0]) == 2:
+        return np.fromiter(itertools.chain.from_iterable(ring), dtype=float, count=2 * len(ring)).reshape(-1, 2)
+    return np.asarray(ring, dtype=float)[:, :2]
+
+
+def _layer_rings(geometry):
+    """(ring array, is_outer) for every ring of a Polygon/MultiPolygon."""
+    if not geometry or not geometry.get('coordinates'):
+        return []
+    polygons = geometry['coordinates'] if geometry.get('type') == 'MultiPolygon' else [geometry['coordinates']]
+    return [(_ring_array(ring), i == 0) for polygon in polygons for i, ring in enumerate(polygon) if len(ring) >= 4]
+
+
+def layer_metrics(features):
+    """Geodesic acres, bbox and centroid per feature, over all rings of all features at once."""
+    rings, ring_layer, ring_outer = [], [], []
+    for layer, feature in enumerate(features):
+        for ring, is_outer in _layer_rings(feature.get('geometry')):
+            rings.append(ring)
+            ring_layer.append(layer)
+            ring_outer.append(is_outer)
+
+    n = len(features)
+    metrics = [{'acres': 0.0, 'bbox': None, 'centroid': None} for _ in range(n)]
+    if not rings:
+        return metrics
+
+    points = np.concatenate(rings)
+    lengths = np.array([len(ring) for ring in rings])
+    ring_of_point = np.repeat(np.arange(len(rings)), lengths)
+    ring_layer = np.array(ring_layer)
+    sign = np.where(ring_outer, 1.0, -1.0)  # holes subtract
+
+    # Edges between consecutive points of the same ring
+    same_ring = ring_of_point[1:] == ring_of_point[:-1]
+    edge_ring = ring_of_point[:-1][same_ring]
+    lng1, lat1 = points[:-1][same_ring].T
+    lng2, lat2 = points[1:][same_ring].T
+
+    # Spherical excess per ring (Chamberlain & Duquette)
+    lam1, lam2, phi1, phi2 = np.radians(lng1), np.radians(lng2), np.radians(lat1), np.radians(lat2)
+    excess = np.bincount(edge_ring, weights=(lam2 - lam1) * (2 + np.sin(phi1) + np.sin(phi2)), minlength=len(rings))
+    ring_m2 = np.abs(excess) * EARTH_RADIUS_M ** 2 / 2
+    layer_m2 = np.bincount(ring_layer, weights=sign * ring_m2, minlength=n)
+
+    # Planar area-weighted centroid, holes weighted negatively
+    cross = lng1 * lat2 - lng2 * lat1
+    ring_area = np.bincount(edge_ring, weights=cross, minlength=len(rings)) / 2
+    ring_cx = np.bincount(edge_ring, weights=(lng1 + lng2) * cross, minlength=len(rings)) / 6
+    ring_cy = np.bincount(edge_ring, weights=(lat1 + lat2) * cross, minlength=len(rings)) / 6
+    weight = sign * np.sign(ring_area)
+    layer_area = np.bincount(ring_layer, weights=weight * ring_area, minlength=n)
+    layer_cx = np.bincount(ring_layer, weights=weight * ring_cx, minlength=n)
+    layer_cy = np.bincount(ring_layer, weights=weight * ring_cy, minlength=n)
+
+    # Points are grouped by layer, so bboxes are segment reductions
+    layer_of_point = ring_layer[ring_of_point]
+    present = np.unique(layer_of_point)
+    starts = np.searchsorted(layer_of_point, present)
+    mins = np.minimum.reduceat(points, starts, axis=0)
+    maxs = np.maximum.reduceat(points, starts, axis=0)
+
+    for k, layer in enumerate(present.tolist()):
+        entry = metrics[layer]
+        entry['acres'] = round(float(layer_m2[layer]) / SQ_METERS_PER_ACRE, 2)
+        entry['bbox'] = [round(float(v), 5) for v in (*mins[k], *maxs[k])]
+        if layer_area[layer]:
+            entry['centroid'] = [round(float(layer_cx[layer] / layer_area[layer]), 5),
+                                 round(float(layer_cy[layer] / layer_area[layer]), 5)]
+    return metrics
+
+
+def summarize(collection):
+    """Derived forecast summary of one per-fire FeatureCollection (see module docstring)."""
+    features = collection.get('features', [])
+    metrics = layer_metrics(features)
+    layers = {}
+    hourly = []
+    props = {}
+    for feature, metric in zip(features, metrics):
+        feature_props = feature.get('properties') or {}
+        props = props or feature_props
+        name = feature_props.get('layer')
+        if not name:
+            continue
+        layers[name] = metric
+        if name.startswith(REACH_PREFIX):
+            hourly.append({'hour': feature_props.get('hour'), 'validAt': feature_props.get('valid_at_utc'),
+                           'acres': metric['acres']})
+    hourly.sort(key=lambda h: h['hour'] or 0)
+
+    previous = None
+    for h in hourly:
+        h['newAcres'] = round(h['acres'] - previous, 2) if previous is not None else None
+        previous = h['acres']
+    reach_stops = None
+    if hourly:
+        final = hourly[-1]['acres']
+        reach_stops = next(h['hour'] for h in hourly if final - h['acres'] <= final * REACH_GROWTH_TOLERANCE)
+
+    def acres(layer):
+        return layers[layer]['acres'] if layer in layers else None
+
+    growth = acres('predicted_growth_24h')
+    wfigs = props.get('acres_wfigs')
+    bboxes = [m['bbox'] for m in layers.values() if m['bbox']]
+    return {
+        'irwinId': props.get('irwin_id'),
+        'issuedAt': props.get('issued_at_utc'),
+        'validFrom': props.get('valid_from_utc'),
+        'validTo': props.get('valid_to_utc'),
+        'acresWfigs': round(wfigs, 2) if wfigs is not None else None,
+        'containment': props.get('containment_pct'),
+        'observedAcres': acres('observed_perimeter'),
+        'predictedAcres24h': acres('predicted_perimeter_24h'),
+        'growthAcres24h': growth,
+        'growthVsWfigs': round(growth / wfigs, 4) if growth is not None and wfigs else None,
+        'hourly': hourly,
+        'reachStopsHour': reach_stops,
+        'bbox': [min(b[0] for b in bboxes), min(b[1] for b in bboxes),
+                 max(b[2] for b in bboxes), max(b[3] for b in bboxes)] if bboxes else None,
+        'layers': layers,
+    }
+
+
+class PredictionStore:
+    """index.json lookups plus a byte-budgeted LRU of per-fire GeoJSON and memoized summaries."""
+
+    def __init__(self, directory, budget_bytes=CACHE_BYTES):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._index = {'mtime_ns': None, 'data': None, 'by_name': {}, 'by_irwin': {}, 'irwin_scanned': False}
+        self._objects = {'fires': None, 'by_object_id': {}}
+        self._files = OrderedDict()  # file -> (version, collection, nbytes)
+        self._bytes = 0
+        self._summaries = {}  # file -> (version, summary)
+
+    def index(self):
+        """Parsed index.json, reloaded when its mtime changes (None if not published)."""
+        path = os.path.join(self.directory, 'index.json')
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            if mtime_ns == self._index['mtime_ns']:
+                return self._index['data']
+        with open(path) as f:
+            data = json.load(f)
+        by_name, by_irwin = {}, {}
+        for entry in data.get('fires', []):
+            by_name[normalize_name(entry.get('name'))] = entry
+            by_name.setdefault(normalize_name(os.path.splitext(entry.get('file') or '')[0]), entry)
+            irwin = normalize_irwin(entry.get('irwin_id') or (entry.get('summary') or {}).get('irwinId'))
+            if irwin:
+                by_irwin[irwin] = entry
+        with self._lock:
+            self._index.update(mtime_ns=mtime_ns, data=data, by_name=by_name, by_irwin=by_irwin,
+                               irwin_scanned=bool(by_irwin) and len(by_irwin) == len(data.get('fires', [])))
+            files = {entry.get('file') for entry in data.get('fires', [])}
+            for stale in [f for f in self._summaries if f not in files]:
+                del self._summaries[stale]
+        return data
+
+    def _file_version(self, entry):
+        stat = os.stat(os.path.join(self.directory, entry['file']))
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self, entry):
+        """Per-fire FeatureCollection for an index entry, via the LRU."""
+        name = entry['file']
+        version = self._file_version(entry)
+        with self._lock:
+            cached = self._files.get(name)
+            if cached and cached[0] == version:
+                self._files.move_to_end(name)
+                return cached[1]
+        with open(os.path.join(self.directory, name)) as f:
+            collection = json.load(f)
+        nbytes = version[1]
+        with self._lock:
+            previous = self._files.pop(name, None)
+            if previous:
+                self._bytes -= previous[2]
+            self._files[name] = (version, collection, nbytes)
+            self._bytes += nbytes
+            # Always keep the newest file, even one larger than the budget
+            while self._bytes > self.budget_bytes and len(self._files) > 1:
+                _, (_, _, evicted) = self._files.popitem(last=False)
+                self._bytes -= evicted
+        return collection
+
+    def summary(self, entry):
+        """Memoized summary for the current version of an entry's file."""
+        name = entry['file']
+        version = self._file_version(entry)
+        with self._lock:
+            cached = self._summaries.get(name)
+            if cached and cached[0] == version:
+                return cached[1]
+            embedded = entry.get('summary')
+            # Embedded by embed_summaries: valid if the file hasn't changed since the index was written
+            if embedded and embedded.get('fileBytes') == version[1] and version[0] <= self._index['mtime_ns']:
+                self._summaries[name] = (version, embedded)
+                return embedded
+        summary = summarize(self.load(entry))
+        with self._lock:
+            self._summaries[name] = (version, summary)
+            irwin = normalize_irwin(summary.get('irwinId'))
+            if irwin:
+                self._index['by_irwin'][irwin] = entry
+        return summary
+
+    def _by_object_id(self, fires):
+        with self._lock:
+            if self._objects['fires'] is fires:
+                return self._objects['by_object_id']
+        by_object_id = {str(fire.get('id')): fire.get('name') for fire in fires or []}
+        with self._lock:
+            self._objects.update(fires=fires, by_object_id=by_object_id)
+        return by_object_id
+
+    def _scan_irwin(self):
+        """Learn IRWIN ids of every published fire (once per index version)."""
+        for entry in (self._index['data'] or {}).get('fires', []):
+            try:
+                self.summary(entry)
+            except (OSError, ValueError) as e:
+                print(f"Prediction store: cannot read {entry.get('file')}: {e}")
+        with self._lock:
+            self._index['irwin_scanned'] = True
+
+    def version(self):
+        """mtime_ns of the index.json last loaded by index()."""
+        return self._index['mtime_ns']
+
+    def resolve(self, fire_id, load_fires=None):
+        """(index entry, matched_by) for a name, IRWIN id or OBJECTID; (None, None) if no forecast.
+
+        `load_fires()` returns the current fire list and is only called for
+        ids that match no name or IRWIN id.
+        """
+        if self.index() is None:
+            return None, None
+        entry = self._index['by_name'].get(normalize_name(fire_id))
+        if entry:
+            return entry, 'name'
+
+        irwin = normalize_irwin(fire_id)
+        entry = self._index['by_irwin'].get(irwin)
+        if entry is None and not self._index['irwin_scanned'] and len(irwin) >= 32:
+            self._scan_irwin()  # looks like a GUID we haven't seen yet
+            entry = self._index['by_irwin'].get(irwin)
+        if entry:
+            return entry, 'irwinId'
+
+        if load_fires is None:
+            return None, None
+        name = self._by_object_id(load_fires()).get(str(fire_id))
+        entry = self._index['by_name'].get(normalize_name(name))
+        if entry:
+            return entry, 'objectId'
+        return None, None
+
+    def stats(self):
+        with self._lock:
+            return {'cachedFiles': len(self._files), 'cachedBytes': self._bytes,
+                    'budgetBytes': self.budget_bytes, 'summaries': len(self._summaries)}
+
+
+def embed_summaries(directory):
+    """Write each fire's summary into directory/index.json; returns (computed, reused).
+
+    Fires whose GeoJSON hash matches the embedded summary are not re-read.
+    """
+    path = os.path.join(directory, 'index.json')
+    with open(path) as f:
+        index = json.load(f)
+    computed = reused = 0
+    for entry in index.get('fires', []):
+        try:
+            with open(os.path.join(directory, entry['file']), 'rb') as f:
+                raw = f.read()
+        except (KeyError, OSError) as e:
+            print(f"Prediction summaries: skipping {entry.get('name')}: {e}")
+            continue
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        if (entry.get('summary') or {}).get('fileHash') == digest:
+            reused += 1
+            continue
+        summary = summarize(json.loads(raw))
+        summary.update(fileBytes=len(raw), fileHash=digest)
+        entry['summary'] = summary
+        computed += 1
+
+    if computed:
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(tmp, path)
+    return computed, reused
@@ -0,0 +1,97 @@
+"""
+Snapshot serving mode: serve only what scripts/generate_data.py published.
+
+With FLAMEFLUX_SERVING_MODE=snapshot the API never calls ArcGIS in the request
+path (or anywhere else). The generator's files in FLAMEFLUX_PUBLISHED_DIR
+(default frontend/public/data) are converted to the API's payload shape and
+published into the shared snapshot store, and a watcher republishes a dataset
+whenever its source file changes. Because both files and API are built by
+fire_transform, the two outputs are the same records in different envelopes.
+"""
+
+import json
+import os
+import threading
+import time
+
+import snapshot_store
+
+PUBLISHED_DIR = os.environ.get(
+    'FLAMEFLUX_PUBLISHED_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'frontend', 'public', 'data'))
+)
+WATCH_INTERVAL = float(os.environ.get('FLAMEFLUX_WATCH_INTERVAL', 5))
+
+# Dataset name -> (generator file, list key, source label or None)
+PUBLISHED_FILES = {
+    'fires': ('fires.json', 'fires', None),
+    'modis': ('modis.json', 'hotspots', 'MODIS'),
+    'viirs': ('viirs.json', 'hotspots', 'VIIRS'),
+}
+
+
+def source_path(name):
+    return os.path.join(PUBLISHED_DIR, PUBLISHED_FILES[name][0])
+
+
+def load_published(name):
+    """Read a generator file and convert it to the API payload for that dataset."""
+    filename, items_key, source = PUBLISHED_FILES[name]
+    with open(source_path(name)) as fh:
+        data = json.load(fh)
+    items = data.get(items_key, [])
+    payload = {
+        items_key: items,
+        'total': len(items),
+        'timestamp': data.get('generatedAt'),
+    }
+    if source:
+        payload['source'] = source
+    return payload
+
+
+def _source_mtime(name):
+    try:
+        return os.stat(source_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def publish_from_file(name, items_key=None):
+    """Publish the current generator file for a dataset into the snapshot store."""
+    mtime = _source_mtime(name)
+    return snapshot_store.refresh(
+        name, lambda: load_published(name), items_key=items_key,
+        extra_meta={'source': {'file': source_path(name), 'mtime_ns': mtime}}
+    )
+
+
+def start_watcher(sources, interval=WATCH_INTERVAL):
+    """Republish datasets whose generator file changed (refresher-lock holder only).
+
+    `sources` maps dataset name to its items_key, as for the shared refresher.
+    """
+    def loop():
+        lock_fh = None
+        while True:
+            if lock_fh is None:
+                lock_fh = snapshot_store.try_acquire_refresher_lock()
+            if lock_fh is not None:
+                for name, items_key in sources.items():
+                    mtime = _source_mtime(name)
+                    if mtime is None:
+                        continue
+                    meta = snapshot_store.current_meta(name)
+                    if meta and (meta.get('source') or {}).get('mtime_ns') == mtime:
+                        continue
+                    try:
+                        meta = publish_from_file(name, items_key=items_key)
+                        print(f"Reloaded {name} from {source_path(name)} as v{meta['version']}")
+                    except (OSError, ValueError) as e:
+                        # Half-synced or malformed file: keep serving the last good version
+                        print(f"Error reloading {name} snapshot: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name='snapshot-watcher', daemon=True)
+    thread.start()
+    return thread
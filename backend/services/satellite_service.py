@@ -1,111 +1,54 @@
 import json
-import requests
 from datetime import datetime
 
+import arcgis_pager
+import fire_transform
+import history_store
+from utils.profiling import profiled, stage
+
 MODIS_api = "https://services9.arcgis.com/RHVPKKiFTONKtxq3/arcgis/rest/services/MODIS_Thermal_v1/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson"
 VIIRS_api = "https://services9.arcgis.com/RHVPKKiFTONKtxq3/arcgis/rest/services/Satellite_VIIRS_Thermal_Hotspots_and_Fire_Activity/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson"
 
 headers = { 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
 
-def get_modis_data():
-    """Get MODIS satellite data"""
-    modis_hotspots = []
-    
-    MODIS_response = requests.get(MODIS_api, headers=headers)
-    MODIS_data = MODIS_response.json()
-    
-    MODIS_features = MODIS_data["features"]
-    
-    for idx, val in enumerate(MODIS_features):
-        id = val["id"]
-        
-        props = val["properties"]
-        lat, long = val['geometry']['coordinates'][1], val['geometry']['coordinates'][0]
-        
-        # add check for if its in bounds or not
-        is_in_usa = lambda lat, lon: (
-            (24.396308 <= lat <= 49.384358 and -125.0 <= lon <= -66.93457) or
-            (51.2 <= lat <= 71.5 and -179.15 <= lon <= -129.97) or
-            (18.5 <= lat <= 22.5 and -160.5 <= lon <= -154.5)
-        )
-        if is_in_usa(lat, long) == False:
-            continue
-        
-        age = props["HOURS_OLD"]
-        
-        confidence = props["CONFIDENCE"]
-        if confidence < 80:
-            continue
-        
-        intensity = props["FRP"]
-        
-        hotspot = {
-            "id": id,
-            "latitude": lat,
-            "longitude": long,
-            "age": age,
-            "confidence": confidence,
-            "intensity": intensity,
-            "source": "MODIS"
-        }
-        
-        modis_hotspots.append(hotspot)
-    
+# (connect, read) timeout in seconds - without one a hung ArcGIS connection
+# pins the calling worker thread forever.
+REQUEST_TIMEOUT = (10, 30)
+
+def fetch_hotspots(api_url, name, transform):
+    """Fetch a satellite feed page by page, transforming each page while later ones download"""
+    hotspots = []
+    query = arcgis_pager.PagedQuery(api_url, name, headers=headers, timeout=REQUEST_TIMEOUT)
+    with stage('fetch_and_process'):
+        for features in query.pages():
+            hotspots.extend(transform(features))
+    return hotspots
+
+def hotspot_payload(hotspots, source):
+    """Record hotspots in the history store and wrap them in the API's payload"""
+    with stage('record_history'):
+        history_store.record_hotspots(hotspots)
     return {
-        "hotspots": modis_hotspots,
-        "total": len(modis_hotspots),
-        "source": "MODIS",
+        "hotspots": hotspots,
+        "total": len(hotspots),
+        "source": source,
         "timestamp": datetime.now().isoformat()
     }
 
-def get_viirs_data():
-    """Get VIIRS satellite data"""
-    viirs_hotspots = []
-    
-    VIIRS_response = requests.get(VIIRS_api, headers=headers)
-    VIIRS_data = VIIRS_response.json()
-    
-    VIIRS_features = VIIRS_data["features"]
-    
-    for idx, val in enumerate(VIIRS_features):
-        id = val["id"]
-        
-        props = val["properties"]
-        lat, long = val['geometry']['coordinates'][1], val['geometry']['coordinates'][0]
-        
-        # add check for if its in bounds or not
-        is_in_usa = lambda lat, lon: (
-            (24.396308 <= lat <= 49.384358 and -125.0 <= lon <= -66.93457) or
-            (51.2 <= lat <= 71.5 and -179.15 <= lon <= -129.97) or
-            (18.5 <= lat <= 22.5 and -160.5 <= lon <= -154.5)
-        )
-        if is_in_usa(lat, long) == False:
-            continue
-        
-        age = props["hours_old"]
-        intensity = props["frp"]
+def process_modis_features(MODIS_features):
+    """Turn raw MODIS features into the API's hotspot payload"""
+    return hotspot_payload(fire_transform.process_modis_features(MODIS_features), "MODIS")
 
-        # VIIRS reports confidence as "low"/"nominal"/"high" rather than a
-        # 0-100 score; map it so downstream weighting doesn't treat every
-        # VIIRS hotspot as zero-confidence.
-        viirs_confidence_map = {"low": 30, "nominal": 70, "high": 90}
-        confidence = viirs_confidence_map.get(str(props.get("confidence")).lower(), 70)
+def process_viirs_features(VIIRS_features):
+    """Turn raw VIIRS features into the API's hotspot payload"""
+    return hotspot_payload(fire_transform.process_viirs_features(VIIRS_features), "VIIRS")
 
-        hotspot = {
-            "id": id,
-            "latitude": lat,
-            "longitude": long,
-            "age": age,
-            "confidence": confidence,
-            "intensity": intensity,
-            "source": "VIIRS"
-        }
-        
-        viirs_hotspots.append(hotspot)
-    
-    return {
-        "hotspots": viirs_hotspots,
-        "total": len(viirs_hotspots),
-        "source": "VIIRS",
-        "timestamp": datetime.now().isoformat()
-    }
\ No newline at end of file
+@profiled()
+def get_modis_data():
+    """Get MODIS satellite data"""
+    return hotspot_payload(fetch_hotspots(MODIS_api, 'modis', fire_transform.process_modis_features), "MODIS")
+
+@profiled()
+def get_viirs_data():
+    """Get VIIRS satellite data"""
+    return hotspot_payload(fetch_hotspots(VIIRS_api, 'viirs', fire_transform.process_viirs_features), "VIIRS")
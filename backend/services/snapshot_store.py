@@ -0,0 +1,315 @@
+"""
+Cross-process snapshot store for multi-worker serving.
+
+Instead of every worker keeping its own module-level cache (and fetching
+ArcGIS on its own), one refresher publishes each dataset as the exact JSON
+body the API returns:
+
+    <SNAPSHOT_DIR>/<name>.v<version>.json   immutable body, written once
+    <SNAPSHOT_DIR>/<name>.current.json      pointer: version, file, item index
+
+The body is written to a temp file and renamed into place, then the pointer is
+swapped the same way, so readers only ever see complete versions. Workers
+memory-map the current body and hand it to the server as a file (sendfile
+under gunicorn), so N workers share one copy through the page cache and
+nobody re-serializes. Single items (one fire) are sliced straight out of the
+mapping using the byte offsets recorded in the pointer.
+
+That sharing covers only the paths served from the bytes: the plain dataset
+GET and single-item GETs. Everything that needs the records as Python objects
+(fire queries, LOD geometry, vector tiles, fire activity, merged hotspots,
+the hotspot grid, change feeds) goes through `Snapshot.data()`, which parses
+the whole body once per version *in each worker*. A parsed copy is several
+times the size of the JSON - about 330 MB of worker RSS for a 37 MB fires
+body (600 perimeters of 3000 vertices) - so per-worker memory is flat only
+for workers that see no such traffic. `/api/health` reports which snapshots
+each worker has parsed.
+
+Only one process refreshes at a time: the refresher holds an exclusive flock
+on <SNAPSHOT_DIR>/refresher.lock, and any other worker that finds a snapshot
+missing waits on <SNAPSHOT_DIR>/bootstrap.lock instead of fetching itself.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+SNAPSHOT_DIR = os.environ.get(
+    'FLAMEFLUX_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'snapshots')
+)
+KEEP_VERSIONS = 3  # older bodies may still be open in a worker mid-response
+REFRESH_INTERVAL = int(os.environ.get('FLAMEFLUX_REFRESH_INTERVAL', 300))
+
+_open_snapshots = {}
+_pointer_cache = {}
+_open_lock = threading.Lock()
+_publish_hooks = []
+
+
+class Snapshot:
+    """One published version of a dataset, memory-mapped read-only."""
+
+    def __init__(self, name, meta):
+        self.name = name
+        self.version = meta['version']
+        self.published_at = meta['publishedAt']
+        self.index = meta.get('index') or {}
+        self.path = os.path.join(SNAPSHOT_DIR, meta['file'])
+        self.size = os.path.getsize(self.path)
+        self._data = None
+        with open(self.path, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+    @property
+    def etag(self):
+        return f'{self.name}-{self.version}'
+
+    def item(self, item_id):
+        """Raw JSON bytes of a single item, or None if it isn't in this version."""
+        span = self.index.get(str(item_id))
+        if not span:
+            return None
+        start, end = span
+        return self.mm[start:end]
+
+    @property
+    def parsed(self):
+        return self._data is not None
+
+    def data(self):
+        """Parsed body, decoded lazily the first time a worker needs it (a full private copy per worker)."""
+        if self._data is None:
+            self._data = json.loads(self.mm[:])
+        return self._data
+
+    def age_seconds(self):
+        published = datetime.fromisoformat(self.published_at).timestamp()
+        return datetime.now().timestamp() - published
+
+
+def _pointer_path(name):
+    return os.path.join(SNAPSHOT_DIR, f'{name}.current.json')
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _serialize(payload, items_key, id_key):
+    """Encode payload compactly, recording byte offsets of each item in items_key."""
+    dumps = lambda obj: json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    if not items_key or not isinstance(payload.get(items_key), list):
+        return dumps(payload), {}
+
+    head = {k: v for k, v in payload.items() if k != items_key}
+    parts = [dumps(head)[:-1]]  # drop the closing brace
+    parts.append((',' if head else '').encode() + f'"{items_key}":['.encode())
+    offset = sum(len(p) for p in parts)
+    index = {}
+    for i, item in enumerate(payload[items_key]):
+        if i:
+            parts.append(b',')
+            offset += 1
+        encoded = dumps(item)
+        item_id = item.get(id_key) if isinstance(item, dict) else None
+        if item_id is not None:
+            index[str(item_id)] = [offset, offset + len(encoded)]
+        parts.append(encoded)
+        offset += len(encoded)
+    parts.append(b']}')
+    return b''.join(parts), index
+
+
+def current_meta(name):
+    """Read the pointer for a dataset, re-reading only when the file changed."""
+    path = _pointer_path(name)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns)
+    cached = _pointer_cache.get(name)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path) as fh:
+        meta = json.load(fh)
+    _pointer_cache[name] = (key, meta)
+    return meta
+
+
+def publish(name, payload, items_key=None, id_key='id', extra_meta=None):
+    """Write a new version of a dataset and swap the pointer to it."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    previous = current_meta(name)
+    version = (previous['version'] + 1) if previous else 1
+    body, index = _serialize(payload, items_key, id_key)
+
+    filename = f'{name}.v{version}.json'
+    _write_atomic(os.path.join(SNAPSHOT_DIR, filename), body)
+    meta = {
+        'name': name,
+        'version': version,
+        'file': filename,
+        'publishedAt': datetime.now().isoformat(),
+        'size': len(body),
+        'total': payload.get('total'),
+        'index': index,
+        **(extra_meta or {}),
+    }
+    _write_atomic(_pointer_path(name), json.dumps(meta).encode('utf-8'))
+    _cleanup_old_versions(name, version)
+    for hook in _publish_hooks:
+        try:
+            hook(name, payload, meta)
+        except Exception as e:
+            print(f"Error in publish hook for {name} v{version}: {e}")
+    return meta
+
+
+def on_publish(hook):
+    """Call hook(name, payload, meta) after every version this process publishes.
+
+    Hooks run in the publishing process (the refresher), so derived data
+    built there is built once, not once per worker.
+    """
+    _publish_hooks.append(hook)
+    return hook
+
+
+def _cleanup_old_versions(name, version):
+    prefix = f'{name}.v'
+    for filename in os.listdir(SNAPSHOT_DIR):
+        if not (filename.startswith(prefix) and filename.endswith('.json')):
+            continue
+        try:
+            file_version = int(filename[len(prefix):-len('.json')])
+        except ValueError:
+            continue
+        if file_version <= version - KEEP_VERSIONS:
+            try:
+                os.remove(os.path.join(SNAPSHOT_DIR, filename))
+            except FileNotFoundError:
+                pass
+
+
+def open_snapshot(name):
+    """Return the current Snapshot for a dataset (mapped once per version per process)."""
+    meta = current_meta(name)
+    if not meta:
+        return None
+    with _open_lock:
+        snapshot = _open_snapshots.get(name)
+        if snapshot is None or snapshot.version != meta['version']:
+            try:
+                snapshot = Snapshot(name, meta)
+            except FileNotFoundError:
+                # Pointer moved on and the body was cleaned up in between; retry next call.
+                _pointer_cache.pop(name, None)
+                return snapshot
+            _open_snapshots[name] = snapshot
+        return snapshot
+
+
+@contextmanager
+def _flock(lock_name):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    fh = open(os.path.join(SNAPSHOT_DIR, lock_name), 'a')
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+    finally:
+        fh.close()
+
+
+def get_or_publish(name, fetcher, items_key=None):
+    """Current snapshot, fetching and publishing it first if none exists yet.
+
+    Workers that race on a cold start serialize on the bootstrap lock, so only
+    the first one calls upstream and the rest pick up its result.
+    """
+    snapshot = open_snapshot(name)
+    if snapshot:
+        return snapshot
+    with _flock('bootstrap.lock'):
+        snapshot = open_snapshot(name)
+        if snapshot:
+            return snapshot
+        publish(name, fetcher(), items_key=items_key)
+    return open_snapshot(name)
+
+
+def refresh(name, fetcher, items_key=None, extra_meta=None):
+    """Fetch and publish a dataset now, regardless of its age."""
+    with _flock('bootstrap.lock'):
+        return publish(name, fetcher(), items_key=items_key, extra_meta=extra_meta)
+
+
+def try_acquire_refresher_lock():
+    """Non-blocking attempt at the refresher role; returns the held lock file or None."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    fh = open(os.path.join(SNAPSHOT_DIR, 'refresher.lock'), 'a')
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        fh.close()
+        return None
+    print(f"Process {os.getpid()} is the snapshot refresher")
+    return fh
+
+
+def start_refresher(sources, interval=REFRESH_INTERVAL, fetch_many=None):
+    """Start the background refresher thread in this process.
+
+    `sources` maps dataset name to (fetcher, items_key). If `fetch_many` is
+    given it is called with the list of stale names and must return
+    {name: payload or exception}, letting the feeds be fetched concurrently;
+    otherwise each fetcher is called in turn. Every worker calls this; only
+    the one holding refresher.lock actually refreshes, and if it dies another
+    worker picks the lock up on its next attempt.
+    """
+    def loop():
+        lock_fh = None
+        while True:
+            if lock_fh is None:
+                lock_fh = try_acquire_refresher_lock()
+
+            if lock_fh is not None:
+                stale = []
+                for name in sources:
+                    snapshot = open_snapshot(name)
+                    if not snapshot or snapshot.age_seconds() >= interval:
+                        stale.append(name)
+                if stale and fetch_many:
+                    try:
+                        results = fetch_many(stale)
+                    except Exception as e:
+                        results = {name: e for name in stale}
+                else:
+                    results = {name: None for name in stale}
+
+                for name, result in results.items():
+                    fetcher, items_key = sources[name]
+                    try:
+                        if isinstance(result, BaseException):
+                            raise result
+                        payload = result if result is not None else fetcher()
+                        meta = refresh(name, lambda: payload, items_key=items_key)
+                        print(f"Published {name} v{meta['version']} ({meta['size']:,} bytes)")
+                    except Exception as e:
+                        print(f"Error refreshing {name} snapshot: {e}")
+            time.sleep(min(interval, 30))
+
+    thread = threading.Thread(target=loop, name='snapshot-refresher', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,467 @@
+"""
+Mapbox Vector Tiles (MVT v2) for fire perimeters, hotspots and predictions.
+
+Served live from /tiles/<layer>/<z>/<x>/<y>.pbf and pre-rendered offline by
+`scripts/generate_data.py --tiles` into a static pyramid for CDN hosting.
+
+The encoder is self-contained (protobuf varints written by hand, polygons
+clipped with Sutherland-Hodgman against the buffered tile square), so no
+geometry or protobuf dependency is needed. Below zoom 12 rings are
+simplified in tile space to about half a screen pixel and sub-pixel polygon
+parts are dropped, which keeps national-zoom tiles small.
+
+Each layer keeps an in-memory tile cache. When the layer's source data
+changes, features are diffed by id and content hash, and only the cached
+tiles whose bounds touch an added, changed or removed feature are dropped;
+everything else stays cached across refreshes.
+"""
+
+import glob
+import json
+import math
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from fire_transform import content_hash
+from geometry_lod import simplify_ring
+
+EXTENT = 4096
+BUFFER = 64
+MAX_ZOOM = 16
+PIXEL = EXTENT / 256  # one screen pixel of a 256px tile, in tile units
+SIMPLIFY_BELOW_ZOOM = 12  # above this, perimeters are drawn at full detail
+MAX_CACHED_TILES = 20000
+MAX_LAT = 85.05112878
+CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+_GEOM_POINT = 1
+_GEOM_POLYGON = 3
+
+
+# ---------------------------------------------------------------------------
+# Tile math
+# ---------------------------------------------------------------------------
+def tile_bounds(z, x, y):
+    """(min_lng, min_lat, max_lng, max_lat) of a tile."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+
+def tile_range(bbox, z):
+    """Inclusive (x0, y0, x1, y1) tile range covering a lng/lat bbox at zoom z."""
+    n = 2 ** z
+    min_lng, min_lat, max_lng, max_lat = bbox
+    x0, y1 = world_xy(np.array([min_lng]), np.array([min_lat]), z)
+    x1, y0 = world_xy(np.array([max_lng]), np.array([max_lat]), z)
+    clamp = lambda v: min(max(int(v), 0), n - 1)
+    return clamp(x0[0]), clamp(y0[0]), clamp(x1[0]), clamp(y1[0])
+
+
+def world_xy(lngs, lats, z):
+    """Web Mercator world coordinates (arrays) in tile units at zoom z."""
+    n = 2 ** z
+    lat_rad = np.radians(np.clip(lats, -MAX_LAT, MAX_LAT))
+    wx = (lngs + 180.0) / 360.0 * n
+    wy = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / math.pi) / 2.0 * n
+    return wx, wy
+
+
+def _to_tile_px(coords, z, x, y):
+    arr = np.asarray(coords, dtype=float)
+    wx, wy = world_xy(arr[:, 0], arr[:, 1], z)
+    return np.column_stack(((wx - x) * EXTENT, (wy - y) * EXTENT))
+
+
+def _buffered_bounds(z, x, y):
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+    pad_lng = (max_lng - min_lng) * BUFFER / EXTENT
+    pad_lat = (max_lat - min_lat) * BUFFER / EXTENT
+    return (min_lng - pad_lng, min_lat - pad_lat, max_lng + pad_lng, max_lat + pad_lat)
+
+
+# ---------------------------------------------------------------------------
+# Geometry
+# ---------------------------------------------------------------------------
+def _clip_ring(points, lo, hi):
+    """Sutherland-Hodgman clip of a ring (list of (x, y)) to the square [lo, hi]."""
+    edges = (
+        (lambda p: p[0] >= lo, lambda a, b: (lo, a[1] + (b[1] - a[1]) * (lo - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[0] <= hi, lambda a, b: (hi, a[1] + (b[1] - a[1]) * (hi - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[1] >= lo, lambda a, b: (a[0] + (b[0] - a[0]) * (lo - a[1]) / (b[1] - a[1]), lo)),
+        (lambda p: p[1] <= hi, lambda a, b: (a[0] + (b[0] - a[0]) * (hi - a[1]) / (b[1] - a[1]), hi)),
+    )
+    for inside, intersect in edges:
+        if not points:
+            break
+        output = []
+        prev = points[-1]
+        for point in points:
+            if inside(point):
+                if not inside(prev):
+                    output.append(intersect(prev, point))
+                output.append(point)
+            elif inside(prev):
+                output.append(intersect(prev, point))
+            prev = point
+        points = output
+    return points
+
+
+def _ring_area(ring):
+    """Surveyor's-formula area of an unclosed ring."""
+    return sum(ring[i - 1][0] * ring[i][1] - ring[i][0] * ring[i - 1][1] for i in range(len(ring))) / 2
+
+
+def _polygon_index(geometry):
+    """Rings of a (Multi)Polygon as arrays, with per-ring lng/lat bboxes.
+
+    Returns (rings, bboxes, is_outer): a list of (n, 2) arrays, an (r, 4)
+    bbox array and an (r,) bool array marking each part's exterior ring.
+    Built once per feature version so tile renders cull rings without
+    touching the coordinate lists.
+    """
+    polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+    rings, bboxes, is_outer = [], [], []
+    for polygon in polygons:
+        for i, ring in enumerate(polygon):
+            if len(ring) < 4:
+                if i == 0:
+                    break  # degenerate exterior: drop the part
+                continue
+            coords = np.asarray(ring, dtype=float)[:, :2]
+            rings.append(coords)
+            bboxes.append((*coords.min(axis=0), *coords.max(axis=0)))
+            is_outer.append(i == 0)
+    return rings, np.asarray(bboxes, dtype=float).reshape(-1, 4), np.asarray(is_outer, dtype=bool)
+
+
+def _polygon_rings(index, z, x, y):
+    """Tile-space integer rings of a (Multi)Polygon, clipped, oriented per the MVT spec."""
+    rings, bboxes, is_outer = index
+    # Cull rings first, vectorized: sub-pixel rings and parts outside the tile.
+    # A hidden exterior hides the holes that follow it.
+    wx0, wy1 = world_xy(bboxes[:, 0], bboxes[:, 1], z)
+    wx1, wy0 = world_xy(bboxes[:, 2], bboxes[:, 3], z)
+    visible = ((wx1 - wx0) * EXTENT >= PIXEL) | ((wy1 - wy0) * EXTENT >= PIXEL)
+    visible &= _intersects(bboxes, _buffered_bounds(z, x, y)) | ~is_outer
+    owner = np.maximum.accumulate(np.where(is_outer, np.arange(len(is_outer)), -1))
+    visible &= visible[owner]
+
+    lo, hi = -BUFFER, EXTENT + BUFFER
+    out = []
+    outer_kept = False
+    for r in range(len(rings)):
+        if is_outer[r]:
+            outer_kept = False
+        if not visible[r] or (not is_outer[r] and not outer_kept):
+            continue
+        wx, wy = world_xy(rings[r][:, 0], rings[r][:, 1], z)
+        px = np.column_stack(((wx - x) * EXTENT, (wy - y) * EXTENT))
+        if z < SIMPLIFY_BELOW_ZOOM:
+            px = simplify_ring(px, PIXEL / 2, is_outer=bool(is_outer[r]))
+            if px is None:
+                continue
+        px = np.asarray(px)[:-1]
+        if px.min() < lo or px.max() > hi:
+            px = np.asarray(_clip_ring([tuple(p) for p in px], lo, hi)).reshape(-1, 2)
+        points = np.rint(px).astype(np.int64)
+        if len(points):
+            # Drop repeated vertices, including a closing one left by clipping
+            keep = np.any(points != np.roll(points, 1, axis=0), axis=1)
+            keep[0] = True
+            points = points[keep]
+            if len(points) > 1 and (points[0] == points[-1]).all():
+                points = points[:-1]
+        if len(points) < 3:
+            continue
+        points = points.tolist()
+        area = _ring_area(points)
+        if area == 0:
+            continue
+        # Exterior rings have positive area in tile space (y down), holes negative.
+        if is_outer[r] != (area > 0):
+            points.reverse()
+        if is_outer[r]:
+            outer_kept = True
+        out.append(points)
+    return out
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _encode_polygon(rings):
+    cmds, cx, cy = [], 0, 0
+    for ring in rings:
+        x0, y0 = ring[0]
+        cmds += [_command(1, 1), _zigzag(x0 - cx), _zigzag(y0 - cy)]
+        cx, cy = x0, y0
+        cmds.append(_command(2, len(ring) - 1))
+        for px, py in ring[1:]:
+            cmds += [_zigzag(px - cx), _zigzag(py - cy)]
+            cx, cy = px, py
+        cmds.append(_command(7, 1))
+    return cmds
+
+
+def _encode_point(px, py):
+    return [_command(1, 1), _zigzag(px), _zigzag(py)]
+
+
+# ---------------------------------------------------------------------------
+# Protobuf
+# ---------------------------------------------------------------------------
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number, payload):
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(number, values):
+    return _bytes_field(number, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _field(5, 0) + _varint(value)
+        return _field(6, 0) + _varint((value << 1) ^ (value >> 63))
+    if isinstance(value, float):
+        return _field(3, 1) + struct.pack('<d', value)
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+
+def encode_layer(name, features):
+    """Encode one MVT layer from (feature_id, geom_type, commands, properties) tuples."""
+    keys, values = {}, {}
+    encoded_features = []
+    for feature_id, geom_type, commands, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        body = b''
+        if isinstance(feature_id, int) and not isinstance(feature_id, bool) and feature_id >= 0:
+            body += _field(1, 0) + _varint(feature_id)
+        body += _packed_field(2, tags)
+        body += _field(3, 0) + _varint(geom_type)
+        body += _packed_field(4, commands)
+        encoded_features.append(_bytes_field(2, body))
+
+    layer = _field(15, 0) + _varint(2) + _bytes_field(1, name.encode('utf-8'))
+    layer += b''.join(encoded_features)
+    layer += b''.join(_bytes_field(3, key.encode('utf-8')) for key in keys)
+    layer += b''.join(_bytes_field(4, _encode_value(value)) for (_, value) in values)
+    layer += _field(5, 0) + _varint(EXTENT)
+    return _bytes_field(3, layer)
+
+
+# ---------------------------------------------------------------------------
+# Layer sources
+# ---------------------------------------------------------------------------
+def fire_features(fire_data):
+    """(id, geometry, properties) for each WFIGS perimeter."""
+    for fire in fire_data.get('fires', []):
+        if not fire.get('geometry'):
+            continue
+        props = {k: fire.get(k) for k in ('id', 'name', 'size', 'severity', 'containment', 'lastUpdate')}
+        yield fire.get('id'), fire['geometry'], props
+
+
+def hotspot_features(satellite_data):
+    """(id, [lng, lat], properties) for each MODIS/VIIRS hotspot."""
+    for i, hotspot in enumerate(satellite_data.get('hotspots', [])):
+        props = {k: hotspot.get(k) for k in ('age', 'confidence', 'intensity', 'source')}
+        hotspot_id = hotspot.get('id') if hotspot.get('id') is not None else i
+        yield hotspot_id, [hotspot['longitude'], hotspot['latitude']], props
+
+
+def prediction_features(predictions_dir):
+    """(key, geometry, properties) for every layer of every published forecast."""
+    for path in sorted(glob.glob(os.path.join(predictions_dir, '*.geojson'))):
+        with open(path) as fh:
+            collection = json.load(fh)
+        for feature in collection.get('features', []):
+            props = feature.get('properties') or {}
+            geometry = feature.get('geometry')
+            if not geometry or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+                continue
+            key = f"{props.get('fire_name')}:{props.get('layer')}"
+            yield key, geometry, {
+                'fire_name': props.get('fire_name'),
+                'layer': props.get('layer'),
+                'valid_from_utc': props.get('valid_from_utc'),
+                'valid_to_utc': props.get('valid_to_utc'),
+            }
+
+
+def _intersects(bboxes, bounds):
+    """Boolean mask of (n, 4) bboxes that intersect a bounds tuple."""
+    if not len(bboxes):
+        return np.zeros(0, dtype=bool)
+    return ((bboxes[:, 0] <= bounds[2]) & (bboxes[:, 2] >= bounds[0])
+            & (bboxes[:, 1] <= bounds[3]) & (bboxes[:, 3] >= bounds[1]))
+
+
+# ---------------------------------------------------------------------------
+# Tile cache
+# ---------------------------------------------------------------------------
+class LayerTiles:
+    """Features and cached tiles for one vector-tile layer."""
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind  # 'polygon' or 'point'
+        self.source = None
+        self.features = {}  # id -> (hash, geometry, properties, bbox, ring index)
+        self.ids = []
+        self.bboxes = np.zeros((0, 4))
+        self.tiles = OrderedDict()
+        self.generation = 0  # bumped by every sync that loads a new version
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'renders': 0, 'invalidated': 0}
+
+    def sync(self, source, features):
+        """Load a new version of the source data, dropping only tiles it touches.
+
+        `source` identifies the version (the data object itself, or a file
+        mtime); nothing happens if it is the one already loaded.
+        """
+        with self.lock:
+            if source is self.source or (source == self.source and source is not None):
+                return 0
+            new = {}
+            for feature_id, geometry, props in features:
+                if self.kind == 'point':
+                    index = None
+                    bbox = (geometry[0], geometry[1], geometry[0], geometry[1])
+                else:
+                    index = _polygon_index(geometry)
+                    if not len(index[0]):
+                        continue
+                    bboxes = index[1]
+                    bbox = (bboxes[:, 0].min(), bboxes[:, 1].min(), bboxes[:, 2].max(), bboxes[:, 3].max())
+                new[feature_id] = (content_hash([geometry, props]), geometry, props, bbox, index)
+
+            changed = [entry[3] for fid, entry in self.features.items()
+                       if fid not in new or new[fid][0] != entry[0]]
+            changed += [entry[3] for fid, entry in new.items()
+                        if fid not in self.features or self.features[fid][0] != entry[0]]
+
+            dropped = 0
+            if changed and self.tiles:
+                changed_bboxes = np.asarray(changed, dtype=float)
+                for key in list(self.tiles):
+                    if _intersects(changed_bboxes, _buffered_bounds(*key)).any():
+                        del self.tiles[key]
+                        dropped += 1
+
+            self.features = new
+            self.ids = list(new)
+            self.bboxes = np.asarray([new[fid][3] for fid in self.ids], dtype=float).reshape(-1, 4)
+            self.source = source
+            self.generation += 1
+            self.stats['invalidated'] += dropped
+            return dropped
+
+    def render(self, z, x, y):
+        """Encoded tile bytes (empty bytes if no feature falls in the tile)."""
+        key = (z, x, y)
+        with self.lock:
+            cached = self.tiles.get(key)
+            if cached is not None:
+                self.tiles.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached
+            bounds = _buffered_bounds(z, x, y)
+            hits = np.nonzero(_intersects(self.bboxes, bounds))[0]
+            candidates = [(self.ids[i], self.features[self.ids[i]]) for i in hits]
+            generation = self.generation
+
+        encoded = []
+        for feature_id, (_, geometry, props, _, index) in candidates:
+            if self.kind == 'point':
+                px, py = _to_tile_px([geometry], z, x, y)[0]
+                encoded.append((feature_id, _GEOM_POINT, _encode_point(int(round(px)), int(round(py))), props))
+            else:
+                rings = _polygon_rings(index, z, x, y)
+                if rings:
+                    encoded.append((feature_id, _GEOM_POLYGON, _encode_polygon(rings), props))
+        tile = encode_layer(self.name, encoded) if encoded else b''
+
+        with self.lock:
+            self.stats['renders'] += 1
+            # A sync while we rendered may have invalidated this tile: only cache it if none ran
+            if self.generation != generation:
+                return tile
+            self.tiles[key] = tile
+            while len(self.tiles) > MAX_CACHED_TILES:
+                self.tiles.popitem(last=False)
+        return tile
+
+    def covered_tiles(self, z):
+        """All tiles at zoom z that at least one feature's bbox touches."""
+        tiles = set()
+        for bbox in self.bboxes:
+            x0, y0, x1, y1 = tile_range(bbox, z)
+            for tx in range(x0, x1 + 1):
+                for ty in range(y0, y1 + 1):
+                    tiles.add((tx, ty))
+        return sorted(tiles)
+
+
+LAYERS = {
+    'fires': LayerTiles('fires', 'polygon'),
+    'modis': LayerTiles('modis', 'point'),
+    'viirs': LayerTiles('viirs', 'point'),
+    'predictions': LayerTiles('predictions', 'polygon'),
+}
+
+
+def render_pyramid(layer, out_dir, max_zoom):
+    """Write every non-empty tile of a synced layer up to max_zoom as z/x/y.pbf."""
+    written = 0
+    for z in range(max_zoom + 1):
+        for x, y in layer.covered_tiles(z):
+            tile = layer.render(z, x, y)
+            if not tile:
+                continue
+            path = os.path.join(out_dir, layer.name, str(z), str(x), f'{y}.pbf')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as fh:
+                fh.write(tile)
+            os.replace(tmp, path)
+            written += 1
+    return written
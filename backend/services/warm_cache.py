@@ -0,0 +1,83 @@
+"""
+Warm start for live serving mode: persist the in-process caches to disk.
+
+In live mode every process keeps fire / MODIS / VIIRS data in memory only, so
+a restart meant three full ArcGIS downloads before the first response - and a
+restart during an ArcGIS outage meant 500s. Now each successful refresh is
+written to <WARM_DIR>/<name>.json:
+
+    {"name": "fires", "fetchedAt": 1760831234.5, "savedAt": ..., "payload": {...}}
+
+atomically (temp file + fsync + rename) from a background writer thread, so
+the request that refreshed never waits on the disk. At boot, `load` hands the
+last good copy back with its original fetch time, so it expires like any
+other cache entry. Once expired, a copy up to MAX_AGE old is served right
+away, marked stale with its age, while a background refresh replaces it;
+older copies are only a fallback for when that refresh fails.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+WARM_DIR = os.environ.get(
+    'FLAMEFLUX_WARM_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'warm')
+)
+MAX_AGE = float(os.environ.get('FLAMEFLUX_WARM_MAX_AGE', 6 * 3600))
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='warm-cache')
+_lock = threading.Lock()
+_latest = {}  # name -> fetchedAt of the newest copy queued, so stale queued writes are skipped
+
+
+def _path(name):
+    return os.path.join(WARM_DIR, f'{name}.json')
+
+
+def _write(name, payload, fetched_at):
+    with _lock:
+        if _latest.get(name) != fetched_at:
+            return  # a newer copy is already queued
+    try:
+        os.makedirs(WARM_DIR, exist_ok=True)
+        body = json.dumps({'name': name, 'fetchedAt': fetched_at, 'savedAt': time.time(), 'payload': payload},
+                          separators=(',', ':')).encode('utf-8')
+        path = _path(name)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(body)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Warm cache: failed to persist {name}: {e}")
+
+
+def save(name, payload, fetched_at):
+    """Queue the last good payload of a dataset for writing."""
+    with _lock:
+        _latest[name] = fetched_at
+    _writer.submit(_write, name, payload, fetched_at)
+
+
+def flush():
+    """Block until every queued write is on disk."""
+    _writer.submit(lambda: None).result()
+
+
+def load(name):
+    """{'payload', 'fetchedAt', 'ageSeconds', 'expired'} of the persisted copy, or None."""
+    try:
+        with open(_path(name), 'rb') as fh:
+            stored = json.load(fh)
+        payload, fetched_at = stored['payload'], float(stored['fetchedAt'])
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Warm cache: ignoring unreadable {name} copy: {e}")
+        return None
+    age = time.time() - fetched_at
+    return {'payload': payload, 'fetchedAt': fetched_at, 'ageSeconds': age, 'expired': age > MAX_AGE}
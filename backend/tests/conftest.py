@@ -0,0 +1,7 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Same flat imports as app.py
+sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, 'services')]
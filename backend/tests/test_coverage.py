@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pytest
+
+import coverage
+from coverage import CoverageGrid
+
+
+def brute_force_covered(edges, lats, lons):
+    """Even-odd ray casting of every point against every mask edge: covered = outside the mask."""
+    x1, y1, x2, y2 = (a[None, :] for a in edges)
+    px, py = lons[:, None], lats[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        straddles = (y1 > py) != (y2 > py)
+        crossings = straddles & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+    return np.count_nonzero(crossings, axis=1) % 2 == 0
+
+
+def near_edge_points(edges, rng, n):
+    """Points within ~1 km of random mask edges, where the grid falls back to its exact test."""
+    x1, y1, x2, y2 = edges
+    finite = (np.abs(x1) < 180) & (np.abs(y1) < 90) & (np.abs(x2) < 180) & (np.abs(y2) < 90)
+    pick = rng.choice(np.nonzero(finite)[0], n)
+    t = rng.random(n)
+    jitter = rng.normal(scale=0.01, size=(2, n))
+    lons = x1[pick] + t * (x2[pick] - x1[pick]) + jitter[0]
+    lats = y1[pick] + t * (y2[pick] - y1[pick]) + jitter[1]
+    return lats, lons
+
+
+def square_with_hole(tmp_path):
+    """Mask: everything but a 10x10 degree square with a 2x2 hole (so covered: square minus hole)."""
+    world = [[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]]
+    square = [[-100, 30], [-90, 30], [-90, 40], [-100, 40], [-100, 30]]
+    hole = [[-96.05, 34.05], [-93.95, 34.05], [-93.95, 35.95], [-96.05, 35.95], [-96.05, 34.05]]
+    path = tmp_path / 'mask.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'MultiPolygon', 'coordinates': [[world, square], [hole]]}},
+    ]}))
+    return str(path)
+
+
+def test_synthetic_mask_matches_brute_force(tmp_path):
+    edges = coverage._mask_edges(square_with_hole(tmp_path))
+    grid = CoverageGrid(*edges)
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(29, 41, 20000), rng.uniform(-101, -89, 20000)
+    near_lats, near_lons = near_edge_points(edges, rng, 20000)
+    lats, lons = np.concatenate([lats, near_lats]), np.concatenate([lons, near_lons])
+    np.testing.assert_array_equal(grid.contains(lats, lons), brute_force_covered(edges, lats, lons))
+    assert grid.contains([35.0, 31.0, 45.0], [-95.0, -99.0, -95.0]).tolist() == [False, True, False]
+
+
+@pytest.mark.skipif(coverage.get_grid() is None, reason='coverage mask file not available')
+def test_mask_matches_brute_force():
+    edges = coverage._mask_edges(coverage.MASK_PATH)
+    grid = coverage.get_grid()
+    rng = np.random.default_rng(1)
+    lats = rng.uniform(grid.y0, grid.y0 + grid.ny * grid.cell, 30000)
+    lons = rng.uniform(grid.x0, grid.x0 + grid.nx * grid.cell, 30000)
+    near_lats, near_lons = near_edge_points(edges, rng, 30000)
+    lats, lons = np.concatenate([lats, near_lats]), np.concatenate([lons, near_lons])
+    np.testing.assert_array_equal(grid.contains(lats, lons), brute_force_covered(edges, lats, lons))
+
+
+def test_off_grid_and_nan_points_are_not_covered(tmp_path):
+    grid = CoverageGrid(*coverage._mask_edges(square_with_hole(tmp_path)))
+    assert not grid.contains([np.nan, 0.0, 35.0], [-95.0, 0.0, np.nan]).any()
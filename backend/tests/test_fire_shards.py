@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts'))
+import generate_data  # noqa: E402
+
+
+def square(lng, lat, size=0.1):
+    ring = [[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def payload(*fires):
+    return {'generatedAt': '2026-01-01T00:00:00', 'count': len(fires),
+            'fires': [{'id': fire_id, 'name': f'Fire {fire_id}', 'geometry': geometry} for fire_id, geometry in fires]}
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_data, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(generate_data.perimeter_cache, 'path', None)
+    (tmp_path / generate_data.FIRE_SHARDS_DIR).mkdir()
+    return tmp_path
+
+
+def run(data_dir, body):
+    generate_data.write_fire_shards(body)
+    with open(data_dir / generate_data.FIRES_SUMMARY_FILE) as fh:
+        return json.load(fh)
+
+
+def shard_files(data_dir):
+    return {f'{generate_data.FIRE_SHARDS_DIR}/{name}' for name in os.listdir(data_dir / generate_data.FIRE_SHARDS_DIR)}
+
+
+def test_summary_points_at_shards_holding_each_geometry(data_dir):
+    geometry = square(-120, 38)
+    summary = run(data_dir, payload((1, geometry), (2, None)))
+    fire, no_geometry = summary['fires']
+    assert 'geometry' not in fire and fire['bbox'] == [-120, 38, -119.9, 38.1]
+    with open(data_dir / fire['shard']) as fh:
+        assert json.load(fh) == {'id': 1, 'geometry': geometry}
+    assert no_geometry['shard'] is None
+    with open(data_dir / summary['lodBundle']) as fh:
+        assert set(json.load(fh)['geometries']) == {'1'}
+
+
+def test_unchanged_fire_keeps_its_shard(data_dir):
+    first = run(data_dir, payload((1, square(-120, 38)), (2, square(-110, 35))))
+    second = run(data_dir, payload((1, square(-120, 38)), (2, square(-110, 35))))
+    assert [f['shard'] for f in first['fires']] == [f['shard'] for f in second['fires']]
+    assert first['lodBundle'] == second['lodBundle']
+
+
+def test_prune_keeps_the_previous_summarys_shards(data_dir):
+    first = run(data_dir, payload((1, square(-120, 38)), (2, square(-110, 35))))
+    second = run(data_dir, payload((1, square(-120, 38, size=0.2)), (2, square(-110, 35))))
+    old_shard, new_shard = first['fires'][0]['shard'], second['fires'][0]['shard']
+    assert old_shard != new_shard
+    # A client still holding the first summary can fetch everything it references
+    assert generate_data.shard_names(first) <= shard_files(data_dir)
+    assert generate_data.shard_names(second) <= shard_files(data_dir)
+
+    third = run(data_dir, payload((1, square(-120, 38, size=0.2)), (2, square(-110, 35))))
+    assert shard_files(data_dir) == generate_data.shard_names(second) | generate_data.shard_names(third)
+    assert old_shard not in shard_files(data_dir)
+
+
+def test_prune_leaves_non_shard_files_alone(data_dir):
+    shards = data_dir / generate_data.FIRE_SHARDS_DIR
+    (shards / 'stray.json').write_text('{}')
+    (shards / 'notes.txt').write_text('keep me')
+    summary = run(data_dir, payload((1, square(-120, 38))))
+    files = shard_files(data_dir)
+    assert 'fires/stray.json' not in files and 'fires/notes.txt' in files
+    assert generate_data.shard_names(summary) <= files
@@ -0,0 +1,60 @@
+import pytest
+
+from hotspot_merge import METERS_PER_DEGREE, merge_hotspots
+
+
+def hotspot(source, id, lat, lng, confidence=80, age=0.5):
+    return {'id': id, 'source': source, 'latitude': lat, 'longitude': lng,
+            'confidence': confidence, 'intensity': 10, 'age': age}
+
+
+def north(lat, meters):
+    return lat + meters / METERS_PER_DEGREE
+
+
+@pytest.mark.parametrize('lng', [-150.0, -120.0, -80.0, -1.0])
+@pytest.mark.parametrize('meters', [200, 300, 350])
+def test_same_longitude_duplicates_merge_everywhere(lng, meters):
+    result = merge_hotspots([hotspot('MODIS', 1, 40.0, lng)],
+                            [hotspot('VIIRS', 2, north(40.0, meters), lng)])
+    assert len(result['hotspots']) == 1
+    assert result['hotspots'][0]['sources'] == ['MODIS', 'VIIRS']
+
+
+def test_farther_than_dedup_distance_is_kept():
+    result = merge_hotspots([hotspot('MODIS', 1, 40.0, -120.0)],
+                            [hotspot('VIIRS', 2, north(40.0, 450), -120.0)])
+    assert len(result['hotspots']) == 2
+
+
+def test_outside_time_window_is_kept():
+    result = merge_hotspots([hotspot('MODIS', 1, 40.0, -120.0, age=0.5)],
+                            [hotspot('VIIRS', 2, 40.0, -120.0, age=3.0)])
+    assert len(result['hotspots']) == 2
+
+
+def test_cross_sensor_point_does_not_chain_same_sensor_detections():
+    viirs = [hotspot('VIIRS', 1, 40.0, -120.0), hotspot('VIIRS', 2, north(40.0, 600), -120.0)]
+    modis = [hotspot('MODIS', 3, north(40.0, 300), -120.0, confidence=90)]
+    merged = merge_hotspots(modis, viirs)['hotspots']
+    assert len(merged) == 2
+    assert sorted(len(h['members']) for h in merged) == [1, 2]
+
+
+def test_each_detection_matches_its_nearest_partner():
+    viirs = [hotspot('VIIRS', 1, 40.0, -120.0), hotspot('VIIRS', 2, north(40.0, 100), -120.0)]
+    modis = [hotspot('MODIS', 3, north(40.0, 90), -120.0)]
+    merged = merge_hotspots(modis, viirs)['hotspots']
+    pair = next(h for h in merged if len(h['members']) == 2)
+    assert {m['id'] for m in pair['members']} == {2, 3}
+
+
+def test_no_cluster_holds_two_detections_from_one_sensor():
+    # A dense VIIRS front with MODIS pixels interleaved along it
+    viirs = [hotspot('VIIRS', i, north(40.0, 150 * i), -120.0) for i in range(40)]
+    modis = [hotspot('MODIS', 100 + i, north(40.0, 150 * i + 75), -120.0) for i in range(0, 40, 3)]
+    merged = merge_hotspots(modis, viirs)['hotspots']
+    assert len(merged) == len(viirs)
+    for record in merged:
+        sources = [m['source'] for m in record['members']]
+        assert len(sources) == len(set(sources))
@@ -0,0 +1,250 @@
+import struct
+
+import pytest
+
+import vector_tiles
+from vector_tiles import EXTENT, LayerTiles, encode_layer
+
+
+# ---------------------------------------------------------------------------
+# Minimal MVT v2 decoder (protobuf wire format by hand, like the encoder)
+# ---------------------------------------------------------------------------
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def read_fields(data):
+    """[(field number, value)] of a message; length-delimited values as bytes."""
+    fields, pos = [], 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = struct.unpack('<d', data[pos:pos + 8])[0], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        else:
+            raise AssertionError(f'unexpected wire type {wire_type}')
+        fields.append((number, value))
+    return fields
+
+
+def read_packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def decode_value(data):
+    (number, value), = read_fields(data)
+    if number == 1:
+        return value.decode('utf-8')
+    if number == 3:
+        return value
+    if number == 5:
+        return value
+    if number == 6:
+        return unzigzag(value)
+    if number == 7:
+        return bool(value)
+    raise AssertionError(f'unexpected value field {number}')
+
+
+def decode_geometry(commands):
+    """Rings (or [[point]]) as lists of absolute (x, y) tuples."""
+    parts, current, pos, x, y = [], [], 0, 0, 0
+    while pos < len(commands):
+        command, count = commands[pos] & 0x7, commands[pos] >> 3
+        pos += 1
+        if command == 7:
+            parts.append(current)
+            current = []
+            continue
+        for _ in range(count):
+            x += unzigzag(commands[pos])
+            y += unzigzag(commands[pos + 1])
+            pos += 2
+            if command == 1 and current:
+                parts.append(current)
+                current = []
+            current.append((x, y))
+    if current:
+        parts.append(current)
+    return parts
+
+
+def decode_tile(tile):
+    """{layer name: {'extent', 'version', 'features': [{'id', 'type', 'geometry', 'properties'}]}}"""
+    layers = {}
+    for number, layer_bytes in read_fields(tile):
+        assert number == 3
+        layer = {'features': [], 'keys': [], 'values': []}
+        for field, value in read_fields(layer_bytes):
+            if field == 15:
+                layer['version'] = value
+            elif field == 1:
+                layer['name'] = value.decode('utf-8')
+            elif field == 2:
+                layer['features'].append(value)
+            elif field == 3:
+                layer['keys'].append(value.decode('utf-8'))
+            elif field == 4:
+                layer['values'].append(decode_value(value))
+            elif field == 5:
+                layer['extent'] = value
+        features = []
+        for feature_bytes in layer['features']:
+            feature = {'id': None, 'properties': {}}
+            for field, value in read_fields(feature_bytes):
+                if field == 1:
+                    feature['id'] = value
+                elif field == 2:
+                    tags = read_packed(value)
+                    feature['properties'] = {layer['keys'][k]: layer['values'][v]
+                                             for k, v in zip(tags[::2], tags[1::2])}
+                elif field == 3:
+                    feature['type'] = value
+                elif field == 4:
+                    feature['geometry'] = decode_geometry(read_packed(value))
+            features.append(feature)
+        layers[layer['name']] = {'version': layer['version'], 'extent': layer['extent'], 'features': features}
+    return layers
+
+
+# ---------------------------------------------------------------------------
+# Encoder round trip
+# ---------------------------------------------------------------------------
+def test_encode_layer_round_trip():
+    rings = [[(10, 10), (200, 10), (200, 300), (10, 300)], [(50, 50), (50, 100), (100, 100), (100, 50)]]
+    properties = {'name': 'Ridge Fire', 'size': 1200, 'delta': -7, 'ratio': 0.25, 'active': True, 'missing': None}
+    tile = encode_layer('fires', [
+        (42, vector_tiles._GEOM_POLYGON, vector_tiles._encode_polygon(rings), properties),
+        ('not-an-int', vector_tiles._GEOM_POINT, vector_tiles._encode_point(-20, 4100), {'name': 'Ridge Fire'}),
+    ])
+    layer = decode_tile(tile)['fires']
+    assert layer['version'] == 2 and layer['extent'] == EXTENT
+
+    polygon, point = layer['features']
+    assert polygon['id'] == 42 and polygon['type'] == vector_tiles._GEOM_POLYGON
+    assert polygon['geometry'] == rings
+    assert polygon['properties'] == {k: v for k, v in properties.items() if v is not None}
+    assert point['id'] is None and point['type'] == vector_tiles._GEOM_POINT
+    assert point['geometry'] == [[(-20, 4100)]]
+    assert point['properties'] == {'name': 'Ridge Fire'}
+
+
+def square(lng, lat, size=0.5):
+    ring = [[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def fire_data(*fires):
+    return {'fires': [{'id': fire_id, 'name': f'Fire {fire_id}', 'size': size, 'geometry': geometry}
+                      for fire_id, geometry, size in fires]}
+
+
+def tile_of(lng, lat, z):
+    x0, y0, _, _ = vector_tiles.tile_range((lng, lat, lng, lat), z)
+    return z, x0, y0
+
+
+def test_rendered_polygon_is_an_oriented_ring_inside_the_buffer():
+    layer = LayerTiles('fires', 'polygon')
+    layer.sync('v1', vector_tiles.fire_features(fire_data((1, square(-120.2, 38.1), 500))))
+    feature, = decode_tile(layer.render(*tile_of(-120.0, 38.3, 8)))['fires']['features']
+    ring, = feature['geometry']
+    assert feature['id'] == 1 and feature['properties']['size'] == 500
+    assert all(-vector_tiles.BUFFER <= v <= EXTENT + vector_tiles.BUFFER for point in ring for v in point)
+    assert vector_tiles._ring_area(ring) > 0  # exterior: positive area in tile space (y down)
+
+
+def test_rendered_point_lands_on_its_pixel():
+    layer = LayerTiles('viirs', 'point')
+    layer.sync('v1', vector_tiles.hotspot_features({'hotspots': [
+        {'id': 7, 'longitude': -118.25, 'latitude': 34.05, 'confidence': 90, 'source': 'VIIRS'},
+    ]}))
+    z, x, y = tile_of(-118.25, 34.05, 10)
+    feature, = decode_tile(layer.render(z, x, y))['viirs']['features']
+    px, py = vector_tiles._to_tile_px([[-118.25, 34.05]], z, x, y)[0]
+    assert feature['geometry'] == [[(round(px), round(py))]]
+    assert feature['properties'] == {'confidence': 90, 'source': 'VIIRS'}
+
+
+# ---------------------------------------------------------------------------
+# Tile cache invalidation
+# ---------------------------------------------------------------------------
+@pytest.fixture
+def two_fires():
+    layer = LayerTiles('fires', 'polygon')
+    north, south = square(-120.2, 45.1), square(-110.2, 33.1)
+    data = fire_data((1, north, 100), (2, south, 200))
+    layer.sync(data, vector_tiles.fire_features(data))
+    north_tile, south_tile = tile_of(-120.0, 45.3, 8), tile_of(-110.0, 33.3, 8)
+    layer.render(*north_tile)
+    layer.render(*south_tile)
+    return layer, data, north_tile, south_tile
+
+
+def test_sync_drops_only_tiles_touched_by_changed_features(two_fires):
+    layer, data, north_tile, south_tile = two_fires
+    changed = fire_data((1, data['fires'][0]['geometry'], 100), (2, data['fires'][1]['geometry'], 900))
+    assert layer.sync(changed, vector_tiles.fire_features(changed)) == 1
+    assert north_tile in layer.tiles and south_tile not in layer.tiles
+
+    feature, = decode_tile(layer.render(*south_tile))['fires']['features']
+    assert feature['properties']['size'] == 900
+    hits = layer.stats['hits']
+    layer.render(*north_tile)
+    assert layer.stats['hits'] == hits + 1
+
+
+def test_sync_drops_tiles_of_removed_features(two_fires):
+    layer, data, north_tile, south_tile = two_fires
+    remaining = fire_data((1, data['fires'][0]['geometry'], 100))
+    layer.sync(remaining, vector_tiles.fire_features(remaining))
+    assert north_tile in layer.tiles
+    assert layer.render(*south_tile) == b''
+
+
+def test_same_source_is_not_reloaded(two_fires):
+    layer, data, north_tile, south_tile = two_fires
+    generation = layer.generation
+    assert layer.sync(data, vector_tiles.fire_features(data)) == 0
+    assert layer.generation == generation and len(layer.tiles) == 2
+
+
+def test_tile_rendered_across_a_sync_is_not_cached(monkeypatch):
+    layer = LayerTiles('fires', 'polygon')
+    first = fire_data((1, square(-120.2, 38.1), 100))
+    layer.sync(first, vector_tiles.fire_features(first))
+    key = tile_of(-120.0, 38.3, 8)
+    second = fire_data((1, square(-120.2, 38.1), 999))
+    render_rings = vector_tiles._polygon_rings
+
+    def sync_mid_render(*args):
+        layer.sync(second, vector_tiles.fire_features(second))
+        return render_rings(*args)
+
+    monkeypatch.setattr(vector_tiles, '_polygon_rings', sync_mid_render)
+    stale = layer.render(*key)
+    assert decode_tile(stale)['fires']['features'][0]['properties']['size'] == 100
+    assert key not in layer.tiles
+
+    monkeypatch.setattr(vector_tiles, '_polygon_rings', render_rings)
+    assert decode_tile(layer.render(*key))['fires']['features'][0]['properties']['size'] == 999
@@ -0,0 +1,282 @@
+"""
+Opt-in request profiling and per-stage timing traces.
+
+Profiling is off unless turned on through the environment:
+
+    FLAMEFLUX_PROFILE=1                  profile every request / generator run
+    FLAMEFLUX_PROFILE_SAMPLE_RATE=0.05   profile a random ~5% of requests
+    FLAMEFLUX_PROFILE_DIR=/tmp/profiles  where profiles are written
+    FLAMEFLUX_SLOW_TRACE_MS=500          traces slower than this are kept for /api/debug/traces
+
+A trace records wall time, CPU time (of the calling thread) and net/peak
+allocations for every `stage(...)` block that runs while it is active.
+tracemalloc runs only while at least one trace is active, and its counters
+are process-wide: allocKb/peakKb are only reported while a single trace is
+running (they are null when traces overlap, e.g. concurrent gthread requests). When a
+trace finishes, two files are written to the profile directory:
+
+    <stamp>-<name>.prof     cProfile stats (snakeviz, flameprof, pstats)
+    <stamp>-<name>.folded   collapsed stacks of the stages, in microseconds
+                            (flamegraph.pl, speedscope, inferno)
+
+When no trace is active `stage()` is a no-op, so the instrumentation can stay
+in the hot paths permanently.
+
+A streamed response body is produced after its view has returned, so a
+`stage()` around the view never sees it. `timed_iter(name, chunks)` times the
+production of the chunks as a stage of the trace that was active when it was
+wrapped, recorded once the stream is exhausted or closed; the app keeps such
+a trace open until then (`detach_trace`, then `finish_trace(trace)`).
+"""
+
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+PROFILE_ENABLED = os.environ.get('FLAMEFLUX_PROFILE', '').lower() in ('1', 'true', 'yes')
+try:
+    SAMPLE_RATE = float(os.environ.get('FLAMEFLUX_PROFILE_SAMPLE_RATE') or 0)
+except ValueError:
+    SAMPLE_RATE = 0.0
+PROFILE_DIR = os.environ.get(
+    'FLAMEFLUX_PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'profiles')
+)
+SLOW_TRACE_MS = float(os.environ.get('FLAMEFLUX_SLOW_TRACE_MS') or 500)
+MAX_RECENT_TRACES = 50
+
+_local = threading.local()
+_tracing_lock = threading.Lock()
+_tracing = {'active': 0, 'started': 0, 'owned': False}  # live / ever-started traces; whether we started tracemalloc
+_recent_traces = deque(maxlen=MAX_RECENT_TRACES)
+_recent_lock = threading.Lock()
+
+
+class Trace:
+    """Timings collected for one profiled request or generator run."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now()
+        self.stages = []
+        self.stack = []
+        self.profiler = cProfile.Profile()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self.wall_ms = None
+        self.cpu_ms = None
+        self.files = []
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'startedAt': self.started_at.isoformat(),
+            'wallMs': self.wall_ms,
+            'cpuMs': self.cpu_ms,
+            'stages': self.stages,
+            'files': self.files,
+        }
+
+
+def is_enabled():
+    return PROFILE_ENABLED or SAMPLE_RATE > 0
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def start_trace(name, force=False):
+    """Start a trace on this thread if profiling is enabled (or sampled in)."""
+    if current_trace() is not None:
+        return None
+    if not force and not PROFILE_ENABLED:
+        if SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE:
+            return None
+
+    with _tracing_lock:
+        _tracing['active'] += 1
+        _tracing['started'] += 1
+        if _tracing['active'] == 1 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['owned'] = True
+    trace = Trace(name)
+    _local.trace = trace
+    trace.profiler.enable()
+    return trace
+
+
+def detach_trace():
+    """Take the active trace off this thread without finishing it (see finish_trace)."""
+    trace = current_trace()
+    _local.trace = None
+    return trace
+
+
+def finish_trace(trace=None):
+    """Stop the active (or a detached) trace, write its profiles and return its summary."""
+    if trace is None:
+        trace = current_trace()
+        if trace is None:
+            return None
+        _local.trace = None
+
+    trace.profiler.disable()
+    trace.wall_ms = round((time.perf_counter() - trace.wall_start) * 1000, 2)
+    trace.cpu_ms = round((time.thread_time() - trace.cpu_start) * 1000, 2)
+    with _tracing_lock:
+        _tracing['active'] -= 1
+        # Stop paying tracemalloc's per-allocation cost once nothing is profiled
+        if _tracing['active'] == 0 and _tracing['owned']:
+            tracemalloc.stop()
+            _tracing['owned'] = False
+
+    try:
+        _write_profiles(trace)
+    except OSError as e:
+        print(f"Could not write profile for {trace.name}: {e}")
+
+    summary = trace.summary()
+    if trace.wall_ms >= SLOW_TRACE_MS:
+        with _recent_lock:
+            _recent_traces.append(summary)
+    return summary
+
+
+@contextmanager
+def stage(name):
+    """Time a block of work as a named stage of the active trace."""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+
+    trace.stack.append(name)
+    path = ';'.join([trace.name] + trace.stack)
+    # The counters are process-wide: with other traces running they would mix
+    # in their allocations, so memory is only measured for a lone trace
+    alone = _single_trace()
+    if alone:
+        mem_before, _ = tracemalloc.get_traced_memory()
+        # A nested stage resets its parent's peak; parents report the peak
+        # seen after their last child finished.
+        tracemalloc.reset_peak()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        wall_ms = (time.perf_counter() - wall_start) * 1000
+        cpu_ms = (time.thread_time() - cpu_start) * 1000
+        alloc_kb = peak_kb = None
+        # ...and only if no other trace started (and reset the peak) meanwhile
+        if alone and _single_trace() == alone:
+            mem_after, mem_peak = tracemalloc.get_traced_memory()
+            alloc_kb = round((mem_after - mem_before) / 1024, 1)
+            peak_kb = round(max(mem_peak - mem_before, 0) / 1024, 1)
+        trace.stack.pop()
+        trace.stages.append({
+            'stage': path,
+            'wallMs': round(wall_ms, 2),
+            'cpuMs': round(cpu_ms, 2),
+            'allocKb': alloc_kb,
+            'peakKb': peak_kb,
+        })
+
+
+def timed_iter(name, chunks):
+    """Yield from `chunks`, timing their production as a stage of the active trace."""
+    trace = current_trace()
+    if trace is None:
+        return chunks
+    return _timed_chunks(trace, ';'.join([trace.name] + trace.stack + [name]), chunks)
+
+
+def _timed_chunks(trace, path, chunks):
+    # Only the time spent producing chunks counts, not the time the server
+    # spends writing them; memory isn't measured (other requests run between chunks)
+    wall_s = cpu_s = 0.0
+    try:
+        iterator = iter(chunks)
+        while True:
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                wall_s += time.perf_counter() - wall_start
+                cpu_s += time.thread_time() - cpu_start
+            yield chunk
+    finally:
+        trace.stages.append({
+            'stage': path,
+            'wallMs': round(wall_s * 1000, 2),
+            'cpuMs': round(cpu_s * 1000, 2),
+            'allocKb': None,
+            'peakKb': None,
+        })
+
+
+def _single_trace():
+    """A token identifying this moment if exactly one trace is active, else None."""
+    with _tracing_lock:
+        if _tracing['active'] == 1 and tracemalloc.is_tracing():
+            return _tracing['started']
+        return None
+
+
+def profiled(name=None):
+    """Decorator form of `stage()`; defaults to the function's name."""
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_slow_traces():
+    with _recent_lock:
+        return list(reversed(_recent_traces))
+
+
+def _write_profiles(trace):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', trace.name).strip('_') or 'trace'
+    base = os.path.join(PROFILE_DIR, f"{trace.started_at.strftime('%Y%m%d-%H%M%S-%f')}-{safe_name}")
+
+    prof_path = base + '.prof'
+    trace.profiler.dump_stats(prof_path)
+
+    # Stage timings are inclusive; folded stacks want self time, so total each
+    # stack path and subtract the time spent in its direct children.
+    total_us = {trace.name: trace.wall_ms * 1000}
+    child_us = {}
+    for entry in trace.stages:
+        path = entry['stage']
+        parent = path.rsplit(';', 1)[0]
+        total_us[path] = total_us.get(path, 0) + entry['wallMs'] * 1000
+        child_us[parent] = child_us.get(parent, 0) + entry['wallMs'] * 1000
+    lines = [
+        f"{path} {max(int(us - child_us.get(path, 0)), 0)}"
+        for path, us in total_us.items()
+    ]
+
+    folded_path = base + '.folded'
+    with open(folded_path, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+
+    trace.files = [prof_path, folded_path]
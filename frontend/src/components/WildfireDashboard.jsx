@@ -5,7 +5,7 @@ import FireList from './FireList';
 import PredictionPanel from './PredictionPanel';
 import PredictionTimeline from './PredictionTimeline';
 import LayersControl from './LayersControl';
-import { fetchRealTimeFireData } from '../services/fireApiDirect';
+import { fetchRealTimeFireData, fetchFireGeometry } from '../services/fireApiDirect';
 import { fetchSatelliteData } from '../services/satelliteApiDirect';
 import { fetchPredictionIndex, fetchFirePrediction } from '../services/predictionsApi';
 import { normalizeFireName } from '../utils/helpers';
@@ -204,6 +204,20 @@ const WildfireDashboard = () => {
   // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []); // Empty dependency array since these functions are stable
 
+  // Swap a fire's low-LOD perimeter for the full-detail one from its shard.
+  const loadFullGeometry = useCallback(async (fire) => {
+    if (!fire || fire.fullGeometry !== false) return;
+    try {
+      const geometry = await fetchFireGeometry(fire);
+      if (!geometry) return;
+      const detailed = { ...fire, geometry, fullGeometry: true };
+      setFires(prev => prev.map(f => (f.id === fire.id ? detailed : f)));
+      setSelectedFire(prev => (prev && prev.id === fire.id ? detailed : prev));
+    } catch (error) {
+      console.error(`Failed to load full perimeter for ${fire.name}:`, error);
+    }
+  }, []);
+
   const handleFireClick = useCallback(async (fire) => {
     console.log('handleFireClick called with:', fire);
     setSelectedFire(fire);
@@ -221,13 +235,16 @@ const WildfireDashboard = () => {
       console.log('No geometry found for fire or mapRef not ready:', fire);
     }
 
+    // Full perimeter for the selected fire (no await, the low-LOD one is already drawn)
+    loadFullGeometry(fire);
+
     // Load fire prediction data (no await since we don't want to block the UI)
     loadFirePrediction(fire);
 
     // No longer need the old prediction API call since we removed the 24-hour prediction box
     setPrediction(null);
     setLoading(false);
-  }, [loadFirePrediction, clearFirePrediction]);
+  }, [loadFirePrediction, clearFirePrediction, loadFullGeometry]);
   // Handle satellite layer toggle
   const handleLayerToggle = useCallback((satellite) => {
     setSatelliteLayers(prev => ({
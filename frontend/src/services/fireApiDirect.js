@@ -1,19 +1,85 @@
 // Fire data is precomputed by the 30-minute automation (scripts/generate_data.py)
-// and served as a static file from /data/fires.json. This avoids a slow, live
-// ArcGIS call + client-side processing on every page load.
+// and served as static files from /data. This avoids a slow, live ArcGIS call
+// + client-side processing on every page load.
+//
+// The map only waits for /data/fires-summary.json (every fire without its
+// geometry, with `bbox`, `shard` and `lodBundle`) and the national low-LOD
+// bundle it names, which has every perimeter at the coarsest tolerance. A
+// fire's full perimeter lives in its own shard, /data/fires/<hash>.json, and
+// is fetched when it is needed. Shard and bundle names are content hashes, so
+// an unchanged fire's shard is reused from the browser / CDN cache.
 
-export const fetchRealTimeFireData = async () => {
+const dataBase = () => `${process.env.PUBLIC_URL || ''}/data`;
+
+const fetchJson = async (url, options) => {
+  const response = await fetch(url, options);
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  return response.json();
+};
+
+// shard path -> Promise of its geometry
+const shardRequests = new Map();
+
+// Full-detail geometry of a fire from the summary; null if it has none.
+export const fetchFireGeometry = (fire) => {
+  if (!fire || !fire.shard) return Promise.resolve(fire ? fire.geometry || null : null);
+  if (!shardRequests.has(fire.shard)) {
+    const request = fetchJson(`${dataBase()}/${fire.shard}`, { cache: 'force-cache' })
+      .then((shard) => shard.geometry)
+      .catch((error) => {
+        shardRequests.delete(fire.shard);
+        throw error;
+      });
+    shardRequests.set(fire.shard, request);
+  }
+  return shardRequests.get(fire.shard);
+};
+
+// Sites published before the shards existed only have fires.json.
+const fetchMonolithicFireData = async () => {
+  const data = await fetchJson(`${dataBase()}/fires.json`, { cache: 'no-cache' });
+  const fires = (data.fires || []).map((fire) => ({ ...fire, fullGeometry: true }));
+  console.log(`Loaded ${fires.length} fires from /data/fires.json (as of ${data.generatedAt})`);
+  return fires;
+};
+
+const fetchLowLodGeometries = async (summary) => {
+  if (!summary.lodBundle) return null;
   try {
-    const base = process.env.PUBLIC_URL || '';
-    const response = await fetch(`${base}/data/fires.json`, { cache: 'no-cache' });
+    const bundle = await fetchJson(`${dataBase()}/${summary.lodBundle}`, { cache: 'force-cache' });
+    return bundle.geometries || {};
+  } catch (error) {
+    console.warn('Failed to load low-LOD fire geometry, loading full shards instead:', error);
+    return null;
+  }
+};
 
+// Fires with a perimeter to draw right away: the low-LOD one when the bundle
+// is published (fullGeometry: false), else every full shard.
+export const fetchRealTimeFireData = async () => {
+  try {
+    const response = await fetch(`${dataBase()}/fires-summary.json`, { cache: 'no-cache' });
+    if (response.status === 404) {
+      return await fetchMonolithicFireData();
+    }
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
     }
 
-    const data = await response.json();
-    const fires = data.fires || [];
-    console.log(`Loaded ${fires.length} fires from /data/fires.json (as of ${data.generatedAt})`);
+    const summary = await response.json();
+    const summaryFires = summary.fires || [];
+    const lod = await fetchLowLodGeometries(summary);
+    let fires;
+    if (lod) {
+      fires = summaryFires.map((fire) => ({ ...fire, geometry: lod[String(fire.id)] || null, fullGeometry: false }));
+    } else {
+      const geometries = await Promise.all(summaryFires.map((fire) => fetchFireGeometry(fire).catch(() => null)));
+      fires = summaryFires.map((fire, i) => ({ ...fire, geometry: geometries[i], fullGeometry: true }));
+    }
+    console.log(`Loaded ${fires.length} fires from /data/fires-summary.json (as of ${summary.generatedAt}, `
+      + `${lod ? 'low-LOD' : 'full'} geometry)`);
     return fires;
   } catch (error) {
     console.error('Failed to load fire data:', error);
@@ -9,7 +9,11 @@ const dataBase = () => `${process.env.PUBLIC_URL || ''}/data/predictions`;
 
 // { generatedAt, fires: [{ name, file, issued_at_utc, valid_from_utc,
 //   valid_to_utc, hours, degraded_history, model, val_precision, val_recall,
-//   model_caveat }] }
+//   model_caveat, summary }] }
+// `summary` (embedded by scripts/generate_data.py) has the forecast numbers
+// without the geometry: predictedAcres24h, growthAcres24h, growthVsWfigs,
+// hourly [{ hour, validAt, acres, newAcres }], reachStopsHour, bbox and
+// per-layer { acres, bbox, centroid }.
 export const fetchPredictionIndex = async () => {
   try {
     const response = await fetch(`${dataBase()}/index.json`, { cache: 'no-cache' });
@@ -7,27 +7,96 @@ the ArcGIS APIs on page load, this script (run by the 30-minute automation)
 fetches and processes the data once and writes ready-to-render files into
 frontend/public/data/. Vercel serves them from its CDN, so the page loads fast.
 
-The processing here mirrors the frontend's fireApiDirect.js / satelliteApiDirect.js
-exactly, so the output is a drop-in replacement for those live API calls.
+The records are built by backend/services/fire_transform.py, the same module
+the Flask API uses, so the static files and the live API cannot drift apart
+(and the backend's snapshot serving mode can serve these files directly).
+
+fire-activity.json holds each fire's `activity` summary of the MODIS/VIIRS
+hotspots inside its perimeter (backend/services/fire_activity.py) and how
+many hotspots fell inside no perimeter - the body /api/fires/activity serves.
+It is kept out of the fire records, which stay identical to the API's in
+every serving mode and only change when the fire does.
+
+Besides the monolithic fires.json (still read by the backend's snapshot
+serving mode), fires are published for the site as:
+
+    fires-summary.json        every record without geometry, plus `bbox` and
+                              `shard`, and `lodBundle`
+    fires/<hash>.json         one fire's full geometry: {"id", "geometry"}
+    fires/<hash>.json         (lodBundle) every perimeter at the coarsest LOD
+                              tolerance: {"tolerance", "geometries": {id: ...}}
+
+Shard names are content hashes, so an unchanged fire keeps its URL (and its
+CDN cache entry) from run to run; shards referenced by neither this run's
+summary nor the previous one are pruned. --no-lod-bundle skips the bundle.
+
+The perimeter-derived data (rounded geometry, center, bbox, LOD levels) is
+kept between runs in backend/cache/perimeters.json.gz, keyed by a hash of the
+raw coordinates (fire_transform's perimeter_cache, which FLAMEFLUX_PERIMETER_CACHE
+can point elsewhere): perimeters unchanged since the last run are not
+re-rounded or re-simplified. It is a local, gitignored cache - not published,
+and safe to delete.
+
+Published fire-spread forecasts (predictions/index.json, written by the
+separate forecast export) get per-fire summaries embedded in the index -
+geodesic acres per layer, hourly reach, growth vs WFIGS acres - so the
+dashboard can list them without downloading any forecast geometry
+(backend/services/prediction_store.py). --predictions-only runs just that
+step, for the forecast export to call after it publishes.
+
+With --tiles it also pre-renders a static Mapbox Vector Tile pyramid
+(frontend/public/tiles/<layer>/<z>/<x>/<y>.pbf) for the fire, hotspot and
+prediction layers, using the same encoder as the API's /tiles endpoint.
 
 Resilience: each source is fetched independently. If a source fails, its
 existing JSON file is left untouched rather than blanked, so a transient API
 hiccup never wipes the site's data.
+
+Each source is fetched page by page (backend/services/arcgis_pager.py), so
+feeds larger than the layer's maxRecordCount come through whole; a page that
+still fails after its retries fails the source instead of truncating it.
 """
 
+import argparse
 import json
 import os
 import sys
 from datetime import datetime
 
-import requests
-
 # ---------------------------------------------------------------------------
 # Paths
 # ---------------------------------------------------------------------------
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(SCRIPT_DIR, "..", "frontend", "public", "data")
 DATA_DIR = os.path.abspath(DATA_DIR)
+BACKEND_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "..", "backend"))
+TILES_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "..", "frontend", "public", "tiles"))
+PREDICTIONS_DIR = os.path.join(DATA_DIR, "predictions")
+PERIMETER_CACHE_FILE = os.path.join(BACKEND_DIR, "cache", "perimeters.json.gz")  # not under DATA_DIR: never deployed
+TILE_MAX_ZOOM = 8
+FIRE_SHARDS_DIR = "fires"  # per-fire geometry shards, under DATA_DIR
+FIRES_SUMMARY_FILE = "fires-summary.json"
+FIRE_ACTIVITY_FILE = "fire-activity.json"
+
+# Share the backend's transforms and helpers instead of copying them here.
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.join(BACKEND_DIR, "services"))
+
+from fire_transform import (  # noqa: E402
+    PERIMETER_CACHE_PATH,
+    cached_bbox,
+    content_hash,
+    perimeter_cache,
+    process_fire_features,
+    process_modis_features,
+    process_viirs_features,
+)
+from utils.profiling import finish_trace, profiled, stage, start_trace  # noqa: E402
+import arcgis_pager  # noqa: E402
+import fire_activity  # noqa: E402
+from geometry_lod import LOD_TOLERANCES, lod_geometry  # noqa: E402
+import prediction_store  # noqa: E402
+import vector_tiles  # noqa: E402
 
 # ---------------------------------------------------------------------------
 # Source APIs
@@ -52,136 +121,34 @@ HEADERS = {
         "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     )
 }
-TIMEOUT = 60
+TIMEOUT = (10, 60)  # (connect, read) per page request
 
 
 # ---------------------------------------------------------------------------
-# Shared helpers (mirror the frontend logic)
+# Output
 # ---------------------------------------------------------------------------
-COORD_PRECISION = 5  # decimal degrees (~1.1 m) — plenty for fire perimeters, keeps files small
-
-
-def round_coords(obj):
-    """Recursively round every number in a nested coordinate array."""
-    if isinstance(obj, (int, float)):
-        return round(obj, COORD_PRECISION)
-    if isinstance(obj, list):
-        return [round_coords(x) for x in obj]
-    return obj
-
-
-def calc_center(coordinates, geom_type):
-    all_coords = []
-    if geom_type == "Polygon":
-        all_coords = coordinates[0]
-    elif geom_type == "MultiPolygon":
-        for polygon in coordinates:
-            all_coords.extend(polygon[0])
-    if not all_coords:
-        return None
-    lng_sum = sum(c[0] for c in all_coords)
-    lat_sum = sum(c[1] for c in all_coords)
-    return [lng_sum / len(all_coords), lat_sum / len(all_coords)]
-
-
-def severity_from_size(area):
-    if area >= 10000:
-        return "High"
-    if area >= 1000:
-        return "Medium"
-    return "Low"
-
-
-def is_alaska_fire(lat, lng):
-    return 51.0 <= lat <= 72.0 and -173.0 <= lng <= -130.0
-
-
-def is_in_usa(lat, lon):
-    return (
-        (24.396308 <= lat <= 49.384358 and -125.0 <= lon <= -66.93457)
-        or (51.2 <= lat <= 71.5 and -179.15 <= lon <= -129.97)
-        or (18.5 <= lat <= 22.5 and -160.5 <= lon <= -154.5)
-    )
-
-
-def get_latest_fires_by_name(features):
-    """Keep only the most recent perimeter per incident, within the last 48h."""
-    fire_map = {}
-    cutoff = datetime.now().timestamp() * 1000 - (48 * 60 * 60 * 1000)
-    for feature in features:
-        props = feature.get("properties", {})
-        name = props.get("poly_IncidentName") or props.get("incident_name")
-        date_ms = props.get("poly_DateCurrent") or 0
-        if not name or date_ms < cutoff:
-            continue
-        existing = fire_map.get(name)
-        if existing is None or date_ms > (existing.get("properties", {}).get("poly_DateCurrent") or 0):
-            fire_map[name] = feature
-    return list(fire_map.values())
-
-
-def write_json(filename, payload):
-    os.makedirs(DATA_DIR, exist_ok=True)
+def write_json(filename, payload, quiet=False):
     path = os.path.join(DATA_DIR, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
     # Write to a temp file then rename, so readers never see a half-written file.
     tmp = path + ".tmp"
     with open(tmp, "w") as fh:
         json.dump(payload, fh, separators=(",", ":"))
     os.replace(tmp, path)
-    print(f"  wrote {filename} ({os.path.getsize(path):,} bytes)")
+    if not quiet:
+        print(f"  wrote {filename} ({os.path.getsize(path):,} bytes)")
 
 
 # ---------------------------------------------------------------------------
 # Fires (WFIGS perimeters)
 # ---------------------------------------------------------------------------
+@profiled()
 def build_fires():
-    resp = requests.get(WFIGS_API, headers=HEADERS, timeout=TIMEOUT)
-    resp.raise_for_status()
-    data = resp.json()
-    if not data or data.get("type") != "FeatureCollection":
-        raise ValueError("Invalid fire data format - expected FeatureCollection")
-
-    features = data.get("features", [])
-    latest = get_latest_fires_by_name(features)
-    fires = []
-    for i, feature in enumerate(latest):
-        geometry = feature.get("geometry") or {}
-        props = feature.get("properties") or {}
-        coords = geometry.get("coordinates")
-        if not coords:
-            continue
-        center = calc_center(coords, geometry.get("type"))
-        if not center:
-            continue
-
-        epoch_ms = props.get("poly_DateCurrent")
-        last_update = datetime.fromtimestamp(epoch_ms / 1000).isoformat() if epoch_ms else None
-
-        area = round(props.get("poly_Acres_AutoCalc") or 0)
-        containment = (
-            props.get("attr_PercentContained")
-            if props.get("attr_PercentContained") is not None
-            else props.get("poly_PercentContained")
-            if props.get("poly_PercentContained") is not None
-            else props.get("percent_contained")
-        )
-
-        fire = {
-            "id": props.get("OBJECTID") or f"fire_{i + 1}",
-            "name": props.get("poly_IncidentName") or f"Fire_{i + 1}",
-            "lat": center[1],
-            "lng": center[0],
-            "size": area,
-            "containment": containment,
-            "severity": severity_from_size(area),
-            "lastUpdate": last_update,
-            "weather": None,
-            "geometry": {"type": geometry.get("type"), "coordinates": round_coords(coords)},
-        }
-        if is_alaska_fire(fire["lat"], fire["lng"]):
-            continue
-        fires.append(fire)
+    # Paged, so perimeters past the layer's maxRecordCount are not dropped
+    with stage("fetch"):
+        features = arcgis_pager.PagedQuery(WFIGS_API, "fires", headers=HEADERS, timeout=TIMEOUT).features()
 
+    fires = process_fire_features(features)
     return {
         "generatedAt": datetime.now().isoformat(),
         "count": len(fires),
@@ -192,83 +159,221 @@ def build_fires():
 # ---------------------------------------------------------------------------
 # Satellite hotspots (MODIS / VIIRS)
 # ---------------------------------------------------------------------------
-def build_modis():
-    resp = requests.get(MODIS_API, headers=HEADERS, timeout=TIMEOUT)
-    resp.raise_for_status()
-    features = resp.json().get("features", [])
+def fetch_hotspots(api_url, name, transform):
+    """Page through a hotspot feed, transforming each page while the next ones download."""
     hotspots = []
-    for val in features:
-        props = val.get("properties", {})
-        lng, lat = val["geometry"]["coordinates"][0], val["geometry"]["coordinates"][1]
-        if not is_in_usa(lat, lng):
-            continue
-        confidence = props.get("CONFIDENCE")
-        if confidence is None or confidence < 80:
-            continue
-        hotspots.append(
-            {
-                "id": val.get("id"),
-                "latitude": lat,
-                "longitude": lng,
-                "age": props.get("HOURS_OLD"),
-                "confidence": confidence,
-                "intensity": props.get("FRP"),
-                "source": "MODIS",
-            }
-        )
-    return {"generatedAt": datetime.now().isoformat(), "count": len(hotspots), "hotspots": hotspots}
+    with stage("fetch_and_process"):
+        for features in arcgis_pager.PagedQuery(api_url, name, headers=HEADERS, timeout=TIMEOUT).pages():
+            hotspots.extend(transform(features))
+    return hotspots
 
 
-# VIIRS reports confidence as a category ("low"/"nominal"/"high") rather than
-# a 0-100 score like MODIS; map it so the heatmap can weight points sensibly
-# instead of treating every VIIRS hotspot as zero-confidence.
-VIIRS_CONFIDENCE_MAP = {"low": 30, "nominal": 70, "high": 90}
+@profiled()
+def build_modis():
+    hotspots = fetch_hotspots(MODIS_API, "modis", process_modis_features)
+    return {"generatedAt": datetime.now().isoformat(), "count": len(hotspots), "hotspots": hotspots}
 
 
+@profiled()
 def build_viirs():
-    resp = requests.get(VIIRS_API, headers=HEADERS, timeout=TIMEOUT)
-    resp.raise_for_status()
-    features = resp.json().get("features", [])
-    hotspots = []
-    for val in features:
-        props = val.get("properties", {})
-        lng, lat = val["geometry"]["coordinates"][0], val["geometry"]["coordinates"][1]
-        if not is_in_usa(lat, lng):
-            continue
-        confidence = VIIRS_CONFIDENCE_MAP.get(str(props.get("confidence")).lower(), 70)
-        hotspots.append(
-            {
-                "id": val.get("id"),
-                "latitude": lat,
-                "longitude": lng,
-                "age": props.get("hours_old"),
-                "confidence": confidence,
-                "intensity": props.get("frp"),
-                "source": "VIIRS",
-            }
-        )
+    hotspots = fetch_hotspots(VIIRS_API, "viirs", process_viirs_features)
     return {"generatedAt": datetime.now().isoformat(), "count": len(hotspots), "hotspots": hotspots}
 
 
+def current_payload(name, payloads):
+    """This run's payload for a source, else the file kept from the last good run."""
+    if payloads.get(name) is not None:
+        return payloads[name]
+    path = os.path.join(DATA_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return json.load(fh)
+
+
+# ---------------------------------------------------------------------------
+# Fire activity (hotspots inside perimeters)
+# ---------------------------------------------------------------------------
+def write_activity(fires_payload, payloads):
+    result = fire_activity.join(
+        fires_payload, current_payload("modis", payloads), current_payload("viirs", payloads)
+    )
+    write_json(FIRE_ACTIVITY_FILE, {
+        "generatedAt": datetime.now().isoformat(),
+        "activity": result["fires"],
+        "matchedHotspots": result["matched"],
+        "unmatchedHotspots": result["unmatched"],
+        "joinMs": result["joinMs"],
+    })
+    print(f"  joined {result['matched']} hotspots to perimeters in {result['joinMs']} ms "
+          f"({result['unmatched']} outside any perimeter)")
+
+
+# ---------------------------------------------------------------------------
+# Sharded fire snapshot (summary + per-fire geometry)
+# ---------------------------------------------------------------------------
+def write_shard(body):
+    """Write a content-addressed shard unless it already exists; returns (name, written)."""
+    name = f"{FIRE_SHARDS_DIR}/{content_hash(body)}.json"
+    if os.path.exists(os.path.join(DATA_DIR, name)):
+        return name, False
+    write_json(name, body, quiet=True)
+    return name, True
+
+
+def shard_names(summary):
+    if not summary:
+        return set()
+    names = {fire.get("shard") for fire in summary.get("fires", [])}
+    names.add(summary.get("lodBundle"))
+    return names - {None}
+
+
+@profiled()
+def write_fire_shards(payload, lod_bundle=True):
+    """fires-summary.json (no geometry) plus content-hashed geometry shards and the low-LOD bundle."""
+    previous = current_payload("fires-summary", {})
+    records, lod = [], {}
+    written = 0
+    for fire in payload["fires"]:
+        geometry = fire.get("geometry")
+        record = {key: value for key, value in fire.items() if key != "geometry"}
+        record["bbox"] = cached_bbox(geometry)
+        record["shard"] = None
+        if geometry:
+            record["shard"], new = write_shard({"id": fire["id"], "geometry": geometry})
+            written += new
+            if lod_bundle:
+                lod[str(fire["id"])] = lod_geometry(payload, fire, 0)
+        records.append(record)
+
+    summary = {key: value for key, value in payload.items() if key != "fires"}
+    summary["lodBundle"] = None
+    if lod:
+        summary["lodBundle"], _ = write_shard({"tolerance": LOD_TOLERANCES[0], "geometries": lod})
+    summary["fires"] = records
+    # Shards first, summary last: a reader never sees a summary pointing at a missing shard
+    write_json(FIRES_SUMMARY_FILE, summary)
+
+    # Keep the previous run's shards too, for clients still holding its summary
+    keep = shard_names(summary) | shard_names(previous)
+    shards_dir = os.path.join(DATA_DIR, FIRE_SHARDS_DIR)
+    pruned = 0
+    for filename in os.listdir(shards_dir):
+        if filename.endswith(".json") and f"{FIRE_SHARDS_DIR}/{filename}" not in keep:
+            os.remove(os.path.join(shards_dir, filename))
+            pruned += 1
+    shards = sum(1 for record in records if record["shard"])
+    print(f"  fire shards: {written} written, {shards - written} unchanged, {pruned} pruned"
+          + (f", low-LOD bundle {summary['lodBundle']}" if summary["lodBundle"] else ""))
+    perimeter_cache.save()  # again, with the LOD levels built above
+
+
+# ---------------------------------------------------------------------------
+# Prediction summaries (embedded in predictions/index.json)
+# ---------------------------------------------------------------------------
+@profiled()
+def summarize_predictions():
+    if not os.path.exists(os.path.join(PREDICTIONS_DIR, "index.json")):
+        print("  no predictions/index.json, skipping")
+        return
+    computed, reused = prediction_store.embed_summaries(PREDICTIONS_DIR)
+    print(f"  predictions: {computed} summarized, {reused} unchanged")
+
+
+# ---------------------------------------------------------------------------
+# Vector tile pyramid
+# ---------------------------------------------------------------------------
+@profiled()
+def build_tiles(payloads, max_zoom):
+    """Render every layer's non-empty tiles up to max_zoom into TILES_DIR."""
+    layers = {
+        "fires": vector_tiles.fire_features,
+        "modis": vector_tiles.hotspot_features,
+        "viirs": vector_tiles.hotspot_features,
+    }
+    for name, features in layers.items():
+        data = current_payload(name, payloads)
+        if data is None:
+            continue
+        with stage(f"tiles_{name}"):
+            layer = vector_tiles.LAYERS[name]
+            layer.sync(data, features(data))
+            written = vector_tiles.render_pyramid(layer, TILES_DIR, max_zoom)
+        print(f"  {name}: {written} tiles")
+
+    if os.path.isdir(PREDICTIONS_DIR):
+        with stage("tiles_predictions"):
+            layer = vector_tiles.LAYERS["predictions"]
+            layer.sync("generate", vector_tiles.prediction_features(PREDICTIONS_DIR))
+            written = vector_tiles.render_pyramid(layer, TILES_DIR, max_zoom)
+        print(f"  predictions: {written} tiles")
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tiles", action="store_true", help="also pre-render the vector tile pyramid")
+    parser.add_argument("--tile-max-zoom", type=int, default=TILE_MAX_ZOOM)
+    parser.add_argument("--no-lod-bundle", dest="lod_bundle", action="store_false",
+                        help="skip the national low-LOD fire geometry bundle")
+    parser.add_argument("--predictions-only", action="store_true",
+                        help="only embed forecast summaries in predictions/index.json")
+    args = parser.parse_args()
+
+    print("Summarizing predictions ...")
+    try:
+        summarize_predictions()
+    except Exception as exc:  # noqa: BLE001 - forecasts are optional
+        print(f"  ERROR summarizing predictions: {exc}", file=sys.stderr)
+        if args.predictions_only:
+            return 1
+    if args.predictions_only:
+        return 0
+
+    perimeter_cache.path = PERIMETER_CACHE_PATH or PERIMETER_CACHE_FILE
+
+    # Hotspots first, so the fire records can be joined against them
     sources = [
-        ("fires", "fires.json", build_fires, "fires"),
         ("MODIS", "modis.json", build_modis, "hotspots"),
         ("VIIRS", "viirs.json", build_viirs, "hotspots"),
+        ("fires", "fires.json", build_fires, "fires"),
     ]
+    payloads = {}
     failures = 0
     for label, filename, builder, key in sources:
         try:
             print(f"Fetching {label} ...")
+            start_trace(f"generate_{label.lower()}")
             payload = builder()
-            write_json(filename, payload)
+            with stage("write_json"):
+                write_json(filename, payload)
+            if label == "fires":
+                with stage("fire_shards"):
+                    write_fire_shards(payload, lod_bundle=args.lod_bundle)
+                with stage("fire_activity"):
+                    write_activity(payload, payloads)
+            payloads[label.lower()] = payload
             print(f"  {label}: {payload['count']} {key}")
         except Exception as exc:  # noqa: BLE001 - keep going, leave old file in place
             failures += 1
             print(f"  ERROR fetching {label}: {exc} (keeping previous {filename})", file=sys.stderr)
+        finally:
+            trace = finish_trace()
+            if trace:
+                print(f"  profiled {label}: {trace['wallMs']} ms -> {', '.join(trace['files'])}")
+
+    if args.tiles:
+        print(f"Rendering vector tiles (z0-{args.tile_max_zoom}) ...")
+        start_trace("generate_tiles")
+        try:
+            build_tiles(payloads, args.tile_max_zoom)
+        finally:
+            trace = finish_trace()
+            if trace:
+                print(f"  profiled tiles: {trace['wallMs']} ms -> {', '.join(trace['files'])}")
 
     # Non-zero exit only if everything failed, so the pipeline can still push
     # partial updates but a total outage is visible in the logs.